@@ -1,81 +1,289 @@
-from flask import Flask, request, jsonify, send_file
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from flask import (Blueprint, Flask, abort, current_app, has_app_context, redirect, request, jsonify,
+                   send_from_directory, stream_with_context)
+from flask.cli import with_appcontext
+from flask_login import (LoginManager, login_url, login_user, logout_user, login_required,
+                         current_user)
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from sqlalchemy import event, func, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
+from functools import wraps
+import base64
+import gzip
+import json
+import logging
 import os
+import tempfile
+import click
 from dotenv import load_dotenv
 
+import auth
+import batch
+import cache
+import change_log
+import database
+import departments
+import events
+import exporters
+import jobs
+import metrics
+import migrations
+import phone_index
+import search_index
+import snapshots
+import suggest
+from models import db, User, ApiToken, Employee, ImportJob
+
 # Загрузка переменных окружения
 load_dotenv()
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///handbook.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOADED_PHOTOS_DEST'] = 'uploads/photos'
-
-# Инициализация расширений
-db = SQLAlchemy(app)
-CORS(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'api.login'
+
+bp = Blueprint('api', __name__)
 
 # Настройка загрузки файлов
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-UPLOAD_FOLDER = 'uploads/photos'
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+# Фото с именем-хэшем никогда не меняются, их можно кэшировать на год
+PHOTO_MAX_AGE = 365 * 24 * 3600
+
+# Администратор, создаваемый при первом запуске (пароль - ADMIN_PASSWORD или admin123)
+DEFAULT_ADMIN = 'admin'
+
+# Кэши сериализованных ответов (ключ - версия справочника и параметры запроса)
+# Размер - на процесс: у каждого воркера gunicorn свой кэш. PDF полного справочника
+# весит десятки мегабайт и строится минутами, поэтому он кэшируется на диске,
+# общем для воркеров
+response_cache = cache.ResponseCache(int(os.getenv('RESPONSE_CACHE_SIZE', 256)),
+                                     int(os.getenv('RESPONSE_CACHE_BYTES', 32 * 1024 * 1024)),
+                                     int(os.getenv('RESPONSE_CACHE_MAX_ENTRY_BYTES', 4 * 1024 * 1024)))
+pdf_cache = cache.FileCache(os.getenv('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'handbook-pdf')),
+                            int(os.getenv('PDF_CACHE_BYTES', 256 * 1024 * 1024)))
+# Пользователи сессий и владельцы токенов
+auth_cache = auth.PrincipalCache(int(os.getenv('AUTH_CACHE_TTL', auth.DEFAULT_TTL)))
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Модель пользователя (администратора)
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
-    
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-    
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-# Модель сотрудника
-class Employee(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    department = db.Column(db.String(100), nullable=False)
-    full_name = db.Column(db.String(200), nullable=False)
-    position = db.Column(db.String(200), nullable=False)
-    internal_phone = db.Column(db.String(20))
-    common_phone = db.Column(db.String(20))
-    city_phone = db.Column(db.String(20))
-    email = db.Column(db.String(100))
-    photo = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+@event.listens_for(db.session, 'after_commit')
+def wake_event_broker(session):
+    # После любого commit в процессе подписчики получают изменения без ожидания опроса
+    if has_app_context() and 'event_broker' in current_app.extensions:
+        current_app.extensions['event_broker'].wake()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
-
-# Создание таблиц и администратора по умолчанию - ПЕРЕД запуском приложения
-with app.app_context():
-    db.create_all()
-    # Создание администратора по умолчанию
-    if not User.query.filter_by(username='admin').first():
-        admin = User(username='admin')
-        admin.set_password('admin123')
-        db.session.add(admin)
+    user_id = int(user_id)
+    return auth_cache.get_or_load(('user', user_id),
+                                  lambda: auth.load_session_user(db.session, User, user_id))
+
+@login_manager.request_loader
+def load_user_from_token(request):
+    # Сервисные клиенты без cookie: Authorization: Bearer <токен>
+    token = auth.bearer_token(request)
+    if token is None:
+        return None
+    token_hash = auth.hash_token(token)
+    # Счетчик отзывов в ключе: после отзыва в любом процессе старые записи не используются
+    principal = auth_cache.get_or_load(
+        ('token', token_hash, auth.revocation_count(db.session)),
+        lambda: auth.load_token_user(db.session, ApiToken, User, token_hash),
+        keep_none=False
+    )
+    # Срок проверяется и для записи из кэша
+    if principal and principal.expires_at and principal.expires_at <= datetime.utcnow():
+        return None
+    return principal
+
+@login_manager.unauthorized_handler
+def unauthorized():
+    # Скрипту с неверным или отозванным токеном - 401, а не перенаправление на вход
+    if auth.bearer_token(request):
+        return jsonify({'error': 'Недействительный токен API'}), 401
+    return redirect(login_url(login_manager.login_view, request.url))
+
+def create_app(config=None):
+    """Создает и настраивает приложение. Схему базы не трогает - для этого есть init_db()."""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///handbook.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOADED_PHOTOS_DEST'] = os.getenv('PHOTOS_DIR', 'uploads/photos')
+    app.config['IMPORT_CHUNK_SIZE'] = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))
+    app.config['IMPORT_MAX_WORKERS'] = int(os.getenv('IMPORT_MAX_WORKERS', 2))
+    app.config['IMPORT_MAX_QUEUED'] = int(os.getenv('IMPORT_MAX_QUEUED', 10))
+    # Процессов декодирования при загрузке архива фото (0 - по числу ядер)
+    app.config['PHOTO_IMPORT_WORKERS'] = int(os.getenv('PHOTO_IMPORT_WORKERS', 0))
+    app.config['EVENTS_MAX_SUBSCRIBERS'] = int(os.getenv('EVENTS_MAX_SUBSCRIBERS', 1000))
+    # Каталог статических снимков справочника, который раздает nginx
+    app.config['SNAPSHOT_DIR'] = os.getenv('SNAPSHOT_DIR', 'snapshots')
+    if config:
+        app.config.update(config)
+    app.config.setdefault(
+        'SQLALCHEMY_ENGINE_OPTIONS',
+        database.engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    )
+    
+    # Инициализация расширений
+    db.init_app(app)
+    CORS(app, expose_headers=['X-Total-Count', 'X-Next-Cursor', 'X-Change-Seq'])
+    login_manager.init_app(app)
+    
+    with app.app_context():
+        database.configure_engine(db.engine)
+        # Время, размер ответа и SQL по каждому запросу для /api/metrics
+        metrics.init_app(app, db.engine)
+        # Полнотекстовый индекс для поиска сотрудников (если база его поддерживает)
+        app.config.setdefault('FTS_ENABLED', search_index.is_supported(db.engine))
+        # Таблица нормализованных номеров для поиска по телефону и определения звонящего
+        app.config.setdefault('PHONE_INDEX_ENABLED', phone_index.is_supported(db.engine))
+        # Журнал изменений для /api/employees/changes
+        app.config.setdefault('CHANGE_LOG_ENABLED', change_log.is_supported(db.engine))
+        app.config.setdefault('DEPARTMENTS_ENABLED', departments.is_supported(db.engine))
+    
+    # Пул фоновых задач импорта: не больше IMPORT_MAX_WORKERS одновременно в процессе
+    app.extensions['import_runner'] = jobs.ImportJobRunner(
+        app, db, ImportJob, Employee,
+        max_workers=app.config['IMPORT_MAX_WORKERS'],
+        max_queued=app.config['IMPORT_MAX_QUEUED'],
+        photos_folder=photos_folder,
+        photo_workers=app.config['PHOTO_IMPORT_WORKERS'] or None
+    )
+    
+    # Рассылка изменений подписчикам /api/events
+    with app.app_context():
+        app.extensions['event_broker'] = events.EventBroker(
+            db.engine, max_subscribers=app.config['EVENTS_MAX_SUBSCRIBERS']
+        )
+    # Индекс подсказок строится при первом обращении или в warm_up
+    app.extensions['suggest_index'] = suggest.SuggestIndex(app.config['CHANGE_LOG_ENABLED'])
+    
+    app.register_blueprint(bp)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(create_admin_command)
+    app.cli.add_command(create_token_command)
+    app.cli.add_command(publish_snapshots_command)
+    return app
+
+def migration_context(app):
+    return migrations.Context(
+        fts=app.config['FTS_ENABLED'],
+        phone_index=app.config['PHONE_INDEX_ENABLED'],
+        change_log=app.config['CHANGE_LOG_ENABLED'],
+        departments=app.config['DEPARTMENTS_ENABLED'],
+    )
+
+def init_db(app):
+    """
+    Приводит схему к последней версии (см. migrations.py). Идемпотентна и не
+    трогает пользователей. Возвращает список примененных миграций.
+    """
+    with app.app_context():
+        return migrations.upgrade(db.engine, migration_context(app))
+
+def create_admin(app, username=DEFAULT_ADMIN, password=None, replace=False):
+    """
+    Создает администратора, если его еще нет (с replace=True - меняет пароль).
+    Возвращает True, если что-то было записано. Хэширование пароля дорогое,
+    поэтому выполняется только при реальной записи.
+    """
+    with app.app_context():
+        user = User.query.filter_by(username=username).first()
+        if user and not replace:
+            return False
+        if user is None:
+            user = User(username=username)
+            db.session.add(user)
+        user.set_password(password or os.getenv('ADMIN_PASSWORD', 'admin123'))
         db.session.commit()
+        return True
+
+def warm_up(app):
+    """Заполняет кэши процесса до первого запроса (индекс подсказок)."""
+    with app.app_context():
+        app.extensions['suggest_index'].refresh(db.session)
+        db.session.remove()
+
+def bootstrap(app):
+    """Подготовка к запуску сервера: схема, администратор по умолчанию, прерванные импорты."""
+    init_db(app)
+    create_admin(app)
+    with app.app_context():
+        app.extensions['import_runner'].recover()
+
+# Команды CLI: flask --app app init-db / create-admin
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Создает схему базы и администратора по умолчанию."""
+    init_db(current_app)
+    if create_admin(current_app):
+        click.echo(f'Создан администратор {DEFAULT_ADMIN}')
+    click.echo('База данных готова')
+
+@click.command('upgrade-db')
+@with_appcontext
+@click.option('--status', is_flag=True, help='Показать версию схемы и ожидающие миграции, ничего не меняя')
+def upgrade_db_command(status):
+    """Применяет недостающие миграции схемы."""
+    if status:
+        with db.engine.begin() as connection:
+            applied = migrations.applied_versions(connection)
+        for step in migrations.MIGRATIONS:
+            row = applied.get(step.version)
+            state = f'применена {row.applied_at}' if row else 'ожидает'
+            click.echo(f'{step.version:4d} {step.name:30s} {state}')
+        return
+    done = init_db(current_app)
+    for step in done:
+        click.echo(f'Применена миграция {step.version}: {step.name}')
+    with db.engine.connect() as connection:
+        click.echo(f'Версия схемы: {migrations.current_version(connection)}')
+
+@click.command('create-admin')
+@with_appcontext
+@click.argument('username', default=DEFAULT_ADMIN)
+@click.password_option()
+def create_admin_command(username, password):
+    """Создает администратора или меняет его пароль."""
+    create_admin(current_app, username, password, replace=True)
+    click.echo(f'Администратор {username} сохранен')
+
+@click.command('create-token')
+@with_appcontext
+@click.argument('name')
+@click.option('--user', 'username', default=DEFAULT_ADMIN, help='Владелец токена')
+@click.option('--days', type=click.IntRange(min=1), help='Срок действия в днях (без срока по умолчанию)')
+def create_token_command(name, username, days):
+    """Выпускает токен API для скрипта или сервиса и печатает его."""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'Пользователь {username} не найден')
+    _, token = auth.issue_token(db.session, ApiToken, user.id, name, days)
+    click.echo(token)
+
+@click.command('publish-snapshots')
+@with_appcontext
+@click.option('--watch', is_flag=True, help='Публиковать после каждого изменения, не завершаясь')
+def publish_snapshots_command(watch):
+    """Пишет статический снимок справочника в SNAPSHOT_DIR."""
+    directory = current_app.config['SNAPSHOT_DIR']
+    options = dict(use_change_log=current_app.config['CHANGE_LOG_ENABLED'])
+    if watch:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+        click.echo(f'Публикация снимков в {directory}')
+        snapshots.SnapshotPublisher(db.engine, directory, **options).run()
+        return
+    manifest = snapshots.publish(db.engine, directory, **options)
+    click.echo(f'Снимок v{manifest["version"]}: {manifest["employee_count"]} сотрудников')
 
 # API endpoints
 
 # Аутентификация
-@app.route('/api/login', methods=['POST'])
+@bp.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     user = User.query.filter_by(username=data.get('username')).first()
@@ -86,58 +294,342 @@ def login():
     
     return jsonify({'error': 'Неверные учетные данные'}), 401
 
-@app.route('/api/logout', methods=['POST'])
+@bp.route('/api/logout', methods=['POST'])
 @login_required
 def logout():
     logout_user()
     return jsonify({'message': 'Успешный выход'})
 
-@app.route('/api/check_auth', methods=['GET'])
+@bp.route('/api/check_auth', methods=['GET'])
 def check_auth():
     return jsonify({'authenticated': current_user.is_authenticated})
 
+# Токены API: выпуск, список и отзыв (токены текущего пользователя)
+@bp.route('/api/tokens', methods=['GET'])
+@login_required
+def list_tokens():
+    tokens = ApiToken.query.filter_by(user_id=current_user.id).order_by(ApiToken.id).all()
+    return jsonify([token.to_dict() for token in tokens])
+
+@bp.route('/api/tokens', methods=['POST'])
+@login_required
+def create_token():
+    data = request.get_json(silent=True) or {}
+    name = str(data.get('name') or '').strip()
+    if not name or len(name) > 100:
+        return jsonify({'error': 'Укажите название токена (до 100 символов)'}), 400
+    days = data.get('expires_in_days')
+    if days is not None and (not isinstance(days, int) or isinstance(days, bool) or days < 1):
+        return jsonify({'error': 'expires_in_days должен быть целым числом больше 0'}), 400
+    record, token = auth.issue_token(db.session, ApiToken, current_user.id, name, days)
+    # Токен показывается только в этом ответе
+    return jsonify({**record.to_dict(), 'token': token}), 201
+
+@bp.route('/api/tokens/<int:token_id>', methods=['DELETE'])
+@login_required
+def revoke_token(token_id):
+    token = db.get_or_404(ApiToken, token_id)
+    if token.user_id != current_user.id:
+        abort(404)
+    if token.revoked_at is None:
+        token.revoked_at = datetime.utcnow()
+        auth.bump_revocations(db.session)
+        db.session.commit()
+    return jsonify(token.to_dict())
+
 # CRUD для сотрудников
-@app.route('/api/employees', methods=['GET'])
+def filter_employees(query, search, department):
+    """Применяет поиск и фильтр по отделу. Возвращает запрос и колонку ранга (или None)."""
+    rank = None
+    
+    if search:
+        match = search_index.build_match_query(search) if current_app.config.get('FTS_ENABLED') else None
+        if current_app.config.get('PHONE_INDEX_ENABLED') and phone_index.is_phone_like(search):
+            # Номер в любом формате: начало или окончание цифр через индекс телефонов,
+            # части номера с разделителями ("276-89") - через полнотекстовый индекс
+            ids = select(phone_index.search_subquery(search).c.id)
+            if match:
+                ids = ids.union(select(search_index.match_subquery(search).c.id))
+            query = query.filter(Employee.id.in_(ids))
+        elif match:
+            # Поиск по индексу FTS5 с ранжированием по релевантности
+            matches = search_index.match_subquery(search)
+            query = query.join(matches, matches.c.id == Employee.id)
+            rank = matches.c.rank
+        else:
+            query = query.filter(
+                Employee.full_name.ilike(f'%{search}%') |
+                Employee.department.ilike(f'%{search}%') |
+                Employee.internal_phone.ilike(f'%{search}%') |
+                Employee.position.ilike(f'%{search}%') |
+                Employee.common_phone.ilike(f'%{search}%') |
+                Employee.city_phone.ilike(f'%{search}%') |
+                Employee.email.ilike(f'%{search}%')
+            )
+    
+    if department:
+        query = query.filter(Employee.department == department)
+    
+    return query, rank
+
+# Поля сотрудника, доступные через API, и колонки, по которым разрешена сортировка
+EMPLOYEE_FIELDS = ('id', 'department', 'full_name', 'position', 'internal_phone',
+                   'common_phone', 'city_phone', 'email', 'photo', 'created_at')
+SORTABLE_FIELDS = ('id', 'department', 'full_name', 'position', 'internal_phone',
+                   'common_phone', 'city_phone', 'email')
+MAX_PAGE_SIZE = 500
+# Строк в одном запросе при потоковой выгрузке
+EXPORT_BATCH_SIZE = 1000
+# Размер страницы журнала изменений
+CHANGES_PAGE_SIZE = 1000
+MAX_CHANGES_PAGE_SIZE = 5000
+
+# Заголовки, которые сохраняются в кэше вместе с телом ответа
+CACHED_HEADERS = ('X-Total-Count', 'X-Next-Cursor', 'X-Change-Seq', 'Content-Disposition')
+# Сжатие ответов: меньшие ответы не сжимаются, PDF и изображения сжимаются плохо
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/csv', 'text/plain')
+# Форматы списка сотрудников: объекты или columnar - имена колонок один раз и массивы значений
+LIST_FORMATS = ('objects', 'columnar')
+DATETIME_FIELDS = ('created_at',)
+
+def accepts_gzip():
+    return request.accept_encodings.quality('gzip') > 0
+
+def compress_cached(cached):
+    """Сжатый вариант закэшированного ответа (или он же, если сжимать не стоит)."""
+    body, mimetype, headers = cached
+    if mimetype not in COMPRESSIBLE_MIMETYPES or len(body) < GZIP_MIN_BYTES:
+        return cached
+    # mtime=0: одинаковые данные дают одинаковые байты
+    return gzip.compress(body, GZIP_LEVEL, mtime=0), mimetype, headers + [('Content-Encoding', 'gzip')]
+
+def cached_response(store):
+    """
+    Кэширует ответ по версии справочника и параметрам запроса, отвечает 304 по If-None-Match.
+    Клиентам с Accept-Encoding: gzip отдается сжатый вариант; он сжимается один раз
+    и кэшируется рядом с несжатым.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = cache.current_version(db.session)
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            encoding = 'gzip' if accepts_gzip() else None
+            # У сжатого варианта свой ETag: это другое представление ответа
+            etag = cache.make_etag(version, key) + ('-gzip' if encoding else '')
+            
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                cached = store.get((version, key, encoding))
+                if cached is None:
+                    cached = store.get((version, key, None))
+                    if cached is None:
+                        response = current_app.make_response(view(*args, **kwargs))
+                        if response.status_code != 200:
+                            return response
+                        headers = [(name, value) for name, value in response.headers
+                                   if name in CACHED_HEADERS]
+                        cached = (response.get_data(), response.mimetype, headers)
+                        store.put((version, key, None), cached, len(cached[0]))
+                    if encoding:
+                        compressed = compress_cached(cached)
+                        # Несжимаемый ответ (PDF) второй раз не сохраняется
+                        if compressed is not cached:
+                            cached = compressed
+                            store.put((version, key, encoding), cached, len(cached[0]))
+                body, mimetype, headers = cached
+                response = current_app.response_class(body, mimetype=mimetype, headers=headers)
+            
+            response.set_etag(etag)
+            response.vary.add('Accept-Encoding')
+            # Браузер хранит ответ, но каждый раз сверяет ETag с сервером
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def encode_cursor(value, last_id):
+    raw = json.dumps([value, last_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor, value_types):
+    """Ключ сортировки и id из курсора; ключ должен быть скаляром типа value_types."""
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Некорректный курсор')
+    # bool в JSON - тоже int для isinstance, а списки и словари не привязываются к запросу
+    for item, types in ((value, value_types), (last_id, int)):
+        if isinstance(item, bool) or not isinstance(item, types):
+            raise ValueError('Некорректный курсор')
+    return value, last_id
+
+def int_arg(name, default=None):
+    """Целый параметр запроса; ValueError, если он задан не числом."""
+    value = request.args.get(name, '')
+    if value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f'Параметр {name} должен быть целым числом')
+
+def sort_expression(field):
+    column = getattr(Employee, field)
+    # NULL в ключе сортировки ломает сравнение курсора, поэтому приводим к пустой строке
+    return func.coalesce(column, '') if column.nullable else column
+
+def requested_fields():
+    """Поля из параметра fields (id возвращается всегда); ValueError для неизвестных."""
+    if not request.args.get('fields'):
+        return EMPLOYEE_FIELDS
+    requested = [f.strip() for f in request.args['fields'].split(',') if f.strip()]
+    unknown = [f for f in requested if f not in EMPLOYEE_FIELDS]
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(unknown)}')
+    return ['id'] + [f for f in requested if f != 'id']
+
+def serialize_employee(row, fields):
+    item = {}
+    for field in fields:
+        value = getattr(row, field)
+        item[field] = value.isoformat() if isinstance(value, datetime) else value
+    return item
+
+def row_values(rows, fields):
+    """Значения первых len(fields) колонок строк списками; даты - строками ISO."""
+    count = len(fields)
+    values = [list(row[:count]) for row in rows]
+    for position in [i for i, field in enumerate(fields) if field in DATETIME_FIELDS]:
+        for item in values:
+            if item[position] is not None:
+                item[position] = item[position].isoformat()
+    return values
+
+def json_response(payload):
+    # Без сортировки ключей и экранирования кириллицы: быстрее и короче, чем jsonify
+    return current_app.response_class(
+        json.dumps(payload, ensure_ascii=False, separators=(',', ':')), mimetype='application/json'
+    )
+
+@bp.route('/api/employees', methods=['GET'])
+@cached_response(response_cache)
 def get_employees():
     search = request.args.get('search', '')
     department = request.args.get('department', '')
     
-    query = Employee.query
+    # Проекция полей: id возвращается всегда
+    try:
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    output = request.args.get('format', 'objects')
+    if output not in LIST_FORMATS:
+        return jsonify({'error': f'Неизвестный формат: {output}'}), 400
     
-    if search:
-        query = query.filter(
-            Employee.full_name.ilike(f'%{search}%') |
-            Employee.department.ilike(f'%{search}%') |
-            Employee.internal_phone.ilike(f'%{search}%') |
-            Employee.position.ilike(f'%{search}%') |
-            Employee.common_phone.ilike(f'%{search}%') |
-            Employee.city_phone.ilike(f'%{search}%') |
-            Employee.email.ilike(f'%{search}%')
-        )
+    # Core select только нужных колонок: строки - кортежи, без объектов ORM
+    query, rank = filter_employees(
+        select(*(getattr(Employee, f) for f in fields)), search, department
+    )
     
-    if department:
-        query = query.filter(Employee.department == department)
+    # Сортировка: по умолчанию по релевантности при поиске, иначе по id
+    sort = request.args.get('sort') or ('relevance' if rank is not None else 'id')
+    if sort == 'relevance' and rank is not None:
+        sort_key, key_types = rank, (int, float)
+    elif sort in SORTABLE_FIELDS:
+        sort_key, key_types = sort_expression(sort), int if sort == 'id' else str
+    else:
+        return jsonify({'error': f'Сортировка по полю {sort} не поддерживается'}), 400
+    order = request.args.get('order') or 'asc'
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': f'Неизвестный порядок сортировки: {order}'}), 400
+    descending = order == 'desc'
+    try:
+        limit = int_arg('limit')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    total = db.session.execute(
+        select(func.count()).select_from(query.order_by(None).subquery())
+    ).scalar_one()
+    
+    # Keyset-пагинация: курсор хранит ключ сортировки и id последней строки
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            value, last_id = decode_cursor(cursor, key_types)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        position = tuple_(sort_key, Employee.id)
+        query = query.filter(position < tuple_(value, last_id) if descending
+                             else position > tuple_(value, last_id))
+    
+    if descending:
+        query = query.order_by(sort_key.desc(), Employee.id.desc())
+    else:
+        query = query.order_by(sort_key, Employee.id)
     
-    employees = query.all()
-    
-    result = []
-    for emp in employees:
-        result.append({
-            'id': emp.id,
-            'department': emp.department,
-            'full_name': emp.full_name,
-            'position': emp.position,
-            'internal_phone': emp.internal_phone,
-            'common_phone': emp.common_phone,
-            'city_phone': emp.city_phone,
-            'email': emp.email,
-            'photo': emp.photo,
-            'created_at': emp.created_at.isoformat()
-        })
-    
-    return jsonify(result)
-
-@app.route('/api/employees', methods=['POST'])
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        # Берем на одну строку больше, чтобы понять, есть ли следующая страница
+        query = query.add_columns(sort_key.label('_sort_key')).limit(limit + 1)
+    
+    # Через соединение, а не сессию: результат Core, без загрузчика ORM
+    rows = db.session.connection().execute(query).all()
+    
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]._sort_key, rows[-1].id)
+    
+    values = row_values(rows, fields)
+    if output == 'columnar':
+        response = json_response({'columns': list(fields), 'rows': values})
+    else:
+        response = json_response([dict(zip(fields, item)) for item in values])
+    response.headers['X-Total-Count'] = str(total)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if current_app.config.get('CHANGE_LOG_ENABLED'):
+        # С этого номера клиент запрашивает изменения в /api/employees/changes
+        response.headers['X-Change-Seq'] = str(change_log.current_seq(db.session))
+    return response
+
+@bp.route('/api/employees/changes', methods=['GET'])
+@cached_response(response_cache)
+def get_employee_changes():
+    """Изменения после since: измененные сотрудники целиком, удаленные - только id."""
+    if not current_app.config.get('CHANGE_LOG_ENABLED'):
+        return jsonify({'error': 'Журнал изменений недоступен для этой базы данных'}), 501
+    try:
+        since = int_arg('since', 0)
+        limit = max(1, min(int_arg('limit', CHANGES_PAGE_SIZE), MAX_CHANGES_PAGE_SIZE))
+        fields = requested_fields()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if since < 0:
+        return jsonify({'error': 'Параметр since не может быть отрицательным'}), 400
+    
+    rows = change_log.changes_since(db.session, Employee, since, fields, limit + 1)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = [{
+        'seq': row.seq,
+        'op': row.op,
+        'id': row.employee_id,
+        'employee': serialize_employee(row, fields) if row.op != 'delete' else None,
+    } for row in rows]
+    return jsonify({
+        'since': since,
+        'last_seq': rows[-1].seq if rows else since,
+        'has_more': has_more,
+        'changes': changes,
+    })
+
+@bp.route('/api/employees', methods=['POST'])
 @login_required
 def create_employee():
     data = request.get_json()
@@ -153,11 +645,30 @@ def create_employee():
     )
     
     db.session.add(employee)
+    cache.bump_version(db.session)
     db.session.commit()
     
     return jsonify({'message': 'Сотрудник создан', 'id': employee.id}), 201
 
-@app.route('/api/employees/<int:id>', methods=['PUT'])
+# Пакет операций create/update/delete в одной транзакции
+@bp.route('/api/employees/batch', methods=['POST'])
+@login_required
+def batch_employees():
+    data = request.get_json(silent=True) or {}
+    try:
+        results = batch.apply(db.session, Employee, data.get('operations'))
+    except batch.BatchError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e), 'errors': e.errors}), 400
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Пакет не применен: нарушены ограничения базы данных'}), 409
+    
+    counts = {status: sum(1 for item in results if item['status'] == status)
+              for status in ('created', 'updated', 'deleted')}
+    return jsonify({'message': 'Пакет применен', **counts, 'results': results})
+
+@bp.route('/api/employees/<int:id>', methods=['PUT'])
 @login_required
 def update_employee(id):
     employee = Employee.query.get_or_404(id)
@@ -172,21 +683,23 @@ def update_employee(id):
     employee.email = data.get('email', employee.email)
     employee.updated_at = datetime.utcnow()
     
+    cache.bump_version(db.session)
     db.session.commit()
     
     return jsonify({'message': 'Сотрудник обновлен'})
 
-@app.route('/api/employees/<int:id>', methods=['DELETE'])
+@bp.route('/api/employees/<int:id>', methods=['DELETE'])
 @login_required
 def delete_employee(id):
     employee = Employee.query.get_or_404(id)
     db.session.delete(employee)
+    cache.bump_version(db.session)
     db.session.commit()
     
     return jsonify({'message': 'Сотрудник удален'})
 
 # Загрузка фото
-@app.route('/api/upload_photo/<int:employee_id>', methods=['POST'])
+@bp.route('/api/upload_photo/<int:employee_id>', methods=['POST'])
 @login_required
 def upload_photo(employee_id):
     employee = Employee.query.get_or_404(employee_id)
@@ -199,28 +712,145 @@ def upload_photo(employee_id):
         return jsonify({'error': 'Файл не выбран'}), 400
     
     if file and allowed_file(file.filename):
-        # Создаем папку для загрузок, если её нет
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+        import photos
         
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(filepath)
+        try:
+            digest, variants = photos.process_image(file.read(photos.MAX_BYTES + 1))
+        except photos.InvalidImage as e:
+            return jsonify({'error': str(e)}), 400
+        photos.store(photos_folder(), digest, variants)
         
-        employee.photo = filename
+        employee.photo = digest
+        cache.bump_version(db.session)
         db.session.commit()
         
-        return jsonify({'message': 'Фото загружено', 'filename': filename})
+        return jsonify({'message': 'Фото загружено', 'filename': digest})
     
     return jsonify({'error': 'Неподдерживаемый формат файла'}), 400
 
+def photos_folder():
+    return os.path.join(current_app.root_path, current_app.config['UPLOADED_PHOTOS_DEST'])
+
+# Отдача фото: /api/uploads/photos/<хэш>?size=64 возвращает миниатюру нужного размера
+@bp.route('/api/uploads/photos/<name>', methods=['GET'])
+def get_photo(name):
+    import photos
+    
+    if photos.is_digest(name):
+        size = photos.pick_size(request.args.get('size', type=int))
+        filename = photos.variant_name(name, size)
+        # Содержимое файла определяется его именем, поэтому имя и служит ETag
+        response = send_from_directory(photos_folder(), filename, max_age=PHOTO_MAX_AGE,
+                                       etag=filename)
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+    
+    # Фото, загруженные до появления миниатюр, хранятся под исходным именем
+    if name != secure_filename(name):
+        abort(404)
+    return send_from_directory(photos_folder(), name, max_age=3600)
+
+@bp.route('/api/events', methods=['GET'])
+def stream_events():
+    """Поток Server-Sent Events с уведомлениями об изменениях сотрудников."""
+    if not current_app.config.get('CHANGE_LOG_ENABLED'):
+        return jsonify({'error': 'Уведомления недоступны для этой базы данных'}), 501
+    broker = current_app.extensions['event_broker']
+    try:
+        # Подписка до чтения журнала: события между чтением и подпиской не теряются
+        subscriber = broker.subscribe()
+    except events.TooManySubscribers as e:
+        return jsonify({'error': str(e)}), 503
+    
+    # Браузер при переподключении сам присылает Last-Event-ID
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        if last_event_id:
+            last_seq = int(last_event_id)
+            backlog = change_log.events_since(db.session, last_seq, events.MAX_BACKLOG + 1)
+            if len(backlog) > events.MAX_BACKLOG:
+                backlog = None
+            elif backlog:
+                last_seq = backlog[-1].seq
+        else:
+            backlog = []
+            last_seq = change_log.current_seq(db.session)
+    except ValueError:
+        broker.unsubscribe(subscriber)
+        return jsonify({'error': 'Некорректный Last-Event-ID'}), 400
+    finally:
+        # Соединение с базой не держится, пока открыт поток
+        db.session.remove()
+    if backlog is not None:
+        broker.start(subscriber, last_seq)
+    
+    return current_app.response_class(
+        broker.stream(subscriber, backlog, last_seq),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    # Если задан METRICS_TOKEN, метрики отдаются только с заголовком Authorization: Bearer <токен>
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return jsonify({'error': 'Требуется токен метрик'}), 401
+    return current_app.response_class(metrics.registry.render(),
+                                      mimetype='text/plain; version=0.0.4')
+
+# Подсказки для строки поиска: сотрудники, отделы и должности по началу слов
+@bp.route('/api/suggest', methods=['GET'])
+def suggest_employees():
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', suggest.DEFAULT_LIMIT, type=int), suggest.MAX_LIMIT))
+    if not query:
+        return jsonify({'query': query, 'suggestions': []})
+    index = current_app.extensions['suggest_index']
+    # Догоняет базу по журналу изменений: обычно один запрос без результатов
+    index.refresh(db.session)
+    return jsonify({'query': query, 'suggestions': index.suggest(query, limit)})
+
 # Получение списка отделов
-@app.route('/api/departments', methods=['GET'])
+@bp.route('/api/departments', methods=['GET'])
+@cached_response(response_cache)
 def get_departments():
-    departments = db.session.query(Employee.department).distinct().all()
-    return jsonify([dept[0] for dept in departments if dept[0]])
+    with_counts = request.args.get('with_counts', '0') in ('1', 'true')
+    if current_app.config.get('DEPARTMENTS_ENABLED'):
+        # Из таблицы отделов: размер ответа не зависит от числа сотрудников
+        return jsonify(departments.list_departments(db.session, with_counts))
+    
+    rows = db.session.query(Employee.department, func.count()).group_by(Employee.department) \
+        .order_by(Employee.department).all()
+    if with_counts:
+        return jsonify([{'id': None, 'name': name, 'employee_count': count}
+                        for name, count in rows if name])
+    return jsonify([name for name, _ in rows if name])
+
+# Поля сотрудника в ответе определения звонящего
+LOOKUP_FIELDS = ('id', 'full_name', 'department', 'position', 'internal_phone',
+                 'common_phone', 'city_phone', 'email', 'photo')
+
+@bp.route('/api/lookup/phone/<number>', methods=['GET'])
+def lookup_phone(number):
+    """Кто звонит: точные совпадения номера, затем совпадения по окончанию."""
+    if not current_app.config.get('PHONE_INDEX_ENABLED'):
+        return jsonify({'error': 'Поиск по номеру недоступен для этой базы данных'}), 501
+    digits = phone_index.digits(number)
+    if not digits:
+        return jsonify({'error': 'Номер должен содержать цифры'}), 400
+    try:
+        limit = max(1, min(int_arg('limit', 20), MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Один запрос по индексу с соединением employee, без загрузки ORM-объектов
+    rows = phone_index.lookup(db.session.connection(), digits, LOOKUP_FIELDS, limit=limit)
+    return jsonify({'number': number, 'digits': digits, 'matches': [row._asdict() for row in rows]})
 
 # Импорт из Excel/CSV
-@app.route('/api/import', methods=['POST'])
+@bp.route('/api/import', methods=['POST'])
 @login_required
 def import_data():
     if 'file' not in request.files:
@@ -230,171 +860,130 @@ def import_data():
     if file.filename == '':
         return jsonify({'error': 'Файл не выбран'}), 400
     
+    mode = request.form.get('mode', 'append')
+    key = request.form.get('key', 'name_department')
+    
+    import importer
+    if not file.filename.endswith(('.xlsx', '.csv')):
+        return jsonify({'error': 'Неподдерживаемый формат файла'}), 400
+    if mode not in importer.MODES:
+        return jsonify({'error': f'Неизвестный режим импорта: {mode}'}), 400
+    if key not in importer.UPSERT_KEYS:
+        return jsonify({'error': f'Неизвестный ключ импорта: {key}'}), 400
+    
     try:
-        import pandas as pd
-        
-        if file.filename.endswith('.xlsx'):
-            df = pd.read_excel(file)
-        elif file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
-        else:
-            return jsonify({'error': 'Неподдерживаемый формат файла'}), 400
-        
-        imported_count = 0
-        for _, row in df.iterrows():
-            # Обрабатываем номера телефонов - убираем .0 и преобразуем в строки
-            def clean_phone_number(value):
-                if pd.isna(value):
-                    return ''
-                # Преобразуем в строку и убираем .0
-                phone_str = str(value)
-                if phone_str.endswith('.0'):
-                    phone_str = phone_str[:-2]
-                return phone_str.strip()
-            
-            employee = Employee(
-                department=row.get('Отдел', ''),
-                full_name=row.get('ФИО', ''),
-                position=row.get('Должность', ''),
-                internal_phone=clean_phone_number(row.get('№ вн.', row.get('№ вн', row.get('внутр. №', '')))),
-                common_phone=clean_phone_number(row.get('общ. №', '')),
-                city_phone=clean_phone_number(row.get('городской №', '')),
-                email=row.get('email', '')
-            )
-            db.session.add(employee)
-            imported_count += 1
-        
-        db.session.commit()
-        return jsonify({'message': f'Импортировано {imported_count} записей'})
+        job = current_app.extensions['import_runner'].submit(file, mode, key)
+    except jobs.QueueFull as e:
+        return jsonify({'error': str(e)}), 429
     
-    except Exception as e:
-        return jsonify({'error': f'Ошибка импорта: {str(e)}'}), 500
+    return jsonify({'message': 'Импорт запущен', 'job_id': job.id, 'status': job.status}), 202
+
+# Загрузка архива фото: файлы с именами по id, email или ФИО сотрудника;
+# ход и отчет по файлам - через /api/import/<job_id>
+@bp.route('/api/import/photos', methods=['POST'])
+@login_required
+def import_photos():
+    if 'file' not in request.files:
+        return jsonify({'error': 'Файл не найден'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'Файл не выбран'}), 400
+    if not file.filename.lower().endswith('.zip'):
+        return jsonify({'error': 'Нужен архив .zip'}), 400
+    
+    try:
+        job = current_app.extensions['import_runner'].submit(file, 'photos', '')
+    except jobs.QueueFull as e:
+        return jsonify({'error': str(e)}), 429
+    
+    return jsonify({'message': 'Загрузка фото запущена', 'job_id': job.id, 'status': job.status}), 202
+
+@bp.route('/api/import/<job_id>', methods=['GET'])
+@login_required
+def get_import_job(job_id):
+    job = db.get_or_404(ImportJob, job_id)
+    current_app.extensions['import_runner'].expire_if_stale(job)
+    return jsonify(job.to_dict())
+
+@bp.route('/api/import/<job_id>', methods=['DELETE'])
+@login_required
+def cancel_import_job(job_id):
+    job = db.get_or_404(ImportJob, job_id)
+    current_app.extensions['import_runner'].cancel(job)
+    return jsonify(job.to_dict())
 
 # Экспорт в PDF
-@app.route('/api/export/pdf', methods=['GET'])
+@bp.route('/api/export/pdf', methods=['GET'])
+@cached_response(pdf_cache)
 def export_pdf():
+    search = request.args.get('search', '')
+    department = request.args.get('department', '')
+    
     try:
-        print("Начало экспорта PDF...")
-        
-        # Проверяем доступность reportlab
-        try:
-            from reportlab.lib.pagesizes import A4, landscape
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
-            from reportlab.lib import colors
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            print("ReportLab импортирован успешно")
-        except ImportError as e:
-            print(f"Ошибка импорта ReportLab: {e}")
-            return jsonify({'error': f'ReportLab не установлен: {str(e)}'}), 500
-        
-        import io
-        
-        employees = Employee.query.all()
-        print(f"Найдено сотрудников для экспорта: {len(employees)}")
-        
-        buffer = io.BytesIO()
-        # Используем альбомную ориентацию для лучшего отображения таблицы
-        doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), topMargin=30, bottomMargin=30)
-        elements = []
-        
-        # Регистрируем шрифт для поддержки кириллицы
-        try:
-            # Пробуем использовать стандартные шрифты, поддерживающие кириллицу
-            pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
-            font_name = 'DejaVuSans'
-        except:
-            # Если шрифт не найден, используем стандартный
-            font_name = 'Helvetica'
-            print("Используем стандартный шрифт Helvetica")
-        
-        # Подготовка данных таблицы
-        data = [['Отдел', 'ФИО', 'Должность', 'Внутр. №', 'Общ. №', 'Городской №', 'Email']]
-        
-        for emp in employees:
-            # Преобразуем номера телефонов в строки и убираем лишние символы
-            internal_phone = str(emp.internal_phone) if emp.internal_phone else ''
-            common_phone = str(emp.common_phone) if emp.common_phone else ''
-            city_phone = str(emp.city_phone) if emp.city_phone else ''
-            
-            # Убираем точки и лишние символы из номеров
-            internal_phone = internal_phone.replace('.0', '').strip()
-            common_phone = common_phone.replace('.0', '').strip()
-            city_phone = city_phone.replace('.0', '').strip()
-            
-            data.append([
-                emp.department or '',
-                emp.full_name or '',
-                emp.position or '',
-                internal_phone,
-                common_phone,
-                city_phone,
-                emp.email or ''
-            ])
-        
-        print("Данные подготовлены для таблицы")
-        
-        # Создаем таблицу с оптимизированными размерами колонок
-        table = Table(data, repeatRows=1)
-        
-        # Настраиваем стиль таблицы
-        table_style = TableStyle([
-            # Заголовок таблицы
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('FONTNAME', (0, 0), (-1, 0), font_name),
-            ('FONTSIZE', (0, 0), (-1, 0), 9),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('TOPPADDING', (0, 0), (-1, 0), 8),
-            
-            # Чередование цветов строк для лучшей читаемости
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F8F9FA')]),
-            
-            # Стиль данных
-            ('FONTNAME', (0, 1), (-1, -1), font_name),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            
-            # Границы
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('LINEBELOW', (0, 0), (-1, 0), 1, colors.white),
-            
-            # Отступы
-            ('LEFTPADDING', (0, 0), (-1, -1), 4),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-            ('TOPPADDING', (0, 0), (-1, -1), 3),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
-        ])
-        
-        # Настраиваем ширину колонок для альбомной ориентации
-        col_widths = [120, 150, 120, 60, 70, 70, 120]  # Ширина колонок в пунктах
-        
-        table._argW = col_widths
-        table.setStyle(table_style)
-        
-        elements.append(table)
-        
-        print("Строим PDF документ...")
-        doc.build(elements)
-        
-        buffer.seek(0)
-        print("PDF успешно создан, отправляем файл...")
-        
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name='phone_directory.pdf',
-            mimetype='application/pdf'
-        )
+        import pdf_export
+    except ImportError as e:
+        current_app.logger.error('ReportLab недоступен: %s', e)
+        return jsonify({'error': f'ReportLab не установлен: {str(e)}'}), 500
     
+    try:
+        query, _ = filter_employees(
+            select(Employee.department, Employee.full_name, Employee.position,
+                   Employee.internal_phone, Employee.common_phone,
+                   Employee.city_phone, Employee.email),
+            search, department
+        )
+        # Строки читаются из курсора порциями, а не загружаются целиком
+        rows = db.session.execute(
+            query.order_by(Employee.department, Employee.full_name, Employee.id),
+            execution_options={'yield_per': pdf_export.CHUNK_ROWS}
+        )
+        pdf = pdf_export.render_pdf(rows)
     except Exception as e:
-        print(f"Критическая ошибка при экспорте PDF: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        current_app.logger.exception('Ошибка при экспорте PDF')
         return jsonify({'error': f'Ошибка экспорта: {str(e)}'}), 500
+    
+    current_app.logger.info('PDF экспорт: %d байт (отдел=%r, поиск=%r)', len(pdf), department, search)
+    return current_app.response_class(pdf, mimetype='application/pdf', headers={
+        'Content-Disposition': 'attachment; filename=phone_directory.pdf'
+    })
+
+def iter_export_rows(search, department):
+    """
+    Строки выгрузки по отделу и ФИО порциями по EXPORT_BATCH_SIZE. Каждая порция -
+    отдельный keyset-запрос, после которого соединение возвращается в пул: пока
+    медленный клиент скачивает файл, курсор и транзакция не держатся открытыми.
+    """
+    columns = [Employee.id] + [getattr(Employee, field) for field in exporters.FIELDS]
+    query, _ = filter_employees(select(*columns), search, department)
+    key = (Employee.department, Employee.full_name, Employee.id)
+    last = None
+    while True:
+        batch = query if last is None else query.filter(tuple_(*key) > tuple_(*last))
+        rows = db.session.execute(batch.order_by(*key).limit(EXPORT_BATCH_SIZE)).all()
+        db.session.close()
+        yield from rows
+        if len(rows) < EXPORT_BATCH_SIZE:
+            return
+        last = (rows[-1].department, rows[-1].full_name, rows[-1].id)
+
+# Потоковая выгрузка с теми же фильтрами, что и в /api/employees
+@bp.route('/api/export/<any(csv, xlsx, vcard):fmt>', methods=['GET'])
+def export_stream(fmt):
+    search = request.args.get('search', '')
+    department = request.args.get('department', '')
+    render, mimetype, extension = exporters.FORMATS[fmt]
+    
+    # Фильтры зависят от настроек приложения, поэтому генератор работает в контексте запроса
+    body = stream_with_context(render(iter_export_rows(search, department)))
+    return current_app.response_class(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=phone_directory.{extension}',
+        'X-Accel-Buffering': 'no',
+    })
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # Встроенный сервер Flask - только для разработки, в продакшене см. wsgi.py
+    app = create_app()
+    bootstrap(app)
+    warm_up(app)
+    app.run(debug=os.getenv('DEBUG') == 'True', host='0.0.0.0', port=5000)
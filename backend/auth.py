@@ -0,0 +1,142 @@
+"""
+Токены API для сервисных клиентов и кэш аутентифицированных пользователей.
+
+Скрипты синхронизации передают заголовок "Authorization: Bearer <токен>"
+вместо входа по паролю: проверка пароля намеренно медленная, а токен -
+случайная строка длиной 256 бит, ее достаточно сравнить по SHA-256. В базе
+хранится только хэш токена, сам токен показывается один раз при выпуске.
+
+Пользователь сессии и владелец токена кэшируются в памяти процесса на
+AUTH_CACHE_TTL секунд, поэтому частые запросы не обращаются к базе за
+пользователем. Отзыв токена увеличивает счетчик в базе (таблица auth_state),
+и счетчик входит в ключ кэша токенов: отозванный токен перестает работать
+во всех процессах сразу. Неизвестные токены не кэшируются - перебор
+случайных токенов не вытесняет из кэша настоящие.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask_login import UserMixin
+from sqlalchemy import text
+
+STATE_TABLE = 'auth_state'
+TOKEN_PREFIX = 'hb_'
+TOKEN_BYTES = 32
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 1024
+
+
+def generate_token():
+    """Новый токен; префикс помогает узнать его в логах и конфигурации."""
+    return TOKEN_PREFIX + secrets.token_urlsafe(TOKEN_BYTES)
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def revocation_count(session):
+    return session.execute(text(f'SELECT revocations FROM {STATE_TABLE} WHERE id = 1')).scalar_one()
+
+
+def bump_revocations(session):
+    """Увеличивает счетчик отзывов в текущей транзакции; вызывается при отзыве токена."""
+    session.execute(text(f'UPDATE {STATE_TABLE} SET revocations = revocations + 1 WHERE id = 1'))
+
+
+def bearer_token(request):
+    """Токен из заголовка Authorization: Bearer или None."""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return token.strip()
+
+
+class Principal(UserMixin):
+    """
+    Снимок пользователя для current_user: не привязан к сессии SQLAlchemy,
+    поэтому может жить в кэше между запросами.
+    """
+
+    def __init__(self, user_id, username, token_id=None, expires_at=None):
+        self.id = user_id
+        self.username = username
+        self.token_id = token_id
+        self.expires_at = expires_at
+
+    @classmethod
+    def from_user(cls, user, token=None):
+        if token is None:
+            return cls(user.id, user.username)
+        return cls(user.id, user.username, token.id, token.expires_at)
+
+
+class PrincipalCache:
+    """Потокобезопасный LRU-кэш с временем жизни записей."""
+
+    _MISSING = object()
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, load, keep_none=True):
+        """
+        Значение из кэша или результат load() (загрузка - вне блокировки).
+        keep_none=False - отрицательный ответ (None) не сохраняется.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, self._MISSING)
+            if entry is not self._MISSING and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+        value = load()
+        if value is None and not keep_none:
+            return value
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def load_session_user(session, user_model, user_id):
+    user = session.get(user_model, user_id)
+    return Principal.from_user(user) if user else None
+
+
+def load_token_user(session, token_model, user_model, token_hash):
+    """Владелец действующего (не отозванного и не просроченного) токена или None."""
+    token = session.query(token_model).filter_by(token_hash=token_hash, revoked_at=None).first()
+    if token is None or (token.expires_at and token.expires_at <= datetime.utcnow()):
+        return None
+    user = session.get(user_model, token.user_id)
+    return Principal.from_user(user, token) if user else None
+
+
+def issue_token(session, token_model, user_id, name, expires_in_days=None):
+    """Выпускает токен. Возвращает (запись, токен); токен больше нигде не сохраняется."""
+    token = generate_token()
+    record = token_model(
+        name=name, user_id=user_id, token_hash=hash_token(token),
+        expires_at=datetime.utcnow() + timedelta(days=expires_in_days) if expires_in_days else None,
+    )
+    session.add(record)
+    session.commit()
+    return record, token
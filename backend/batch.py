@@ -0,0 +1,149 @@
+"""
+Пакетное изменение сотрудников одним запросом.
+
+Пакет - список операций create/update/delete. Сначала проверяются все
+операции (поля, обязательные значения, существование id); если хоть одна
+неверна, ничего не применяется и возвращаются ошибки по каждой. Иначе
+операции выполняются массовыми INSERT/UPDATE/DELETE и фиксируются одним
+commit: правка сотни записей стоит один запрос и одну запись на диск.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import delete, insert, select, update
+
+import cache
+
+OPERATIONS = ('create', 'update', 'delete')
+FIELDS = ('department', 'full_name', 'position', 'internal_phone', 'common_phone',
+          'city_phone', 'email')
+REQUIRED_FIELDS = ('department', 'full_name', 'position')
+MAX_OPERATIONS = 1000
+# Ограничение числа параметров в одном IN (...) для SQLite
+ID_CHUNK_SIZE = 500
+
+
+class BatchError(Exception):
+    """Пакет не применен; errors - ошибки по операциям (index, error)."""
+
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _clean_values(model, data, required):
+    """Проверенные значения полей операции; ValueError с описанием ошибки."""
+    if not isinstance(data, dict):
+        raise ValueError('data должен быть объектом')
+    unknown = set(data) - set(FIELDS)
+    if unknown:
+        raise ValueError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+    values = {}
+    for field, value in data.items():
+        if value is not None and not isinstance(value, (str, int)):
+            raise ValueError(f'Поле {field} должно быть строкой')
+        value = str(value).strip() if value is not None else None
+        if field in REQUIRED_FIELDS and not value:
+            raise ValueError(f'Поле {field} не может быть пустым')
+        length = model.__table__.c[field].type.length
+        if value and length and len(value) > length:
+            raise ValueError(f'Поле {field} длиннее {length} символов')
+        # Пустые необязательные поля хранятся как NULL, как и при создании через форму
+        values[field] = value if value or field in REQUIRED_FIELDS else None
+    missing = [field for field in required if field not in values]
+    if missing:
+        raise ValueError(f'Не заполнены обязательные поля: {", ".join(missing)}')
+    return values
+
+
+def validate(session, model, operations):
+    """
+    Разбирает и проверяет операции. Возвращает список (index, op, id, values);
+    при ошибках выбрасывает BatchError.
+    """
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('Ожидается непустой список операций')
+    if len(operations) > MAX_OPERATIONS:
+        raise BatchError(f'Не больше {MAX_OPERATIONS} операций за запрос')
+
+    parsed, errors, seen = [], [], set()
+    for index, item in enumerate(operations):
+        try:
+            if not isinstance(item, dict) or item.get('op') not in OPERATIONS:
+                raise ValueError(f'op должен быть одним из: {", ".join(OPERATIONS)}')
+            op = item['op']
+            employee_id = None
+            if op != 'create':
+                employee_id = item.get('id')
+                if not isinstance(employee_id, int) or isinstance(employee_id, bool):
+                    raise ValueError('Не указан id сотрудника')
+                # Две операции над одним сотрудником в пакете неоднозначны
+                if employee_id in seen:
+                    raise ValueError(f'Сотрудник {employee_id} уже изменяется в этом пакете')
+                seen.add(employee_id)
+            values = {}
+            if op == 'create':
+                values = _clean_values(model, item.get('data'), REQUIRED_FIELDS)
+            elif op == 'update':
+                values = _clean_values(model, item.get('data'), ())
+                if not values:
+                    raise ValueError('Нет полей для изменения')
+            parsed.append((index, op, employee_id, values))
+        except ValueError as e:
+            errors.append({'index': index, 'error': str(e)})
+
+    # Существование всех id проверяется несколькими запросами IN, а не по одному
+    ids = sorted(seen)
+    existing = set()
+    for chunk in _chunks(ids, ID_CHUNK_SIZE):
+        existing.update(session.scalars(select(model.id).where(model.id.in_(chunk))))
+    for index, op, employee_id, _ in parsed:
+        if employee_id is not None and employee_id not in existing:
+            errors.append({'index': index, 'error': f'Сотрудник {employee_id} не найден'})
+
+    if errors:
+        raise BatchError('Пакет не применен: есть ошибки', sorted(errors, key=lambda e: e['index']))
+    return parsed
+
+
+def apply(session, model, operations):
+    """
+    Проверяет и применяет пакет в одной транзакции.
+    Возвращает результаты по операциям в исходном порядке: index, op, id, status.
+    """
+    parsed = validate(session, model, operations)
+    results = [None] * len(parsed)
+    now = datetime.utcnow()
+
+    deletes = [(index, employee_id) for index, op, employee_id, _ in parsed if op == 'delete']
+    for chunk in _chunks([employee_id for _, employee_id in deletes], ID_CHUNK_SIZE):
+        session.execute(delete(model).where(model.id.in_(chunk)))
+    for index, employee_id in deletes:
+        results[index] = {'index': index, 'op': 'delete', 'id': employee_id, 'status': 'deleted'}
+
+    updates = [(index, employee_id, values) for index, op, employee_id, values in parsed if op == 'update']
+    if updates:
+        # UPDATE по первичному ключу: строки с одинаковым набором полей идут одним executemany
+        session.execute(update(model), [{'id': employee_id, **values, 'updated_at': now}
+                                        for _, employee_id, values in updates])
+    for index, employee_id, _ in updates:
+        results[index] = {'index': index, 'op': 'update', 'id': employee_id, 'status': 'updated'}
+
+    creates = [(index, values) for index, op, _, values in parsed if op == 'create']
+    if creates:
+        # Недостающие необязательные поля явно NULL: все строки с одним набором колонок
+        records = [{field: values.get(field) for field in FIELDS} for _, values in creates]
+        ids = session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True), records
+        ).all()
+        for (index, _), employee_id in zip(creates, ids):
+            results[index] = {'index': index, 'op': 'create', 'id': employee_id, 'status': 'created'}
+
+    cache.bump_version(session)
+    session.commit()
+    return results
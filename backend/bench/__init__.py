@@ -0,0 +1,10 @@
+"""
+Нагрузочные замеры справочника.
+
+generate - синтетический справочник нужного размера в формате sample_data.csv,
+run - прогон сценариев через тестовый клиент Flask со сравнением с базовой линией:
+
+    python -m bench.generate 10k -o employees_10k.csv
+    python -m bench.run --size 10k
+    python -m bench.run --size 10k --update-baseline
+"""
@@ -0,0 +1,146 @@
+"""
+Генератор синтетического справочника.
+
+Данные похожи на sample_data.csv: фамилии с инициалами или полные ФИО,
+отделы разного размера, внутренние, общие (одни на отдел) и городские номера
+в нескольких форматах, часть ячеек пустая. При одинаковом seed результат
+повторяется.
+"""
+
+import argparse
+import random
+
+import pandas as pd
+
+SIZES = {'1k': 1_000, '10k': 10_000, '100k': 100_000, '500k': 500_000}
+
+# Заголовки как в sample_data.csv
+COLUMNS = ('Отдел', 'ФИО', 'Должность', '№ вн.', 'общ. №', 'городской №', 'email')
+
+SURNAMES = (
+    'Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Соколов',
+    'Михайлов', 'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов',
+    'Егоров', 'Павлов', 'Козлов', 'Степанов', 'Николаев', 'Орлов', 'Андреев', 'Макаров',
+    'Никитин', 'Захаров', 'Зайцев', 'Соловьев', 'Борисов', 'Яковлев', 'Григорьев', 'Романов',
+    'Воробьев', 'Сергеев', 'Кузьмин', 'Фролов', 'Александров', 'Дмитриев', 'Королев', 'Гусев',
+    'Киселев', 'Ильин', 'Максимов', 'Поляков', 'Сорокин', 'Виноградов', 'Ковалев', 'Белов',
+    'Медведев', 'Антонов', 'Тарасов', 'Жуков', 'Баранов', 'Филиппов', 'Комаров', 'Давыдов',
+    'Беляев', 'Герасимов', 'Богданов', 'Осипов', 'Сидоренко', 'Плюшкин', 'Ткаченко', 'Ершов',
+    'Нуриев', 'Ахметов', 'Сейткали', 'Абдуллаев', 'Ёлкин', 'Щербаков', 'Чернов', 'Шевченко',
+)
+FIRST_NAMES = (
+    ('Александр', 'Александра'), ('Алексей', 'Алена'), ('Андрей', 'Анна'), ('Борис', 'Валентина'),
+    ('Владимир', 'Виктория'), ('Дмитрий', 'Дарья'), ('Евгений', 'Евгения'), ('Иван', 'Ирина'),
+    ('Игорь', 'Ольга'), ('Михаил', 'Мария'), ('Николай', 'Наталья'), ('Павел', 'Полина'),
+    ('Сергей', 'Светлана'), ('Тимур', 'Татьяна'), ('Юрий', 'Юлия'), ('Артём', 'Алёна'),
+)
+PATRONYMICS = (
+    ('Александрович', 'Александровна'), ('Сергеевич', 'Сергеевна'), ('Иванович', 'Ивановна'),
+    ('Петрович', 'Петровна'), ('Николаевич', 'Николаевна'), ('Владимирович', 'Владимировна'),
+)
+DEPARTMENTS = (
+    'Совет директоров', 'Правление', 'Бухгалтерия', 'ИТ отдел', 'СВА', 'СКК', 'Юридический отдел',
+    'Отдел кадров', 'Канцелярия', 'Служба безопасности', 'Отдел закупок', 'Казначейство',
+    'Планово-экономический отдел', 'Отдел продаж', 'Маркетинг', 'Служба поддержки',
+    'Отдел логистики', 'Хозяйственный отдел', 'Служба внутреннего аудита', 'Отдел комплаенс',
+)
+BRANCHES = ('Алматы', 'Астана', 'Шымкент', 'Караганда', 'Актобе', 'Павлодар', 'Атырау', 'Костанай')
+POSITIONS = (
+    'Начальник отдела', 'Заместитель начальника', 'Главный специалист', 'Ведущий специалист',
+    'Специалист', 'Специалист 1 категории', 'Эксперт', 'Менеджер', 'Ассистент', 'Инженер',
+    'Ведущий инженер', 'Аналитик', 'Бухгалтер', 'Юрисконсульт', 'Вр. ИО Начальника',
+)
+
+_TRANSLIT = dict(zip(
+    'абвгдеёжзийклмнопрстуфхцчшщъыьэюя',
+    ('a', 'b', 'v', 'g', 'd', 'e', 'e', 'zh', 'z', 'i', 'y', 'k', 'l', 'm', 'n', 'o', 'p', 'r',
+     's', 't', 'u', 'f', 'h', 'ts', 'ch', 'sh', 'sch', '', 'y', '', 'e', 'yu', 'ya')
+))
+
+
+def _latin(word):
+    return ''.join(_TRANSLIT.get(char, char) for char in word.lower())
+
+
+def _departments(rng, count):
+    """Названия отделов; для больших справочников - отделы филиалов."""
+    names = list(DEPARTMENTS)
+    for branch in BRANCHES:
+        names.extend(f'{name} ({branch})' for name in DEPARTMENTS)
+    names.extend(f'Отдел №{number}' for number in range(1, max(0, count - len(names)) + 1))
+    names = names[:count]
+    # Размеры отделов неравномерные: несколько крупных и много мелких
+    weights = [rng.paretovariate(2.5) for _ in names]
+    return names, weights
+
+
+def _city_phone(rng):
+    number = rng.randint(200_000, 999_999)
+    fmt = rng.random()
+    if fmt < 0.6:
+        return str(number)
+    if fmt < 0.85:
+        number += 2_000_000
+        return f'+7 (727) {number // 10_000}-{number // 100 % 100:02d}-{number % 100:02d}'
+    return f'8727{number}'
+
+
+def generate(count, seed=42):
+    """DataFrame с count сотрудниками и колонками COLUMNS."""
+    rng = random.Random(seed)
+    names, weights = _departments(rng, max(5, min(count // 40, 2_000)))
+    common_phones = {name: str(600 + index) for index, name in enumerate(names)}
+    emails = set()
+
+    rows = []
+    for number, department in enumerate(rng.choices(names, weights, k=count)):
+        female = rng.random() < 0.5
+        surname = rng.choice(SURNAMES)
+        if female and surname[-2:] in ('ов', 'ев', 'ин'):
+            surname += 'а'
+        first = rng.choice(FIRST_NAMES)[female]
+        if rng.random() < 0.5:
+            full_name = f'{surname} {first[0]}'
+        else:
+            full_name = f'{surname} {first} {rng.choice(PATRONYMICS)[female]}'
+
+        email = f'{_latin(first)[0]}.{_latin(surname)}'
+        if email in emails:
+            email = f'{email}{number}'
+        emails.add(email)
+
+        rows.append((
+            department,
+            full_name,
+            rng.choice(POSITIONS),
+            str(100 + number % 9_900) if rng.random() < 0.9 else '',
+            common_phones[department] if rng.random() < 0.7 else '',
+            _city_phone(rng) if rng.random() < 0.6 else '',
+            f'{email}@company.com' if rng.random() < 0.85 else '',
+        ))
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def parse_size(value):
+    """'10k' -> 10000; принимает и обычное число."""
+    return SIZES[value] if value in SIZES else int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетический справочник сотрудников')
+    parser.add_argument('size', help=f'{", ".join(SIZES)} или число сотрудников')
+    parser.add_argument('-o', '--output', help='файл .csv или .xlsx (по умолчанию employees_<size>.csv)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    df = generate(parse_size(args.size), seed=args.seed)
+    output = args.output or f'employees_{args.size}.csv'
+    if output.endswith('.xlsx'):
+        df.to_excel(output, index=False)
+    else:
+        df.to_csv(output, index=False)
+    print(f'Записано {len(df)} сотрудников в {output}')
+
+
+if __name__ == '__main__':
+    main()
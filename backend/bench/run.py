@@ -0,0 +1,269 @@
+"""
+Прогон сценариев справочника через тестовый клиент Flask.
+
+Для каждого размера создается отдельная временная база, заполняется
+генератором и прогревается. Каждый сценарий выполняется несколько раз: по
+замерам считаются p50/p95 и пропускная способность, затем один
+дополнительный прогон под tracemalloc дает пик памяти Python. Кэши ответов
+перед каждым запросом сбрасываются, чтобы мерить работу, а не попадание в кэш
+(кроме сценария list_cached).
+
+Результат сравнивается с базовой линией (bench/baseline.json). Регрессия -
+рост медианы, p95 (если повторов достаточно) или пика памяти больше допуска;
+тогда код возврата 1. Базовая линия зависит от машины, обновляется через
+--update-baseline.
+"""
+
+import argparse
+import gc
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench.generate import SIZES, generate, parse_size
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Допуски регрессии: относительный и минимальный абсолютный (шум на быстрых запросах)
+TOLERANCE = 0.25
+MIN_TIME_DELTA_MS = 5.0
+MIN_MEMORY_DELTA_KB = 1024
+MIN_ITERATIONS_FOR_P95 = 20
+
+# Полный PDF больших справочников строится минутами, для них - только по отделу
+PDF_FULL_LIMIT = 20_000
+IMPORT_ROWS = 1_000
+SEARCH_TERMS = ('иванов', 'петрова', 'инженер', 'бухгалтер', 'алматы', 'сергеевич', '8727', 'ёлкин')
+
+
+class Bench:
+    """Приложение на временной базе и сценарии над ним."""
+
+    def __init__(self, size, workdir):
+        from app import create_admin, create_app, init_db
+        from models import Employee, db
+        import importer
+
+        self.size = size
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "bench.db")}',
+            'UPLOADED_PHOTOS_DEST': os.path.join(workdir, 'photos'),
+        })
+        init_db(self.app)
+        create_admin(self.app, 'bench', 'bench')
+
+        self.directory = generate(size)
+        with self.app.app_context():
+            importer.import_frame(db.session, Employee, self.directory, mode='append',
+                                  chunk_size=5_000)
+            self.photo_employee = db.session.query(Employee.id).first()[0]
+
+        departments = self.directory['Отдел'].value_counts()
+        self.largest_department = departments.index[0]
+        self.departments = list(departments.index[:20])
+        phones = self.directory['городской №']
+        self.phones = list(phones[phones != ''].head(50))
+
+        self.client = self.app.test_client()
+        response = self.client.post('/api/login', json={'username': 'bench', 'password': 'bench'})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        self._counter = 0
+
+    def _next(self, values):
+        self._counter += 1
+        return values[self._counter % len(values)]
+
+    def _get(self, url, cold=True, **kwargs):
+        if cold:
+            from app import pdf_cache, response_cache
+            response_cache.clear()
+            pdf_cache.clear()
+        response = self.client.get(url, **kwargs)
+        assert response.status_code == 200, (url, response.status_code)
+        return response
+
+    def scenarios(self):
+        """(имя, функция, число повторов)."""
+        items = [
+            ('list', lambda: self._get('/api/employees?limit=50'), 50),
+            ('list_sorted', lambda: self._get('/api/employees?limit=50&sort=full_name'), 50),
+            ('list_department', lambda: self._get(
+                '/api/employees', query_string={'department': self._next(self.departments), 'limit': 50}), 50),
+            ('list_cached', lambda: self._get('/api/employees?limit=50', cold=False), 200),
+            ('search', lambda: self._get(
+                '/api/employees', query_string={'search': self._next(SEARCH_TERMS), 'limit': 50}), 50),
+            ('departments', lambda: self._get('/api/departments'), 30),
+            ('phone_lookup', lambda: self._get(f'/api/lookup/phone/{self._next(self.phones)}'), 200),
+            ('pdf_department', lambda: self._get(
+                '/api/export/pdf', query_string={'department': self.largest_department}), 3),
+            # Ответ потоковый: тело читается целиком, иначе замер - только до первой части
+            ('export_csv', lambda: self._get('/api/export/csv').get_data(), 5),
+        ]
+        if self.size <= PDF_FULL_LIMIT:
+            items.append(('pdf_full', lambda: self._get('/api/export/pdf'), 3))
+        items += [
+            ('photo_upload', self.upload_photo, 10),
+            ('import', self.run_import, 5),
+        ]
+        return items
+
+    def upload_photo(self):
+        from PIL import Image
+
+        self._counter += 1
+        buffer = io.BytesIO()
+        # Каждый раз новое изображение, иначе файлы с тем же хэшем уже есть
+        Image.new('RGB', (1600, 1200), (self._counter % 256, 80, 160)).save(buffer, 'JPEG', quality=90)
+        buffer.seek(0)
+        response = self.client.post(f'/api/upload_photo/{self.photo_employee}',
+                                    data={'photo': (buffer, 'photo.jpg')})
+        assert response.status_code == 200, response.get_data(as_text=True)
+
+    def run_import(self):
+        self._counter += 1
+        data = generate(IMPORT_ROWS, seed=self._counter).to_csv(index=False).encode('utf-8')
+        response = self.client.post('/api/import', data={
+            'file': (io.BytesIO(data), 'bench.csv'), 'mode': 'upsert',
+        })
+        assert response.status_code == 202, response.get_data(as_text=True)
+        job_url = f'/api/import/{response.get_json()["job_id"]}'
+        # Импорт идет в фоновом потоке - ждем завершения задачи
+        while True:
+            job = self.client.get(job_url).get_json()
+            if job['status'] in ('done', 'failed', 'cancelled'):
+                assert job['status'] == 'done', job
+                return
+            time.sleep(0.01)
+
+
+def measure(func, iterations):
+    # Прогрев: ленивые импорты, кэш страниц SQLite; мусор от подготовки собирается заранее
+    for _ in range(min(3, iterations)):
+        func()
+    gc.collect()
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+
+    # Память меряется отдельным прогоном: tracemalloc заметно замедляет код
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'rps': round(iterations / elapsed, 1),
+        'peak_kb': peak // 1024,
+    }
+
+
+def _print_result(name, result):
+    print(f'{name:<16}{result["p50_ms"]:>10}{result["p95_ms"]:>10}'
+          f'{result["rps"]:>10}{result["peak_kb"]:>10}')
+
+
+def compare(name, result, base, tolerance):
+    """Описания регрессий одного сценария относительно базовой линии."""
+    checks = [('p50_ms', MIN_TIME_DELTA_MS), ('peak_kb', MIN_MEMORY_DELTA_KB)]
+    # p95 по нескольким повторам - это почти максимум, сравнивать его - ловить шум
+    if result['iterations'] >= MIN_ITERATIONS_FOR_P95:
+        checks.append(('p95_ms', MIN_TIME_DELTA_MS))
+    regressions = []
+    for metric, min_delta in checks:
+        delta = result[metric] - base[metric]
+        if delta > min_delta and result[metric] > base[metric] * (1 + tolerance):
+            regressions.append(f'{name}: {metric} {base[metric]} -> {result[metric]}')
+    return regressions
+
+
+def run(size, only=None, baseline=None, tolerance=TOLERANCE):
+    """Результаты сценариев и список регрессий для одного размера справочника."""
+    workdir = tempfile.mkdtemp(prefix='handbook-bench-')
+    try:
+        started = time.perf_counter()
+        bench = Bench(size, workdir)
+        print(f'\n== {size} сотрудников (подготовка {time.perf_counter() - started:.1f} с)')
+        print(f'{"сценарий":<16}{"p50, мс":>10}{"p95, мс":>10}{"запр/с":>10}{"пик, КБ":>10}')
+        results, regressions = {}, []
+        for name, func, iterations in bench.scenarios():
+            if only and name not in only:
+                continue
+            result = results[name] = measure(func, iterations)
+            _print_result(name, result)
+            base = (baseline or {}).get(name)
+            if base and compare(name, result, base, tolerance):
+                # Перед тем как объявить регрессию, сценарий повторяется: отсекает разовый шум
+                retry = measure(func, iterations)
+                _print_result('  повтор', retry)
+                for metric in ('p50_ms', 'p95_ms', 'peak_kb'):
+                    result[metric] = min(result[metric], retry[metric])
+                result['rps'] = max(result['rps'], retry['rps'])
+                regressions += compare(name, result, base, tolerance)
+        return results, regressions
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности справочника')
+    parser.add_argument('--size', action='append',
+                        help=f'{", ".join(SIZES)} или число; можно несколько раз (по умолчанию 1k и 10k)')
+    parser.add_argument('--scenario', action='append', help='запустить только эти сценарии')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='записать результаты как новую базовую линию')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='допустимый относительный рост метрик (0.25 = 25%%)')
+    parser.add_argument('--output', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results, regressions = {}, []
+    for label in args.size or ['1k', '10k']:
+        reference = None if args.update_baseline else baseline.get(label)
+        results[label], found = run(parse_size(label), args.scenario, reference, args.tolerance)
+        regressions += [f'[{label}] {item}' for item in found]
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.update_baseline:
+        for label, scenarios in results.items():
+            baseline.setdefault(label, {}).update(scenarios)
+        # Как и остальные файлы репозитория - с переводами строк CRLF
+        with open(args.baseline, 'w', encoding='utf-8', newline='\r\n') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'\nБазовая линия обновлена: {args.baseline}')
+        return 0
+
+    if regressions:
+        print('\nРегрессии относительно базовой линии:')
+        for item in regressions:
+            print(f'  {item}')
+        return 1
+    print('\nРегрессий нет' if baseline else '\nБазовой линии нет, сравнение пропущено')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
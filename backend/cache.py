@@ -0,0 +1,166 @@
+"""
+Версия данных справочника и кэш сериализованных ответов.
+
+Версия хранится в базе (таблица directory_state) и увеличивается в той же
+транзакции, что и изменение данных, поэтому ее видят все процессы приложения.
+Кэш ответов живет в памяти процесса и ограничен по числу записей и по их
+суммарному размеру (LRU); слишком большие ответы не кэшируются вовсе.
+Большие и дорогие ответы (PDF) кэшируются на диске, общем для всех воркеров.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+STATE_TABLE = 'directory_state'
+
+
+def current_version(session):
+    return session.execute(text(f'SELECT version FROM {STATE_TABLE} WHERE id = 1')).scalar_one()
+
+
+def bump_version(session):
+    """Увеличивает версию в текущей транзакции; вызывается перед каждым commit с изменениями."""
+    session.execute(text(f'UPDATE {STATE_TABLE} SET version = version + 1 WHERE id = 1'))
+
+
+def make_etag(version, key):
+    """Сильный ETag: ответ однозначно определяется версией данных и параметрами запроса."""
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()[:16]
+    return f'v{version}-{digest}'
+
+
+class ResponseCache:
+    """
+    Потокобезопасный LRU-кэш готовых ответов. Кроме числа записей ограничен
+    суммарный размер (max_bytes); запись больше max_entry_bytes не сохраняется:
+    один полный список справочника вытеснил бы весь кэш.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, max_entry_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Сохраняет значение размером size байт; возвращает False, если оно слишком большое."""
+        if size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= evicted
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileCache:
+    """
+    Кэш готовых ответов в каталоге directory с тем же интерфейсом, что у
+    ResponseCache. Запись - файл с заголовком (тип и заголовки ответа) в первой
+    строке и телом после него; пишется через временный файл и os.replace,
+    поэтому воркеры видят либо всю запись, либо ничего. Суммарный размер
+    ограничен max_bytes: при превышении удаляются давно не читанные записи.
+    """
+
+    SUFFIX = '.cache'
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + self.SUFFIX)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                mimetype, headers = json.loads(f.readline())
+                body = f.read()
+            # Время доступа для вытеснения давно не читанных
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return body, mimetype, [tuple(header) for header in headers]
+
+    def put(self, key, value, size):
+        """Сохраняет ответ (body, mimetype, headers); False, если он больше всего кэша."""
+        if size > self.max_bytes:
+            return False
+        body, mimetype, headers = value
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps([mimetype, headers]).encode('utf-8') + b'\n')
+                f.write(body)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            return False
+        self._evict()
+        return True
+
+    def _entries(self):
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if name.endswith(self.SUFFIX):
+                path = os.path.join(self.directory, name)
+                with contextlib.suppress(OSError):
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            # Запись мог уже удалить другой воркер
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self._entries():
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+    def __len__(self):
+        return len(self._entries())
@@ -0,0 +1,59 @@
+"""
+Журнал изменений сотрудников для инкрементальной синхронизации клиентов.
+
+Триггеры на employee пишут в employee_change строку с возрастающим номером
+seq на каждую вставку, изменение и удаление. На сотрудника хранится одна
+строка - последнее изменение (INSERT OR REPLACE по employee_id), поэтому
+журнал не растет от повторных правок, а удаленные сотрудники остаются в нем
+"надгробиями". Клиент запоминает последний полученный seq и запрашивает
+только то, что изменилось после него.
+"""
+
+from sqlalchemy import Integer, String, column, select, table, text
+
+CHANGE_TABLE = 'employee_change'
+
+# Описание таблицы для построения запросов (таблицу и триггеры создают миграции)
+changes = table(
+    CHANGE_TABLE,
+    column('seq', Integer),
+    column('employee_id', Integer),
+    column('op', String),
+    column('fields', String),
+)
+
+
+def is_supported(engine):
+    return engine.dialect.name == 'sqlite'
+
+
+def current_seq(session):
+    """Номер последнего изменения (0, если изменений не было)."""
+    return session.execute(text(f'SELECT coalesce(max(seq), 0) FROM {CHANGE_TABLE}')).scalar_one()
+
+
+def changes_since(session, model, since, fields, limit):
+    """
+    Изменения с seq > since по возрастанию seq, не больше limit.
+    Строки: seq, op, employee_id и поля fields сотрудника (None для удаленных).
+    """
+    query = (
+        select(changes.c.seq, changes.c.op, changes.c.employee_id,
+               *(getattr(model, field) for field in fields))
+        .select_from(changes.outerjoin(model, model.id == changes.c.employee_id))
+        .where(changes.c.seq > since)
+        .order_by(changes.c.seq)
+        .limit(limit)
+    )
+    return session.execute(query).all()
+
+
+def events_since(connection, since, limit):
+    """Краткие записи журнала (seq, op, employee_id, fields) с seq > since - для уведомлений."""
+    query = (
+        select(changes.c.seq, changes.c.op, changes.c.employee_id, changes.c.fields)
+        .where(changes.c.seq > since)
+        .order_by(changes.c.seq)
+        .limit(limit)
+    )
+    return connection.execute(query).all()
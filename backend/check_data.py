@@ -2,7 +2,11 @@ import sys
 import os
 sys.path.append('.')
 
-from app import db, Employee, app
+from app import create_app
+from models import Employee
+
+# Только чтение: схема создается командой flask --app app init-db
+app = create_app()
 
 with app.app_context():
     employees = Employee.query.all()
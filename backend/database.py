@@ -0,0 +1,51 @@
+"""
+Настройка подключения к SQLite для многопоточной и многопроцессной работы.
+
+WAL позволяет читателям работать параллельно с писателем, busy_timeout
+заставляет ждать освобождения блокировки вместо ошибки "database is locked",
+а synchronous=NORMAL в режиме WAL убирает fsync на каждый commit без риска
+повредить базу. Прагмы выставляются на каждое новое соединение пула.
+"""
+
+import os
+
+from sqlalchemy import event
+
+# Сколько миллисекунд соединение ждет снятия блокировки записи
+BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 15000))
+
+PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', BUSY_TIMEOUT_MS),
+    ('foreign_keys', 'ON'),
+    ('temp_store', 'MEMORY'),
+    # Отрицательное значение - размер кэша страниц в КиБ
+    ('cache_size', -int(os.getenv('SQLITE_CACHE_KIB', 20000))),
+    ('mmap_size', int(os.getenv('SQLITE_MMAP_BYTES', 256 * 1024 * 1024))),
+)
+
+
+def engine_options(database_uri):
+    """Параметры движка SQLAlchemy: пул соединений для файловой SQLite."""
+    if not database_uri.startswith('sqlite') or ':memory:' in database_uri:
+        return {}
+    return {
+        'pool_size': int(os.getenv('SQLITE_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('SQLITE_POOL_OVERFLOW', 10)),
+        'pool_timeout': 30,
+        'connect_args': {'timeout': BUSY_TIMEOUT_MS / 1000, 'check_same_thread': False},
+    }
+
+
+def configure_engine(engine):
+    """Подписывается на создание соединений, чтобы выставить прагмы SQLite."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in PRAGMAS:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
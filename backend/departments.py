@@ -0,0 +1,37 @@
+"""
+Справочник отделов с числом сотрудников.
+
+Сотрудник ссылается на отдел по department_id и хранит его название в
+department. Триггеры на employee поддерживают таблицу department: новый
+отдел создается при первом сотруднике, а employee_count меняется на
+единицу при вставке, удалении и переводе. Поэтому список отделов с
+численностью читается из маленькой таблицы, а не группировкой всех
+сотрудников, при любом пути записи - CRUD, пакет, импорт или SQL вручную.
+"""
+
+from sqlalchemy import text
+
+DEPARTMENT_TABLE = 'department'
+
+
+def is_supported(engine):
+    return engine.dialect.name == 'sqlite'
+
+
+def recount(connection):
+    """Пересчитывает численность всех отделов с нуля (для проверки и восстановления)."""
+    connection.execute(text(
+        f'UPDATE {DEPARTMENT_TABLE} SET employee_count = '
+        f'(SELECT count(*) FROM employee WHERE department_id = {DEPARTMENT_TABLE}.id)'
+    ))
+
+
+def list_departments(connection, with_counts=False):
+    """Отделы, в которых есть сотрудники, по алфавиту."""
+    rows = connection.execute(text(
+        f"SELECT id, name, employee_count FROM {DEPARTMENT_TABLE} "
+        f"WHERE employee_count > 0 AND name != '' ORDER BY name"
+    )).all()
+    if with_counts:
+        return [{'id': row.id, 'name': row.name, 'employee_count': row.employee_count} for row in rows]
+    return [row.name for row in rows]
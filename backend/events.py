@@ -0,0 +1,176 @@
+"""
+Рассылка изменений справочника через Server-Sent Events.
+
+Источник событий - журнал employee_change: его видят все процессы, поэтому
+уведомления приходят о любых изменениях - через API, импорт или другой воркер.
+В каждом процессе один поток-опросчик читает новые записи журнала и раздает их
+подписчикам; после commit в этом же процессе опрос запускается сразу, не
+дожидаясь интервала. Подписчик - очередь событий, а HTTP-ответ - генератор,
+который ждет на ней. Под gunicorn с воркером gevent ожидание - это гринлет, а
+не поток, поэтому сотни открытых вкладок не занимают рабочие потоки.
+"""
+
+import json
+import logging
+import queue
+import threading
+
+import change_log
+
+logger = logging.getLogger(__name__)
+
+# Как часто опрашивается журнал, если в этом процессе не было commit
+POLL_INTERVAL = 1.0
+# Комментарий-пинг, чтобы прокси и браузер не закрывали простаивающее соединение
+HEARTBEAT_INTERVAL = 15.0
+# Через сколько миллисекунд браузер переподключается после обрыва
+RETRY_MS = 3000
+# Сколько событий отдается при возобновлении с Last-Event-ID; если больше - reset
+MAX_BACKLOG = 1000
+# Очередь подписчика: если клиент не успевает читать, ему отправляется reset
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+class TooManySubscribers(Exception):
+    """Достигнут предел подписчиков в процессе."""
+
+
+def format_event(event, data=None, event_id=None):
+    """Одно событие в формате text/event-stream."""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _change_event(row):
+    return format_event('change', {
+        'seq': row.seq,
+        'op': row.op,
+        'id': row.employee_id,
+        'fields': row.fields.split(',') if row.fields else [],
+    }, event_id=row.seq)
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflow = False
+        # Номер, до которого клиент уже получил события (задается в start)
+        self.since = None
+
+    def push(self, rows):
+        for row in rows:
+            try:
+                self.queue.put_nowait(row)
+            except queue.Full:
+                self.overflow = True
+                return
+
+
+class EventBroker:
+    def __init__(self, engine, max_subscribers=1000, poll_interval=POLL_INTERVAL):
+        self.engine = engine
+        self.max_subscribers = max_subscribers
+        self.poll_interval = poll_interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_seq = None
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def wake(self):
+        """Запускает опрос журнала сразу (вызывается после commit)."""
+        if self._subscribers:
+            self._wakeup.set()
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise TooManySubscribers('Слишком много подписчиков, повторите позже')
+            subscriber = Subscriber()
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def start(self, subscriber, since):
+        """
+        Запускает доставку подписчику, получившему события до номера since.
+        Новый опросчик начинает с наименьшего since среди подписчиков, а не с
+        текущего конца журнала: изменения между чтением since и запуском потока
+        иначе не дошли бы до клиента.
+        """
+        with self._lock:
+            subscriber.since = since
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._poll, name='events', daemon=True)
+                self._thread.start()
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _poll(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Без подписчиков поток завершается; следующий subscribe запустит новый
+                    self._thread = None
+                    self._last_seq = None
+                    return
+                if self._last_seq is None:
+                    self._last_seq = min((s.since for s in self._subscribers if s.since is not None),
+                                         default=None)
+            try:
+                rows = []
+                if self._last_seq is not None:
+                    with self.engine.connect() as connection:
+                        rows = change_log.events_since(connection, self._last_seq, MAX_BACKLOG)
+            except Exception:
+                logger.exception('Ошибка чтения журнала изменений')
+                rows = []
+            if rows:
+                self._last_seq = rows[-1].seq
+                # Список берется после чтения: подписавшийся во время чтения прочитал
+                # журнал уже после этих записей, а подписавшийся раньше получит их здесь
+                with self._lock:
+                    subscribers = list(self._subscribers)
+                for subscriber in subscribers:
+                    subscriber.push(rows)
+            # Если прочитана полная пачка, сразу читаем следующую
+            if len(rows) < MAX_BACKLOG:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def stream(self, subscriber, backlog, last_seq, heartbeat=HEARTBEAT_INTERVAL):
+        """
+        Генератор тела ответа: сначала пропущенные события (backlog), затем новые.
+        События с seq <= last_seq (уже отправленные из backlog) пропускаются.
+        backlog=None - клиент отстал больше чем на MAX_BACKLOG событий.
+        """
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            if backlog is None:
+                yield format_event('reset', {'reason': 'backlog'})
+                return
+            for row in backlog:
+                yield _change_event(row)
+            while True:
+                try:
+                    row = subscriber.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                if subscriber.overflow:
+                    # Клиент отстал: пусть перечитает данные и подключится заново
+                    yield format_event('reset', {'reason': 'overflow'})
+                    return
+                if row.seq > last_seq:
+                    last_seq = row.seq
+                    yield _change_event(row)
+        finally:
+            self.unsubscribe(subscriber)
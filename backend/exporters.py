@@ -0,0 +1,157 @@
+"""
+Потоковая выгрузка справочника в CSV, XLSX и vCard.
+
+Экспортеры получают итератор строк (id и поля FIELDS) и отдают части ответа
+по мере чтения, поэтому память не зависит от размера справочника. CSV и
+vCard начинают отдаваться с первой порции строк. XLSX пишется openpyxl в
+режиме write-only: строки уходят во временный файл, а не в память, и
+архив отдается частями после записи листа - формат zip требует готовый лист.
+Заголовки CSV и XLSX совпадают с колонками импорта, выгрузку можно загрузить обратно.
+"""
+
+import csv
+import io
+import tempfile
+
+FIELDS = ('department', 'full_name', 'position', 'internal_phone', 'common_phone',
+          'city_phone', 'email')
+HEADER = ('Отдел', 'ФИО', 'Должность', '№ вн.', 'общ. №', 'городской №', 'email')
+XLSX_WIDTHS = (30, 35, 35, 10, 12, 18, 30)
+
+# Сколько строк собирается в одну часть ответа
+ROWS_PER_CHUNK = 500
+# Размер частей при отдаче готового XLSX
+FILE_CHUNK_BYTES = 64 * 1024
+# Длина строки vCard без учета CRLF (RFC 6350, 3.2)
+VCARD_LINE_OCTETS = 75
+
+
+def _batches(rows, size=ROWS_PER_CHUNK):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _values(row):
+    return ['' if getattr(row, field) is None else getattr(row, field) for field in FIELDS]
+
+
+def csv_chunks(rows):
+    """CSV в UTF-8 с BOM: иначе Excel открывает кириллицу в кодировке Windows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        chunk = buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    # Заголовок отдается сразу, до первого запроса к базе
+    buffer.write('\ufeff')
+    writer.writerow(HEADER)
+    yield flush()
+    for batch in _batches(rows):
+        writer.writerows(_values(row) for row in batch)
+        yield flush()
+
+
+def xlsx_chunks(rows):
+    """XLSX через openpyxl write-only; номера пишутся строками, без превращения в числа."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Справочник')
+    for index, width in enumerate(XLSX_WIDTHS, start=1):
+        sheet.column_dimensions[get_column_letter(index)].width = width
+    bold = Font(bold=True)
+    header = []
+    for title in HEADER:
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.font = bold
+        header.append(cell)
+    sheet.append(header)
+    for row in rows:
+        sheet.append(_values(row))
+
+    with tempfile.TemporaryFile() as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(FILE_CHUNK_BYTES)
+            if not chunk:
+                break
+            yield chunk
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    # Длинные строки переносятся: CRLF и пробел, не разрезая символы UTF-8
+    encoded = line.encode('utf-8')
+    if len(encoded) <= VCARD_LINE_OCTETS:
+        return line + '\r\n'
+    parts, current, size, limit = [], [], 0, VCARD_LINE_OCTETS
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            parts.append(''.join(current))
+            current, size, limit = [], 0, VCARD_LINE_OCTETS - 1
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def vcard(row):
+    """Карточка vCard 3.0 одного сотрудника; ФИО разбирается как Фамилия Имя Отчество."""
+    names = (row.full_name or '').split()
+    family, given, middle = (names + ['', '', ''])[:3]
+    if len(names) > 3:
+        middle = ' '.join(names[2:])
+    lines = [
+        'BEGIN:VCARD',
+        'VERSION:3.0',
+        # Постоянный UID: при повторном импорте адресная книга обновляет контакт, а не дублирует
+        f'UID:handbook-employee-{row.id}',
+        f'FN:{_escape(row.full_name or "")}',
+        f'N:{_escape(family)};{_escape(given)};{_escape(middle)};;',
+        f'ORG:{_escape(row.department or "")}',
+    ]
+    if row.position:
+        lines.append(f'TITLE:{_escape(row.position)}')
+    if row.city_phone:
+        lines.append(f'TEL;TYPE=WORK,VOICE:{_escape(row.city_phone)}')
+    if row.common_phone:
+        lines.append(f'TEL;TYPE=WORK:{_escape(row.common_phone)}')
+    if row.internal_phone:
+        lines.append(f'TEL;TYPE=X-INTERNAL:{_escape(row.internal_phone)}')
+    if row.email:
+        lines.append(f'EMAIL;TYPE=INTERNET,WORK:{_escape(row.email)}')
+    lines.append('END:VCARD')
+    return ''.join(_fold(line) for line in lines)
+
+
+def vcard_chunks(rows):
+    """Все карточки одним файлом .vcf - так его принимают адресные книги телефонов."""
+    for batch in _batches(rows):
+        yield ''.join(vcard(row) for row in batch).encode('utf-8')
+
+
+# Формат -> (функция, MIME-тип, расширение файла)
+FORMATS = {
+    'csv': (csv_chunks, 'text/csv', 'csv'),
+    'xlsx': (xlsx_chunks, 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'vcard': (vcard_chunks, 'text/vcard', 'vcf'),
+}
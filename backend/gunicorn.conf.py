@@ -0,0 +1,43 @@
+# Настройки gunicorn для продакшена: несколько процессов, в каждом пул потоков.
+# SQLite в режиме WAL позволяет процессам читать параллельно с записью.
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 9)))
+# Для потока /api/events - gevent: открытое соединение держит гринлет, а не поток
+worker_class = os.getenv('WORKER_CLASS', 'gthread')
+worker_connections = int(os.getenv('WORKER_CONNECTIONS', 1000))
+threads = int(os.getenv('WEB_THREADS', 4))
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+# Перезапуск процессов после N запросов ограничивает рост памяти
+max_requests = 2000
+max_requests_jitter = 200
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    # Индекс подсказок у каждого воркера свой: строится до приема запросов
+    # (сервису событий он не нужен)
+    if os.getenv('WARM_UP', '1') == '0':
+        return
+    from app import warm_up
+
+    warm_up(worker.wsgi)
+
+
+def on_starting(server):
+    # Схема и администратор создаются один раз в мастер-процессе, до запуска воркеров;
+    # второй сервис на той же базе (события) эту работу не повторяет
+    if os.getenv('RUN_BOOTSTRAP', '1') == '0':
+        return
+    from app import bootstrap, create_app
+    from models import db
+
+    app = create_app()
+    bootstrap(app)
+    with app.app_context():
+        # Соединения мастера не должны наследоваться воркерами через fork
+        db.engine.dispose()
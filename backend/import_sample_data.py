@@ -1,39 +1,24 @@
 import sys
+import argparse
 sys.path.append('.')
-from app import app, db, Employee
-import pandas as pd
+from app import create_app, init_db
+from models import db, Employee
+import importer
+
+parser = argparse.ArgumentParser(description='Импорт сотрудников из CSV/XLSX')
+parser.add_argument('path', nargs='?', default='../sample_data.csv')
+parser.add_argument('--mode', choices=importer.MODES, default='upsert')
+parser.add_argument('--key', choices=sorted(importer.UPSERT_KEYS), default='name_department')
+parser.add_argument('--chunk-size', type=int, default=importer.DEFAULT_CHUNK_SIZE)
+args = parser.parse_args()
+
+app = create_app()
+init_db(app)
 
 with app.app_context():
-    # Читаем CSV файл
-    df = pd.read_csv('../sample_data.csv')
-    
-    # Очищаем существующие данные
-    Employee.query.delete()
-    
-    # Импортируем данные
-    imported_count = 0
-    for _, row in df.iterrows():
-        # Обрабатываем номера телефонов - убираем .0 и преобразуем в строки
-        def clean_phone_number(value):
-            if pd.isna(value):
-                return ''
-            # Преобразуем в строку и убираем .0
-            phone_str = str(value)
-            if phone_str.endswith('.0'):
-                phone_str = phone_str[:-2]
-            return phone_str.strip()
-        
-        employee = Employee(
-            department=row.get('Отдел', ''),
-            full_name=row.get('ФИО', ''),
-            position=row.get('Должность', ''),
-            internal_phone=clean_phone_number(row.get('№ вн.', '')),
-            common_phone=clean_phone_number(row.get('общ. №', '')),
-            city_phone=clean_phone_number(row.get('городской №', '')),
-            email=row.get('email', '')
-        )
-        db.session.add(employee)
-        imported_count += 1
-    
-    db.session.commit()
-    print(f'Импортировано {imported_count} записей')
+    # В режиме upsert повторный запуск обновляет существующих сотрудников, а не дублирует их
+    df = importer.read_table(args.path, args.path)
+    summary = importer.import_frame(db.session, Employee, df, mode=args.mode, key=args.key,
+                                    chunk_size=args.chunk_size)
+    print(f'Импортировано {summary["inserted"]} записей, обновлено {summary["updated"]}, '
+          f'без изменений {summary["unchanged"]}, с ошибками {summary["failed"]}')
@@ -0,0 +1,173 @@
+"""
+Импорт сотрудников из Excel/CSV.
+
+Колонки очищаются векторно средствами pandas, записи вставляются и
+обновляются пакетами с фиксацией транзакции после каждого пакета.
+В режиме upsert существующие сотрудники находятся по естественному ключу:
+измененные обновляются, неизмененные пропускаются, поэтому повторный
+импорт того же файла ничего не дублирует.
+"""
+
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import insert, select, update
+
+import cache
+
+# Варианты названий колонок в файле для каждого поля сотрудника
+COLUMN_ALIASES = {
+    'department': ('Отдел',),
+    'full_name': ('ФИО',),
+    'position': ('Должность',),
+    'internal_phone': ('№ вн.', '№ вн', 'внутр. №'),
+    'common_phone': ('общ. №',),
+    'city_phone': ('городской №',),
+    'email': ('email',),
+}
+FIELDS = tuple(COLUMN_ALIASES)
+PHONE_FIELDS = ('internal_phone', 'common_phone', 'city_phone')
+REQUIRED_FIELDS = ('department', 'full_name', 'position')
+
+# Естественные ключи для режима upsert
+UPSERT_KEYS = {
+    'name_department': ('full_name', 'department'),
+    'name_department_position': ('full_name', 'department', 'position'),
+    'email': ('email',),
+}
+MODES = ('append', 'upsert')
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def read_table(stream, filename):
+    """Читает файл в DataFrame; все значения читаются как строки."""
+    if filename.endswith('.xlsx'):
+        return pd.read_excel(stream, dtype=str)
+    if filename.endswith('.csv'):
+        return pd.read_csv(stream, dtype=str)
+    raise ValueError('Неподдерживаемый формат файла')
+
+
+def clean_phone_numbers(series):
+    """Приводит номера к строкам и убирает хвост .0, оставшийся от числовых ячеек Excel."""
+    return series.fillna('').astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+
+
+def normalize_frame(df):
+    """Возвращает DataFrame с колонками FIELDS и очищенными строковыми значениями."""
+    result = pd.DataFrame(index=df.index)
+    for field, aliases in COLUMN_ALIASES.items():
+        column = next((alias for alias in aliases if alias in df.columns), None)
+        values = df[column] if column else pd.Series('', index=df.index)
+        if field in PHONE_FIELDS:
+            result[field] = clean_phone_numbers(values)
+        else:
+            result[field] = values.fillna('').astype(str).str.strip()
+    return result
+
+
+def _records(df, columns):
+    # Быстрее DataFrame.to_dict('records'): без упаковки каждой ячейки по отдельности
+    values = [df[column].tolist() for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _chunks(records, size):
+    for start in range(0, len(records), size):
+        yield records[start:start + size]
+
+
+def _processed(summary):
+    return summary['inserted'] + summary['updated'] + summary['unchanged'] + summary['failed']
+
+
+def import_frame(session, model, df, mode='append', key='name_department',
+                 chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Импортирует очищенный DataFrame в таблицу model.
+    Возвращает сводку: inserted, updated, unchanged, failed и причины ошибок.
+
+    progress(summary, processed) вызывается после фиксации каждого пакета;
+    чтобы прервать импорт, он может выбросить исключение (jobs.ImportCancelled).
+    """
+    def commit():
+        cache.bump_version(session)
+        session.commit()
+        if progress:
+            progress(summary, _processed(summary))
+
+    if mode not in MODES:
+        raise ValueError(f'Неизвестный режим импорта: {mode}')
+    if mode == 'upsert' and key not in UPSERT_KEYS:
+        raise ValueError(f'Неизвестный ключ импорта: {key}')
+
+    df = normalize_frame(df)
+    summary = {'total': len(df), 'inserted': 0, 'updated': 0, 'unchanged': 0,
+               'failed': 0, 'errors': []}
+
+    # Строки без обязательных полей не импортируются
+    missing = (df[list(REQUIRED_FIELDS)] == '').any(axis=1)
+    if mode == 'upsert':
+        key_fields = list(UPSERT_KEYS[key])
+        missing |= (df[key_fields] == '').any(axis=1)
+    for index in df.index[missing]:
+        # +2: заголовок файла и нумерация строк с единицы
+        summary['errors'].append({'row': int(index) + 2, 'reason': 'Не заполнены обязательные поля'})
+    summary['failed'] = int(missing.sum())
+    df = df[~missing]
+
+    if mode == 'append':
+        new_rows = df
+    else:
+        # В файле ключ должен быть уникальным: при повторах берется последняя строка
+        duplicated = df.duplicated(key_fields, keep='last')
+        for index in df.index[duplicated]:
+            summary['errors'].append({'row': int(index) + 2, 'reason': 'Повтор ключа в файле'})
+        summary['failed'] += int(duplicated.sum())
+        df = df[~duplicated]
+
+        existing = pd.DataFrame(
+            session.execute(select(model.id, *(getattr(model, f) for f in FIELDS))).all(),
+            columns=('id',) + FIELDS
+        )
+        existing[list(FIELDS)] = existing[list(FIELDS)].fillna('')
+        existing = existing.drop_duplicates(key_fields, keep='first')
+
+        merged = df.merge(existing, on=key_fields, how='left', suffixes=('', '_old'))
+        is_new = merged['id'].isna()
+        new_rows = merged.loc[is_new, list(FIELDS)]
+
+        matched = merged[~is_new]
+        value_fields = [f for f in FIELDS if f not in key_fields]
+        changed = pd.Series(False, index=matched.index)
+        for field in value_fields:
+            changed |= matched[field] != matched[f'{field}_old']
+        summary['unchanged'] = int((~changed).sum())
+
+        now = datetime.utcnow()
+        updates = _records(matched[changed].astype({'id': int}), ['id'] + value_fields)
+        for chunk in _chunks(updates, chunk_size):
+            for record in chunk:
+                record['updated_at'] = now
+            session.execute(update(model), chunk)
+            summary['updated'] += len(chunk)
+            commit()
+
+    for chunk in _chunks(_records(new_rows, list(FIELDS)), chunk_size):
+        # С RETURNING SQLAlchemy вставляет пакет многострочными INSERT, а не построчно:
+        # так и триггеры полнотекстового индекса срабатывают внутри одного оператора
+        session.scalars(insert(model).returning(model.id), chunk).all()
+        summary['inserted'] += len(chunk)
+        commit()
+
+    return summary
+
+
+def summary_message(summary, mode):
+    """Краткое описание результата импорта для пользователя."""
+    message = f'Импортировано {summary["inserted"]} записей'
+    if mode == 'upsert':
+        message += f', обновлено {summary["updated"]}, без изменений {summary["unchanged"]}'
+    if summary['failed']:
+        message += f', пропущено с ошибками {summary["failed"]}'
+    return message
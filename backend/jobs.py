@@ -0,0 +1,216 @@
+"""
+Фоновые задачи импорта.
+
+Загруженный файл сохраняется во временный каталог, а разбор и запись в базу
+выполняются в пуле потоков ограниченного размера. Состояние задачи хранится
+в таблице import_job, поэтому его видит любой процесс приложения, а отмена
+работает через флаг cancel_requested, который проверяется после каждого пакета.
+Тот же механизм выполняет загрузку архива фотографий (режим photos).
+
+Пока у процесса есть задачи, он раз в HEARTBEAT_INTERVAL секунд отмечает их
+в heartbeat_at. Если воркер перезапущен или убит посреди импорта, отметки
+прекращаются, и при следующем опросе задача завершается ошибкой, а не
+остается "running" навсегда.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Сколько причин ошибок по строкам сохраняется в задаче
+MAX_STORED_ERRORS = 1000
+
+FINISHED_STATUSES = ('done', 'failed', 'cancelled')
+# Как часто процесс отмечает свои задачи и через сколько без отметок задача считается брошенной
+HEARTBEAT_INTERVAL = 15
+STALE_AFTER = 120
+
+
+class QueueFull(Exception):
+    """Слишком много задач импорта ожидает выполнения."""
+
+
+class ImportCancelled(Exception):
+    """Импорт остановлен по запросу; уже зафиксированные пакеты остаются в базе."""
+
+
+class ImportJobRunner:
+    def __init__(self, app, db, job_model, employee_model, max_workers=2, max_queued=10,
+                 photos_folder=None, photo_workers=None):
+        self.app = app
+        self.db = db
+        self.job_model = job_model
+        self.employee_model = employee_model
+        self.max_queued = max_queued
+        # Каталог миниатюр (функция, вызывается в контексте приложения) и число процессов декодирования
+        self.photos_folder = photos_folder
+        self.photo_workers = photo_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='import')
+        self._futures = {}
+        self._heartbeat = None
+        self._lock = threading.Lock()
+
+    def submit(self, file, mode, key):
+        """Сохраняет файл, создает задачу и ставит ее в очередь. Возвращает задачу."""
+        with self._lock:
+            pending = sum(1 for future in self._futures.values() if not future.done())
+            if pending >= self.max_queued:
+                raise QueueFull('Слишком много задач импорта в очереди, повторите позже')
+
+        suffix = os.path.splitext(file.filename)[1]
+        fd, path = tempfile.mkstemp(prefix='import-', suffix=suffix)
+        with os.fdopen(fd, 'wb') as target:
+            file.save(target)
+
+        job = self.job_model(id=uuid.uuid4().hex, filename=file.filename, mode=mode, key=key)
+        self.db.session.add(job)
+        self.db.session.commit()
+
+        # id в переменной: колбэк срабатывает, когда сессии запроса уже нет
+        job_id = job.id
+        future = self._executor.submit(self._run, job_id, path)
+        with self._lock:
+            self._futures[job_id] = future
+            # Поток отметок запускается при первой задаче и завершается, когда задач нет
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name='import-heartbeat', daemon=True)
+                self._heartbeat.start()
+        future.add_done_callback(lambda f: self._forget(job_id, f, path))
+        return job
+
+    def cancel(self, job):
+        """Отменяет задачу: из очереди снимается сразу, выполняющаяся останавливается после пакета."""
+        if job.status in FINISHED_STATUSES:
+            return
+        with self._lock:
+            future = self._futures.get(job.id)
+        if job.status == 'queued' and (future is None or future.cancel()):
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+        else:
+            job.cancel_requested = True
+        self.db.session.commit()
+
+    def recover(self):
+        """Помечает задачи, прерванные остановкой сервера, как завершившиеся ошибкой."""
+        self.job_model.query.filter(self.job_model.status.in_(('queued', 'running'))).update(
+            {'status': 'failed', 'message': 'Задача прервана перезапуском сервера',
+             'finished_at': datetime.utcnow()},
+            synchronize_session=False
+        )
+        self.db.session.commit()
+
+    def expire_if_stale(self, job):
+        """Завершает ошибкой задачу, которую давно не отмечал ни один процесс."""
+        if job.status in FINISHED_STATUSES:
+            return
+        seen_at = job.heartbeat_at or job.created_at
+        if seen_at and seen_at < datetime.utcnow() - timedelta(seconds=STALE_AFTER):
+            self._finish(job, 'failed', None, 'Задача прервана: выполнявший ее процесс остановлен')
+
+    def _beat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                job_ids = list(self._futures)
+                if not job_ids:
+                    self._heartbeat = None
+                    return
+            try:
+                with self.app.app_context():
+                    self.job_model.query.filter(self.job_model.id.in_(job_ids)).update(
+                        {'heartbeat_at': datetime.utcnow()}, synchronize_session=False
+                    )
+                    self.db.session.commit()
+            except Exception:
+                logger.exception('Не удалось отметить задачи импорта')
+
+    def _forget(self, job_id, future, path):
+        with self._lock:
+            self._futures.pop(job_id, None)
+        # Задача снята с очереди до запуска: _run не выполнялся и файл не удалил
+        if future.cancelled() and os.path.exists(path):
+            os.remove(path)
+
+    def _run(self, job_id, path):
+        with self.app.app_context():
+            session = self.db.session
+            job = session.get(self.job_model, job_id)
+            try:
+                if job is None or job.status != 'queued':
+                    return
+                job.status = 'running'
+                job.started_at = job.heartbeat_at = datetime.utcnow()
+                session.commit()
+
+                def progress(summary, processed):
+                    # После commit объект задачи перечитывается из базы, так что флаг отмены свежий
+                    job.processed_rows = processed
+                    job.failed_rows = summary['failed']
+                    session.commit()
+                    if job.cancel_requested:
+                        raise ImportCancelled()
+
+                if job.mode == 'photos':
+                    summary, message = self._import_photos(job, path, progress)
+                else:
+                    summary, message = self._import_table(job, path, progress)
+                self._finish(job, 'done', summary, message)
+            except ImportCancelled:
+                session.rollback()
+                if job.mode == 'photos':
+                    self._finish(job, 'cancelled', None, 'Загрузка фото отменена, фото сотрудников не изменены')
+                else:
+                    self._finish(job, 'cancelled', None, 'Импорт отменен, уже записанные пакеты сохранены')
+            except Exception as e:
+                session.rollback()
+                logger.exception('Ошибка фонового импорта %s', job_id)
+                self._finish(job, 'failed', None, f'Ошибка импорта: {str(e)}')
+            finally:
+                os.remove(path)
+
+    def _import_table(self, job, path, progress):
+        import importer
+
+        session = self.db.session
+        df = importer.read_table(path, job.filename)
+        job.total_rows = len(df)
+        session.commit()
+        summary = importer.import_frame(
+            session, self.employee_model, df, mode=job.mode, key=job.key,
+            chunk_size=self.app.config['IMPORT_CHUNK_SIZE'], progress=progress
+        )
+        return summary, importer.summary_message(summary, job.mode)
+
+    def _import_photos(self, job, path, progress):
+        import photo_import
+
+        def count_files(summary, processed):
+            # Число изображений известно только после чтения оглавления архива
+            job.total_rows = summary['total']
+            progress(summary, processed)
+
+        summary = photo_import.import_archive(
+            self.db.session, self.employee_model, path, self.photos_folder(),
+            max_workers=self.photo_workers, progress=count_files
+        )
+        return summary, photo_import.summary_message(summary)
+
+    def _finish(self, job, status, summary, message=None):
+        job.status = status
+        job.finished_at = datetime.utcnow()
+        job.message = message
+        if summary is not None:
+            job.processed_rows = summary['total']
+            job.failed_rows = summary['failed']
+            job.errors = json.dumps(summary.pop('errors')[:MAX_STORED_ERRORS], ensure_ascii=False)
+            job.summary = json.dumps(summary, ensure_ascii=False)
+        self.db.session.commit()
@@ -0,0 +1,228 @@
+"""
+Метрики запросов и SQL в текстовом формате Prometheus.
+
+Хуки Flask меряют время, размер ответа, число и время SQL-запросов на каждый
+запрос (SQL считается через события движка SQLAlchemy). Медленные запросы и
+SQL пишутся в лог. Метрики копятся в памяти процесса: при нескольких воркерах
+gunicorn каждый отдает свои.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Пороги журнала медленных запросов (0 - не писать)
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 500))
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 1000)
+
+# Сколько разных SQL-операторов учитывается отдельно, остальные - в 'other'
+MAX_STATEMENTS = 200
+STATEMENT_LABEL_LENGTH = 120
+# Фоновые потоки (импорт) выполняют SQL вне запроса
+BACKGROUND = 'background'
+
+
+class Histogram:
+    """Кумулятивная гистограмма Prometheus: счетчики по корзинам, сумма и количество."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry:
+    """Все метрики процесса; потокобезопасно."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = {}        # (method, endpoint, status) -> число
+            self.latency = {}         # (method, endpoint) -> Histogram, секунды
+            self.response_size = {}   # (method, endpoint) -> Histogram, байты
+            self.sql_per_request = {}  # (method, endpoint) -> Histogram, число запросов
+            self.sql_time = {}        # endpoint -> суммарное время SQL, секунды
+            self.statements = {}      # текст -> [число, время]
+            self.slow_requests = 0
+            self.slow_queries = 0
+
+    def observe_request(self, method, endpoint, status, seconds, size, queries, slow):
+        key = (method, endpoint)
+        with self._lock:
+            self.requests[key + (status,)] = self.requests.get(key + (status,), 0) + 1
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            if size is not None:
+                self.response_size.setdefault(key, Histogram(SIZE_BUCKETS)).observe(size)
+            self.sql_per_request.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(queries)
+            self.slow_requests += slow
+
+    def observe_query(self, endpoint, statement, seconds, slow):
+        with self._lock:
+            self.sql_time[endpoint] = self.sql_time.get(endpoint, 0.0) + seconds
+            if statement not in self.statements and len(self.statements) >= MAX_STATEMENTS:
+                statement = 'other'
+            stats = self.statements.setdefault(statement, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            self.slow_queries += slow
+
+    def render(self):
+        """Текстовый формат Prometheus (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            _counter(lines, 'handbook_http_requests_total', 'Обработано HTTP-запросов',
+                     (({'method': m, 'endpoint': e, 'status': s}, v)
+                      for (m, e, s), v in sorted(self.requests.items())))
+            _histogram(lines, 'handbook_http_request_duration_seconds', 'Время обработки запроса',
+                       self.latency)
+            _histogram(lines, 'handbook_http_response_size_bytes', 'Размер тела ответа',
+                       self.response_size)
+            _histogram(lines, 'handbook_http_request_sql_queries', 'SQL-запросов на HTTP-запрос',
+                       self.sql_per_request)
+            _counter(lines, 'handbook_sql_seconds_total', 'Время SQL по обработчикам',
+                     (({'endpoint': e}, v) for e, v in sorted(self.sql_time.items())))
+            hot = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+            _counter(lines, 'handbook_sql_statement_calls_total', 'Выполнений SQL-оператора',
+                     (({'statement': s}, count) for s, (count, _) in hot))
+            _counter(lines, 'handbook_sql_statement_seconds_total', 'Время SQL-оператора',
+                     (({'statement': s}, seconds) for s, (_, seconds) in hot))
+            _counter(lines, 'handbook_slow_requests_total', 'Запросов дольше SLOW_REQUEST_MS',
+                     [({}, self.slow_requests)])
+            _counter(lines, 'handbook_slow_queries_total', 'SQL дольше SLOW_QUERY_MS',
+                     [({}, self.slow_queries)])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _counter(lines, name, help_text, samples):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} counter')
+    for labels, value in samples:
+        lines.append(f'{name}{_labels(labels)} {value:g}')
+
+
+def _histogram(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (method, endpoint), histogram in sorted(histograms.items()):
+        labels = {'method': method, 'endpoint': endpoint}
+        total = 0
+        for bound, total in histogram.samples():
+            le = bound if bound == '+Inf' else f'{bound:g}'
+            lines.append(f'{name}_bucket{_labels({**labels, "le": le})} {total}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram.sum:g}')
+        lines.append(f'{name}_count{_labels(labels)} {total}')
+
+
+registry = Registry()
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_label(statement):
+    """Оператор без лишних пробелов и с обрезанным хвостом (длинные списки VALUES)."""
+    return _WHITESPACE.sub(' ', statement).strip()[:STATEMENT_LABEL_LENGTH]
+
+
+def _endpoint():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_sql_seconds = 0.0
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return response
+    seconds = time.perf_counter() - start
+    # У потоковых ответов размер заранее неизвестен
+    size = None if response.is_streamed else response.calculate_content_length()
+    queries = g.get('metrics_queries', 0)
+    sql_seconds = g.get('metrics_sql_seconds', 0.0)
+    slow = bool(SLOW_REQUEST_MS) and seconds * 1000 >= SLOW_REQUEST_MS
+    endpoint = _endpoint()
+    registry.observe_request(request.method, endpoint, str(response.status_code), seconds, size,
+                             queries, slow)
+    if slow:
+        logger.warning('Медленный запрос %s %s: %.0f мс, SQL %d шт. / %.0f мс, ответ %s байт',
+                       request.method, request.full_path.rstrip('?'), seconds * 1000, queries,
+                       sql_seconds * 1000, size if size is not None else '?')
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('metrics_query_start')
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_sql_seconds += seconds
+        endpoint = _endpoint()
+    else:
+        endpoint = BACKGROUND
+    slow = bool(SLOW_QUERY_MS) and seconds * 1000 >= SLOW_QUERY_MS
+    label = statement_label(statement)
+    registry.observe_query(endpoint, label, seconds, slow)
+    if slow:
+        logger.warning('Медленный SQL (%.0f мс, %s): %s', seconds * 1000, endpoint, label)
+
+
+def _handle_error(context):
+    # После ошибки after_cursor_execute не вызывается - убираем отметку начала
+    starts = context.connection.info.get('metrics_query_start') if context.connection else None
+    if starts:
+        starts.pop()
+
+
+def init_app(app, engine):
+    """Подключает хуки запросов к приложению и события SQL к движку."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
@@ -0,0 +1,443 @@
+"""
+Версионные миграции схемы базы.
+
+db.create_all() создает только недостающие таблицы и не меняет существующие,
+поэтому развернутая база не получает новых колонок, индексов и триггеров.
+Миграции - пронумерованные шаги; номер примененного шага записывается в
+таблицу schema_version в той же транзакции, что и сам шаг. upgrade()
+применяет по порядку только недостающие шаги, так что ее можно вызывать
+при каждом запуске. Шаги написаны идемпотентно (IF NOT EXISTS, проверка
+колонок): база, созданная до появления миграций, проходит их с первого шага.
+
+Новое изменение схемы - новый шаг в конце списка; примененные шаги не меняются.
+Поэтому DDL записан в самих шагах, а не берется из моделей и модулей
+возможностей: их правка не меняет того, что создает уже выпущенный шаг.
+"""
+
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import (Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table, Text,
+                        inspect, text)
+
+logger = logging.getLogger(__name__)
+
+VERSION_TABLE = 'schema_version'
+
+Migration = namedtuple('Migration', 'version name upgrade')
+# Включенные возможности базы (см. create_app)
+Context = namedtuple('Context', 'fts phone_index change_log departments')
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Регистрирует шаг; номера идут подряд, без пропусков."""
+    def register(upgrade):
+        assert version == len(MIGRATIONS) + 1, f'Миграция {version} не по порядку'
+        MIGRATIONS.append(Migration(version, name, upgrade))
+        return upgrade
+    return register
+
+
+# Таблицы шага 1 в том виде, в каком их создавала init_db
+_baseline = MetaData()
+
+Table(
+    'user', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('password_hash', String(120), nullable=False),
+)
+
+Table(
+    'api_token', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('token_hash', String(64), unique=True, nullable=False),
+    Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('created_at', DateTime),
+    Column('expires_at', DateTime),
+    Column('revoked_at', DateTime),
+)
+
+Table(
+    'department', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), unique=True, nullable=False),
+    Column('employee_count', Integer, nullable=False, server_default='0'),
+)
+
+Table(
+    'employee', _baseline,
+    Column('id', Integer, primary_key=True),
+    Column('department', String(100), nullable=False),
+    Column('department_id', Integer, ForeignKey('department.id'), index=True),
+    Column('full_name', String(200), nullable=False),
+    Column('position', String(200), nullable=False),
+    Column('internal_phone', String(20)),
+    Column('common_phone', String(20)),
+    Column('city_phone', String(20)),
+    Column('email', String(100)),
+    Column('photo', String(255)),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+Table(
+    'import_job', _baseline,
+    Column('id', String(32), primary_key=True),
+    Column('filename', String(255), nullable=False),
+    Column('mode', String(20), nullable=False),
+    Column('key', String(50), nullable=False),
+    Column('status', String(20), nullable=False),
+    Column('total_rows', Integer),
+    Column('processed_rows', Integer, nullable=False),
+    Column('failed_rows', Integer, nullable=False),
+    Column('errors', Text),
+    Column('summary', Text),
+    Column('message', Text),
+    Column('cancel_requested', Boolean, nullable=False),
+    Column('created_at', DateTime),
+    Column('started_at', DateTime),
+    Column('finished_at', DateTime),
+)
+
+_FTS_COLUMNS = 'full_name, department, position, internal_phone, common_phone, city_phone, email'
+
+
+def _fts_values(row):
+    return ', '.join(f"replace(replace(coalesce({row}.{name}, ''), 'ё', 'е'), 'Ё', 'Е')"
+                     for name in _FTS_COLUMNS.split(', '))
+
+
+_FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS employee_fts USING fts5(
+        {_FTS_COLUMNS},
+        content='',
+        tokenize="unicode61 remove_diacritics 2",
+        prefix='2 3'
+    )""",
+    "INSERT INTO employee_fts(employee_fts, rank) VALUES('rank', 'bm25(10.0, 3.0, 4.0, 2.0, 1.0, 1.0, 2.0)')",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_fts_ai AFTER INSERT ON employee BEGIN
+        INSERT INTO employee_fts(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_fts_values('new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_fts_ad AFTER DELETE ON employee BEGIN
+        INSERT INTO employee_fts(employee_fts, rowid, {_FTS_COLUMNS})
+        VALUES ('delete', old.id, {_fts_values('old')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_fts_au AFTER UPDATE OF {_FTS_COLUMNS} ON employee BEGIN
+        INSERT INTO employee_fts(employee_fts, rowid, {_FTS_COLUMNS})
+        VALUES ('delete', old.id, {_fts_values('old')});
+        INSERT INTO employee_fts(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_fts_values('new')});
+    END""",
+]
+
+# Триггеры индекса телефонов и его заполнение - шаг 4
+_PHONE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS employee_phone (
+        employee_id INTEGER NOT NULL,
+        kind VARCHAR(20) NOT NULL,
+        digits VARCHAR(20) NOT NULL,
+        reversed_digits VARCHAR(20) NOT NULL
+    )""",
+    'CREATE INDEX IF NOT EXISTS ix_employee_phone_digits ON employee_phone (digits)',
+    'CREATE INDEX IF NOT EXISTS ix_employee_phone_reversed ON employee_phone (reversed_digits)',
+    'CREATE INDEX IF NOT EXISTS ix_employee_phone_employee ON employee_phone (employee_id)',
+]
+
+_TRACKED_FIELDS = ('department', 'full_name', 'position', 'internal_phone', 'common_phone',
+                   'city_phone', 'email', 'photo')
+
+
+def _change_record(op, row, fields='NULL'):
+    return (f'INSERT OR REPLACE INTO employee_change (employee_id, op, fields, changed_at) '
+            f"VALUES ({row}.id, '{op}', {fields}, CURRENT_TIMESTAMP);")
+
+
+_CHANGED_FIELDS = "nullif(substr({}, 2), '')".format(' || '.join(
+    f"CASE WHEN old.{field} IS NOT new.{field} THEN ',{field}' ELSE '' END"
+    for field in _TRACKED_FIELDS
+))
+
+_CHANGE_LOG_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS employee_change (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        employee_id INTEGER NOT NULL,
+        op VARCHAR(10) NOT NULL,
+        fields TEXT,
+        changed_at DATETIME NOT NULL
+    )""",
+    'CREATE UNIQUE INDEX IF NOT EXISTS ux_employee_change_employee ON employee_change (employee_id)',
+    f"""CREATE TRIGGER IF NOT EXISTS employee_change_ai AFTER INSERT ON employee BEGIN
+        {_change_record('insert', 'new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_change_au AFTER UPDATE OF {', '.join(_TRACKED_FIELDS)}
+    ON employee BEGIN
+        {_change_record('update', 'new', _CHANGED_FIELDS)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_change_ad AFTER DELETE ON employee BEGIN
+        {_change_record('delete', 'old')}
+    END""",
+]
+
+
+def _assign_department(row):
+    return (f"INSERT OR IGNORE INTO department (name, employee_count) VALUES ({row}.department, 0);\n"
+            f"        UPDATE employee SET department_id = "
+            f"(SELECT id FROM department WHERE name = {row}.department) WHERE id = {row}.id;")
+
+
+def _count_department(row, delta):
+    return f'UPDATE department SET employee_count = employee_count {delta} 1 WHERE id = {row}.department_id;'
+
+
+_DEPARTMENTS_SCHEMA = [
+    f"""CREATE TRIGGER IF NOT EXISTS employee_department_ai AFTER INSERT ON employee
+    WHEN new.department IS NOT NULL BEGIN
+        {_assign_department('new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_department_au AFTER UPDATE OF department ON employee
+    WHEN new.department IS NOT old.department BEGIN
+        {_assign_department('new')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_department_count_au AFTER UPDATE OF department_id ON employee
+    WHEN new.department_id IS NOT old.department_id BEGIN
+        {_count_department('old', '-')}
+        {_count_department('new', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_department_count_ai AFTER INSERT ON employee
+    WHEN new.department_id IS NOT NULL BEGIN
+        {_count_department('new', '+')}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS employee_department_count_ad AFTER DELETE ON employee BEGIN
+        {_count_department('old', '-')}
+    END""",
+]
+
+
+def _table_exists(connection, name):
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': name}
+    ).first() is not None
+
+
+def _columns(connection, table):
+    return {column['name'] for column in inspect(connection).get_columns(table)}
+
+
+def _execute_all(connection, statements):
+    for statement in statements:
+        connection.execute(text(statement))
+
+
+@migration(1, 'baseline')
+def baseline(connection, context):
+    # Схема, которую раньше создавала init_db при каждом запуске. База того времени
+    # могла быть создана раньше части возможностей - они добавляются здесь же
+    _baseline.create_all(connection)
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS directory_state ('
+        'id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)'
+    ))
+    connection.execute(text(
+        'INSERT INTO directory_state (id, version) SELECT 1, 1 '
+        'WHERE NOT EXISTS (SELECT 1 FROM directory_state)'
+    ))
+    if context.fts:
+        exists = _table_exists(connection, 'employee_fts')
+        _execute_all(connection, _FTS_SCHEMA)
+        if not exists:
+            connection.execute(text(
+                f"INSERT INTO employee_fts(rowid, {_FTS_COLUMNS}) SELECT e.id, {_fts_values('e')} FROM employee e"
+            ))
+    if context.phone_index:
+        _execute_all(connection, _PHONE_SCHEMA)
+    if context.change_log:
+        exists = _table_exists(connection, 'employee_change')
+        if exists:
+            if 'fields' not in _columns(connection, 'employee_change'):
+                # Журнал без списка полей: колонка и новый триггер изменения
+                connection.execute(text('ALTER TABLE employee_change ADD COLUMN fields TEXT'))
+                connection.execute(text('DROP TRIGGER IF EXISTS employee_change_au'))
+            trigger = connection.execute(text(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'employee_change_au'"
+            )).scalar()
+            if trigger and 'UPDATE OF' not in trigger:
+                # Старый триггер срабатывал на изменение любой колонки
+                connection.execute(text('DROP TRIGGER employee_change_au'))
+        _execute_all(connection, _CHANGE_LOG_SCHEMA)
+        if not exists:
+            connection.execute(text(
+                "INSERT INTO employee_change (employee_id, op, changed_at) "
+                "SELECT id, 'insert', CURRENT_TIMESTAMP FROM employee ORDER BY id"
+            ))
+    if context.departments:
+        # После журнала: перенос отделов не должен попасть в него как изменения
+        if 'department_id' not in _columns(connection, 'employee'):
+            connection.execute(text(
+                'ALTER TABLE employee ADD COLUMN department_id INTEGER REFERENCES department (id)'
+            ))
+            connection.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_employee_department_id ON employee (department_id)'
+            ))
+        _execute_all(connection, _DEPARTMENTS_SCHEMA)
+        connection.execute(text(
+            'INSERT OR IGNORE INTO department (name, employee_count) '
+            'SELECT DISTINCT department, 0 FROM employee WHERE department IS NOT NULL'
+        ))
+        connection.execute(text(
+            'UPDATE employee SET department_id = (SELECT d.id FROM department d '
+            'WHERE d.name = employee.department) WHERE department_id IS NULL AND department IS NOT NULL'
+        ))
+        connection.execute(text(
+            'UPDATE department SET employee_count = '
+            '(SELECT count(*) FROM employee WHERE department_id = department.id)'
+        ))
+
+
+@migration(2, 'employee_indexes')
+def employee_indexes(connection, context):
+    # Сортировка по ФИО, отбор по updated_at, поиск дублей по email; фильтр по
+    # отделу обслуживает составной индекс (department, full_name)
+    for name, columns in (('ix_employee_full_name', 'full_name'),
+                          ('ix_employee_email', 'email'),
+                          ('ix_employee_updated_at', 'updated_at'),
+                          ('ix_employee_department_full_name', 'department, full_name')):
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON employee ({columns})'))
+    # Статистика для планировщика: без нее SQLite выбирает индекс наугад
+    connection.execute(text('ANALYZE'))
+
+
+@migration(3, 'import_job_heartbeat')
+def import_job_heartbeat(connection, context):
+    # Отметки живости фоновых задач импорта (jobs.py)
+    if 'heartbeat_at' not in _columns(connection, 'import_job'):
+        connection.execute(text('ALTER TABLE import_job ADD COLUMN heartbeat_at DATETIME'))
+
+
+# Нормализация номеров на чистом SQL - то же, что phone_index.digits(). Промежуточные
+# значения проходят через json_each(json_array(...)): табличная функция вычисляет
+# аргумент один раз на строку, иначе SQLite подставил бы выражение в каждое место
+# использования. Номера символов строки дает json_each по массиву из zeroblob
+# (рекурсивные запросы в триггерах запрещены).
+_PHONE_TRIGGERS = [
+    """CREATE VIEW IF NOT EXISTS employee_phone_source AS
+    SELECT p.employee_id, p.kind, d.value AS digits,
+        (SELECT group_concat(substr(d.value, length(d.value) - key, 1), '')
+         FROM json_each('[' || substr(replace(hex(zeroblob(length(d.value))), '00', ',0'), 2) || ']')) AS reversed_digits
+    FROM (
+        SELECT id AS employee_id, 'internal_phone' AS kind, trim(internal_phone, char(32, 9, 10, 13)) AS value
+        FROM employee WHERE internal_phone IS NOT NULL
+        UNION ALL
+        SELECT id, 'common_phone', trim(common_phone, char(32, 9, 10, 13)) FROM employee WHERE common_phone IS NOT NULL
+        UNION ALL
+        SELECT id, 'city_phone', trim(city_phone, char(32, 9, 10, 13)) FROM employee WHERE city_phone IS NOT NULL
+    ) p,
+    json_each(json_array(replace(replace(replace(replace(replace(replace(replace(
+        CASE WHEN p.value LIKE '%.0' THEN substr(p.value, 1, length(p.value) - 2) ELSE p.value END,
+        ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', ''), '/', ''))) s,
+    json_each(json_array(CASE WHEN s.value GLOB '*[^0-9]*' THEN coalesce((
+        SELECT group_concat(c, '') FROM (
+            SELECT substr(s.value, key + 1, 1) AS c
+            FROM json_each('[' || substr(replace(hex(zeroblob(length(s.value))), '00', ',0'), 2) || ']')
+        ) WHERE c GLOB '[0-9]'), '') ELSE s.value END)) n,
+    json_each(json_array(CASE WHEN length(n.value) = 11 AND n.value LIKE '8%'
+        THEN '7' || substr(n.value, 2) ELSE n.value END)) d
+    WHERE d.value != ''""",
+    """CREATE TRIGGER employee_phone_ai AFTER INSERT ON employee BEGIN
+        INSERT INTO employee_phone (employee_id, kind, digits, reversed_digits)
+        SELECT employee_id, kind, digits, reversed_digits FROM employee_phone_source WHERE employee_id = new.id;
+    END""",
+    """CREATE TRIGGER employee_phone_ad AFTER DELETE ON employee BEGIN
+        DELETE FROM employee_phone WHERE employee_id = old.id;
+    END""",
+    # Импорт в режиме upsert перезаписывает все колонки: без WHEN индекс
+    # пересобирался бы и для неизменившихся номеров
+    """CREATE TRIGGER employee_phone_au AFTER UPDATE OF internal_phone, common_phone, city_phone ON employee
+    WHEN new.internal_phone IS NOT old.internal_phone OR new.common_phone IS NOT old.common_phone
+        OR new.city_phone IS NOT old.city_phone BEGIN
+        DELETE FROM employee_phone WHERE employee_id = old.id;
+        INSERT INTO employee_phone (employee_id, kind, digits, reversed_digits)
+        SELECT employee_id, kind, digits, reversed_digits FROM employee_phone_source WHERE employee_id = new.id;
+    END""",
+]
+
+
+@migration(4, 'phone_triggers_plain_sql')
+def phone_triggers_plain_sql(connection, context):
+    # Триггеры индекса телефонов без функций Python: запись в employee вне приложения
+    # больше не падает с "no such function: phone_digits"
+    if context.phone_index:
+        for name in ('employee_phone_ai', 'employee_phone_ad', 'employee_phone_au'):
+            connection.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        _execute_all(connection, _PHONE_TRIGGERS)
+        connection.execute(text('DELETE FROM employee_phone'))
+        connection.execute(text(
+            'INSERT INTO employee_phone (employee_id, kind, digits, reversed_digits) '
+            'SELECT employee_id, kind, digits, reversed_digits FROM employee_phone_source'
+        ))
+
+
+@migration(5, 'auth_state')
+def auth_state(connection, context):
+    # Счетчик отзывов токенов API: входит в ключ кэша токенов во всех процессах (auth.py)
+    connection.execute(text(
+        'CREATE TABLE IF NOT EXISTS auth_state ('
+        'id INTEGER PRIMARY KEY CHECK (id = 1), revocations INTEGER NOT NULL)'
+    ))
+    connection.execute(text(
+        'INSERT INTO auth_state (id, revocations) SELECT 1, 0 '
+        'WHERE NOT EXISTS (SELECT 1 FROM auth_state)'
+    ))
+
+
+def ensure_version_table(connection):
+    connection.execute(text(
+        f'CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ('
+        'version INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, applied_at VARCHAR(32) NOT NULL)'
+    ))
+
+
+def applied_versions(connection):
+    ensure_version_table(connection)
+    return {row.version: row for row in connection.execute(text(
+        f'SELECT version, name, applied_at FROM {VERSION_TABLE}'
+    ))}
+
+
+def current_version(connection):
+    return max(applied_versions(connection), default=0)
+
+
+def pending(connection):
+    applied = applied_versions(connection)
+    return [step for step in MIGRATIONS if step.version not in applied]
+
+
+def upgrade(engine, context):
+    """
+    Применяет недостающие шаги, каждый в своей транзакции.
+    Возвращает список примененных шагов.
+    """
+    with engine.begin() as connection:
+        ensure_version_table(connection)
+    done = []
+    for step in MIGRATIONS:
+        with engine.begin() as connection:
+            # Проверка внутри транзакции шага: другой процесс мог применить его раньше
+            applied = connection.execute(text(
+                f'SELECT 1 FROM {VERSION_TABLE} WHERE version = :version'
+            ), {'version': step.version}).first()
+            if applied:
+                continue
+            logger.info('Миграция %d: %s', step.version, step.name)
+            step.upgrade(connection, context)
+            connection.execute(text(
+                f'INSERT INTO {VERSION_TABLE} (version, name, applied_at) '
+                'VALUES (:version, :name, :applied_at)'
+            ), {'version': step.version, 'name': step.name,
+                'applied_at': datetime.utcnow().isoformat(timespec='seconds')})
+        done.append(step)
+    return done
@@ -0,0 +1,104 @@
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import UserMixin
+from werkzeug.security import generate_password_hash, check_password_hash
+from datetime import datetime
+import json
+
+db = SQLAlchemy()
+
+# Модель пользователя (администратора)
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(80), unique=True, nullable=False)
+    password_hash = db.Column(db.String(120), nullable=False)
+    
+    def set_password(self, password):
+        self.password_hash = generate_password_hash(password)
+    
+    def check_password(self, password):
+        return check_password_hash(self.password_hash, password)
+
+# Токен API сервисного клиента; хранится только SHA-256 токена (см. auth.py)
+class ApiToken(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime)
+    revoked_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'revoked_at': self.revoked_at.isoformat() if self.revoked_at else None,
+        }
+
+# Отдел; число сотрудников поддерживается триггерами (см. departments.py)
+class Department(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    employee_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+# Модель сотрудника
+class Employee(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Название отдела хранится и у сотрудника: по нему работают поиск, сортировка и импорт
+    department = db.Column(db.String(100), nullable=False)
+    department_id = db.Column(db.Integer, db.ForeignKey('department.id'), index=True)
+    full_name = db.Column(db.String(200), nullable=False, index=True)
+    position = db.Column(db.String(200), nullable=False)
+    internal_phone = db.Column(db.String(20))
+    common_phone = db.Column(db.String(20))
+    city_phone = db.Column(db.String(20))
+    email = db.Column(db.String(100), index=True)
+    photo = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # Индексы существующей базы добавляются миграциями (migrations.py)
+    __table_args__ = (
+        # Порядок выгрузок и PDF (отдел, ФИО, id) - чтение по индексу без сортировки таблицы
+        db.Index('ix_employee_department_full_name', 'department', 'full_name'),
+    )
+
+# Фоновая задача импорта
+class ImportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    mode = db.Column(db.String(20), nullable=False)
+    key = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    total_rows = db.Column(db.Integer)
+    processed_rows = db.Column(db.Integer, nullable=False, default=0)
+    failed_rows = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text)
+    summary = db.Column(db.Text)
+    message = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # Последняя отметка процесса, выполняющего задачу (см. jobs.py)
+    heartbeat_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'mode': self.mode,
+            'status': self.status,
+            'total_rows': self.total_rows,
+            'processed_rows': self.processed_rows,
+            'failed_rows': self.failed_rows,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'summary': json.loads(self.summary) if self.summary else None,
+            'message': self.message,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
@@ -0,0 +1,151 @@
+"""
+Экспорт справочника в PDF.
+
+Строки читаются из базы потоком и верстаются секциями по отделам, каждая
+секция режется на таблицы по CHUNK_ROWS строк. В памяти одновременно
+находится только текущий фрагмент, а не весь справочник.
+"""
+
+import io
+import logging
+import os
+from datetime import datetime
+from functools import lru_cache
+from itertools import groupby, islice
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont, TTFError
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+logger = logging.getLogger(__name__)
+
+# Количество строк в одной таблице (одном фрагменте верстки)
+CHUNK_ROWS = 200
+
+HEADER = ['ФИО', 'Должность', 'Внутр. №', 'Общ. №', 'Городской №', 'Email']
+COL_WIDTHS = [170, 190, 60, 70, 80, 170]
+
+# Пути, где ищется шрифт с поддержкой кириллицы
+FONT_CANDIDATES = (
+    os.getenv('PDF_FONT_PATH'),
+    'DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Регистрирует шрифт один раз на процесс и возвращает его имя."""
+    for path in FONT_CANDIDATES:
+        if not path:
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont('DejaVuSans', path))
+            logger.info('PDF: используется шрифт %s', path)
+            return 'DejaVuSans'
+        except (TTFError, OSError):
+            continue
+    logger.warning('PDF: шрифт с кириллицей не найден, используется Helvetica')
+    return 'Helvetica'
+
+
+@lru_cache(maxsize=None)
+def _table_style(font_name):
+    return TableStyle([
+        # Заголовок таблицы
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2E86AB')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTSIZE', (0, 0), (-1, 0), 9),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 0), (-1, 0), 8),
+
+        # Чередование цветов строк для лучшей читаемости
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F8F9FA')]),
+
+        # Стиль данных
+        ('FONTNAME', (0, 0), (-1, -1), font_name),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+
+        # Границы
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+        ('LINEBELOW', (0, 0), (-1, 0), 1, colors.white),
+
+        # Отступы
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+        ('TOPPADDING', (0, 1), (-1, -1), 3),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 3),
+    ])
+
+
+def _phone(value):
+    # Номера из Excel могли сохраниться как числа с хвостом .0
+    phone = str(value).strip() if value else ''
+    return phone[:-2] if phone.endswith('.0') else phone
+
+
+class _FlowableStream(list):
+    """
+    Список flowable'ов для doc.build(), который пополняется из генератора,
+    когда reportlab разобрал предыдущий фрагмент.
+    """
+
+    def __init__(self, source):
+        super().__init__()
+        self._source = iter(source)
+
+    def __len__(self):
+        if not super().__len__():
+            self.extend(islice(self._source, 1))
+        return super().__len__()
+
+
+def _flowables(rows, font_name):
+    title_style = ParagraphStyle('Title', fontName=font_name, fontSize=14, leading=18)
+    section_style = ParagraphStyle('Section', fontName=font_name, fontSize=11, leading=14,
+                                   textColor=colors.HexColor('#2E86AB'), spaceBefore=10, spaceAfter=4)
+    style = _table_style(font_name)
+
+    yield Paragraph(f'Телефонный справочник на {datetime.now():%d.%m.%Y}', title_style)
+    yield Spacer(1, 6)
+
+    # Строки приходят отсортированными по отделу, поэтому группировка потоковая
+    for department, employees in groupby(rows, key=lambda row: row[0] or ''):
+        yield Paragraph(department or 'Без отдела', section_style)
+        employees = iter(employees)
+        while True:
+            chunk = [
+                [full_name or '', position or '', _phone(internal), _phone(common), _phone(city), email or '']
+                for _, full_name, position, internal, common, city, email in islice(employees, CHUNK_ROWS)
+            ]
+            if not chunk:
+                break
+            yield Table([HEADER] + chunk, colWidths=COL_WIDTHS, repeatRows=1, style=style)
+
+
+def _draw_page_number(canvas, doc):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 8)
+    canvas.drawRightString(doc.pagesize[0] - doc.rightMargin, 15, str(doc.page))
+    canvas.restoreState()
+
+
+def render_pdf(rows):
+    """
+    Строит PDF по итератору строк
+    (отдел, ФИО, должность, внутр., общ., городской, email), отсортированных по отделу.
+    Возвращает содержимое файла.
+    """
+    font_name = register_font()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=landscape(A4), topMargin=30, bottomMargin=30,
+                            title='Телефонный справочник')
+    doc.build(_FlowableStream(_flowables(rows, font_name)),
+              onFirstPage=_draw_page_number, onLaterPages=_draw_page_number)
+    return buffer.getvalue()
@@ -0,0 +1,110 @@
+"""
+Индекс телефонов сотрудников для поиска и определения звонящего.
+
+Номера хранятся в employee как свободный текст ("+7 (727) 276-89-91",
+"903321", "100"). Таблица employee_phone держит по строке на каждый
+заполненный номер: только цифры и те же цифры в обратном порядке. Поиск по
+префиксу цифр - диапазон по индексу digits, поиск по окончанию номера
+(последние цифры городского) - диапазон по индексу reversed_digits. Таблица
+поддерживается триггерами на employee (шаг 4 в migrations.py). Нормализация в
+триггерах написана на чистом SQL, без функций Python: запись в employee из
+консоли sqlite3 или сторонней программы тоже обновляет индекс.
+"""
+
+import re
+
+from sqlalchemy import Integer, bindparam, text
+
+PHONE_TABLE = 'employee_phone'
+
+# Короче этого окончание номера не ищется: слишком много совпадений
+MIN_SUFFIX_DIGITS = 4
+# Сохраненный номер считается окончанием набранного, только если он не короче
+# городского без кода: иначе внутренние номера совпадали бы с хвостами внешних
+MIN_LOCAL_DIGITS = 6
+# Символы, которые допускаются в поисковой строке, похожей на номер
+_PHONE_LIKE_RE = re.compile(r'[\d\s\-()+.]+')
+# Только ASCII-цифры, как в SQL-версии (\D пропустил бы цифры других алфавитов)
+_NON_DIGITS_RE = re.compile(r'[^0-9]+')
+
+
+def digits(value):
+    """
+    Только цифры номера; хвост .0 от числовых ячеек Excel отбрасывается,
+    междугородний префикс 8 приводится к коду страны 7 (8 727 ... = +7 727 ...).
+    """
+    if value is None:
+        return ''
+    # Те же пробельные символы, что убирает trim() в триггерах
+    value = str(value).strip(' \t\n\r')
+    if value.endswith('.0'):
+        value = value[:-2]
+    value = _NON_DIGITS_RE.sub('', value)
+    if len(value) == 11 and value.startswith('8'):
+        value = '7' + value[1:]
+    return value
+
+
+def reversed_digits(value):
+    return digits(value)[::-1]
+
+
+def is_phone_like(term):
+    """Строка из цифр и разделителей номера, в которой не меньше трех цифр."""
+    return bool(_PHONE_LIKE_RE.fullmatch(term.strip())) and len(digits(term)) >= 3
+
+
+def is_supported(engine):
+    return engine.dialect.name == 'sqlite'
+
+
+def _range_end(value):
+    # ':' идет в ASCII сразу за '9': [value, value:) - все строки с префиксом value
+    return value + ':'
+
+
+def search_subquery(term):
+    """Подзапрос id сотрудников, у которых номер начинается или заканчивается цифрами term."""
+    number = digits(term)
+    reverse = number[::-1]
+    return text(
+        f'SELECT employee_id AS id FROM {PHONE_TABLE} WHERE digits >= :number AND digits < :number_end '
+        f'UNION SELECT employee_id FROM {PHONE_TABLE} '
+        f'WHERE reversed_digits >= :reverse AND reversed_digits < :reverse_end'
+    ).bindparams(
+        number=number, number_end=_range_end(number), reverse=reverse, reverse_end=_range_end(reverse)
+    ).columns(id=Integer).subquery()
+
+
+def lookup(connection, number, columns, limit=20):
+    """
+    Определение звонящего по номеру. Возвращает строки с колонками employee
+    columns и полями phone_field, match: exact - номер совпал целиком, suffix -
+    совпало окончание, когда один номер записан короче другого (звонят с
+    +7 727 276-89-91, в справочнике 2768991; или ищут по последним цифрам 8991).
+    Сначала точные, затем по длине совпадения. Каждая ветка запроса - поиск по
+    индексу reversed_digits, без просмотра таблицы.
+    """
+    number = digits(number)
+    reverse = number[::-1]
+    # Точное совпадение и сохраненные номера, которые являются окончанием набранного:
+    # их reversed_digits - префиксы reverse
+    candidates = [reverse] + [reverse[:length] for length in range(MIN_LOCAL_DIGITS, len(reverse))]
+    sql = (f'SELECT employee_id, kind, digits FROM {PHONE_TABLE} '
+           f'WHERE reversed_digits IN :candidates')
+    params = {'candidates': candidates, 'limit': limit}
+    if len(number) >= MIN_SUFFIX_DIGITS:
+        # Набранный номер - окончание сохраненных (например, последние цифры городского)
+        sql += (f' UNION SELECT * FROM (SELECT employee_id, kind, digits FROM {PHONE_TABLE} '
+                f'WHERE reversed_digits > :reverse AND reversed_digits < :reverse_end LIMIT :limit)')
+        params.update(reverse=reverse, reverse_end=_range_end(reverse))
+    selected = ', '.join(f'e.{column}' for column in columns)
+    statement = text(
+        f'SELECT {selected}, p.kind AS phone_field, '
+        f"CASE WHEN p.digits = :number THEN 'exact' ELSE 'suffix' END AS match "
+        f'FROM ({sql}) p JOIN employee e ON e.id = p.employee_id '
+        # Точные совпадения первыми, затем чем длиннее совпавшая часть, тем выше
+        f'ORDER BY p.digits != :number, min(length(p.digits), :length) DESC, e.id LIMIT :limit'
+    ).bindparams(bindparam('candidates', expanding=True))
+    params.update(number=number, length=len(number))
+    return connection.execute(statement, params).all()
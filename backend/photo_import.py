@@ -0,0 +1,233 @@
+"""
+Массовая загрузка фотографий сотрудников из ZIP-архива.
+
+Имя файла в архиве определяет сотрудника: число - id, строка с @ - email,
+остальное - ФИО (подчеркивания считаются пробелами). Сначала читается только
+оглавление архива, и все имена сопоставляются с сотрудниками несколькими
+запросами IN. Затем файлы читаются по одному и декодируются в пуле процессов
+(по процессу на ядро): Pillow держит GIL, потоки не дали бы параллельности.
+В работе одновременно не больше двух файлов на процесс, поэтому память не
+зависит от размера архива. Миниатюры пишет родительский процесс, а ссылки на
+фото у всех сотрудников меняются одной транзакцией в конце.
+"""
+
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from sqlalchemy import func, select, update
+
+import cache
+import photos
+
+MODE = 'photos'
+EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+# Ограничение на число файлов в архиве
+MAX_ENTRIES = 10000
+# Размер пакета значений в запросах сопоставления
+MATCH_CHUNK_SIZE = 500
+# Сколько файлов на процесс передается в пул заранее
+IN_FLIGHT_PER_WORKER = 2
+# Ход задачи сохраняется через столько обработанных файлов
+PROGRESS_EVERY = 100
+# Флаг UTF-8 в заголовке ZIP; без него имена записаны в кодировке DOS
+UTF8_FLAG = 0x800
+
+_SPACES_RE = re.compile(r'\s+')
+
+
+def entry_name(info):
+    """Имя файла из архива; архиваторы Windows пишут кириллицу в cp866, а zipfile читает ее как cp437."""
+    name = info.filename
+    if not info.flag_bits & UTF8_FLAG:
+        try:
+            name = name.encode('cp437').decode('cp866')
+        except UnicodeError:
+            pass
+    return name
+
+
+def parse_name(name):
+    """
+    Ключ сотрудника по имени файла: ('id', 12), ('email', 'a@b.kz'),
+    ('full_name', 'Иванов Иван') или None, если имя пустое.
+    """
+    stem = os.path.splitext(os.path.basename(name))[0].strip()
+    if stem.isdigit():
+        return 'id', int(stem)
+    if '@' in stem:
+        return 'email', stem.lower()
+    stem = _SPACES_RE.sub(' ', stem.replace('_', ' ')).strip()
+    return ('full_name', stem) if stem else None
+
+
+def read_entries(archive):
+    """
+    Файлы архива: (изображения, прочие). Каталоги, служебные файлы macOS и
+    скрытые файлы пропускаются молча.
+    """
+    images, other = [], []
+    for info in archive.infolist():
+        name = entry_name(info)
+        base = os.path.basename(name.rstrip('/'))
+        if info.is_dir() or name.startswith('__MACOSX/') or base.startswith('.'):
+            continue
+        (images if name.lower().endswith(EXTENSIONS) else other).append((info, name))
+    if len(images) + len(other) > MAX_ENTRIES:
+        raise ValueError(f'В архиве больше {MAX_ENTRIES} файлов')
+    return images, other
+
+
+def _chunks(values, size=MATCH_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def match_employees(session, model, keys):
+    """
+    Сопоставляет ключи из parse_name с сотрудниками.
+    Возвращает {ключ: [(id, photo), ...]}; ключи без совпадений отсутствуют.
+    """
+    wanted = {}
+    for kind, value in keys:
+        wanted.setdefault(kind, set()).add(value)
+    found = {}
+    # Email из имени файла уже в нижнем регистре, в базе - как ввели
+    columns = {'id': model.id, 'email': func.lower(model.email), 'full_name': model.full_name}
+    for kind, values in wanted.items():
+        column = columns[kind]
+        for chunk in _chunks(values):
+            rows = session.execute(
+                select(model.id, model.photo, column.label('value')).where(column.in_(chunk))
+            )
+            for row in rows:
+                found.setdefault((kind, row.value), []).append((row.id, row.photo))
+    return found
+
+
+def _lower_priority():
+    # Декодирование не должно отнимать процессор у воркеров, отвечающих на запросы
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+
+def create_pool(max_workers):
+    """
+    Пул процессов для декодирования. Процессы запускаются через forkserver
+    (или spawn): fork из многопоточного воркера копирует захваченные блокировки.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                               initializer=_lower_priority)
+
+
+def import_archive(session, model, path, folder, max_workers=None, progress=None):
+    """
+    Загружает фото из архива path в каталог folder и назначает их сотрудникам.
+    Возвращает сводку: updated, unchanged, failed, skipped, ошибки и отчет по
+    каждому файлу (files).
+
+    progress(summary, processed) вызывается через каждые PROGRESS_EVERY файлов;
+    чтобы прервать загрузку, он может выбросить исключение - ссылки на фото
+    тогда не меняются.
+    """
+    with zipfile.ZipFile(path) as archive:
+        images, other = read_entries(archive)
+        summary = {'total': len(images), 'updated': 0, 'unchanged': 0, 'failed': 0,
+                   'skipped': len(other), 'errors': [], 'files': []}
+        reports = {name: {'file': name, 'status': 'skipped', 'employee_id': None,
+                          'reason': 'Не изображение'} for _, name in other}
+
+        def fail(name, reason, employee_id=None):
+            reports[name] = {'file': name, 'status': 'failed', 'employee_id': employee_id,
+                             'reason': reason}
+            summary['failed'] += 1
+            summary['errors'].append({'file': name, 'reason': reason})
+
+        # Сопоставление всех имен до чтения файлов
+        keys = {name: parse_name(name) for _, name in images}
+        matches = match_employees(session, model, {key for key in keys.values() if key})
+        by_employee = {}
+        for info, name in images:
+            found = matches.get(keys[name], []) if keys[name] else []
+            if not found:
+                fail(name, 'Сотрудник не найден')
+            elif len(found) > 1:
+                fail(name, f'Подходит несколько сотрудников: {len(found)}')
+            elif info.file_size > photos.MAX_BYTES:
+                fail(name, 'Файл слишком большой', found[0][0])
+            else:
+                by_employee.setdefault(found[0], []).append((info, name))
+        tasks = []
+        for (employee_id, photo), entries in by_employee.items():
+            if len(entries) > 1:
+                for _, name in entries:
+                    fail(name, 'Несколько файлов для одного сотрудника', employee_id)
+            else:
+                tasks.append((entries[0][0], entries[0][1], employee_id, photo))
+
+        processed = summary['failed']
+        if progress:
+            progress(summary, processed)
+        changes = []
+        workers = min(max_workers or os.cpu_count(), len(tasks)) or 1
+        pool = create_pool(workers)
+        try:
+            limit = workers * IN_FLIGHT_PER_WORKER
+            running = {}
+            queue = iter(tasks)
+            while True:
+                # Очередь пула пополняется по мере готовности: в памяти не больше limit файлов
+                for task in queue:
+                    with archive.open(task[0]) as f:
+                        data = f.read(photos.MAX_BYTES + 1)
+                    running[pool.submit(photos.process_image, data)] = task
+                    if len(running) >= limit:
+                        break
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    _, name, employee_id, photo = running.pop(future)
+                    try:
+                        digest, variants = future.result()
+                    except photos.InvalidImage as e:
+                        fail(name, str(e), employee_id)
+                    else:
+                        photos.store(folder, digest, variants)
+                        status = 'unchanged' if digest == photo else 'updated'
+                        summary[status] += 1
+                        reports[name] = {'file': name, 'status': status,
+                                         'employee_id': employee_id, 'reason': None}
+                        if status == 'updated':
+                            changes.append({'id': employee_id, 'photo': digest})
+                    processed += 1
+                    if progress and processed % PROGRESS_EVERY == 0:
+                        progress(summary, processed)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    # Все сотрудники получают новые фото одной транзакцией
+    if changes:
+        session.execute(update(model), changes)
+        cache.bump_version(session)
+        session.commit()
+    # Отчет в порядке файлов в архиве
+    summary['files'] = [reports[name] for _, name in images + other]
+    return summary
+
+
+def summary_message(summary):
+    """Краткое описание результата загрузки для пользователя."""
+    message = f'Загружено фото: {summary["updated"]}'
+    if summary['unchanged']:
+        message += f', без изменений {summary["unchanged"]}'
+    if summary['failed']:
+        message += f', с ошибками {summary["failed"]}'
+    if summary['skipped']:
+        message += f', пропущено файлов {summary["skipped"]}'
+    return message
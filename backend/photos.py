@@ -0,0 +1,92 @@
+"""
+Обработка фотографий сотрудников.
+
+Загруженное изображение декодируется один раз, поворачивается по EXIF,
+обрезается до квадрата и сохраняется в нескольких размерах в формате WebP
+без метаданных. Имя файлов - хэш исходного содержимого, поэтому одинаковые
+загрузки не дублируются, разные не перезаписывают друг друга, а ответы можно
+кэшировать навсегда.
+"""
+
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+# Размеры миниатюр (сторона квадрата в пикселях)
+SIZES = (32, 64, 128, 256)
+DEFAULT_SIZE = 64
+EXTENSION = 'webp'
+QUALITY = 80
+
+# Ограничения на входной файл
+MAX_BYTES = int(os.getenv('PHOTO_MAX_BYTES', 10 * 1024 * 1024))
+MAX_PIXELS = 40_000_000
+
+DIGEST_LENGTH = 20
+_DIGEST_RE = re.compile(rf'[0-9a-f]{{{DIGEST_LENGTH}}}')
+
+
+class InvalidImage(ValueError):
+    """Файл не является поддерживаемым изображением."""
+
+
+def is_digest(name):
+    return bool(_DIGEST_RE.fullmatch(name))
+
+
+def pick_size(requested):
+    """Ближайший размер не меньше запрошенного (или самый большой)."""
+    if not requested:
+        return DEFAULT_SIZE
+    return next((size for size in SIZES if size >= requested), SIZES[-1])
+
+
+def variant_name(digest, size):
+    return f'{digest}_{size}.{EXTENSION}'
+
+
+def process_image(data):
+    """
+    Декодирует изображение и готовит миниатюры.
+    Возвращает (хэш, {размер: байты WebP}).
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    if len(data) > MAX_BYTES:
+        raise InvalidImage('Файл слишком большой')
+
+    digest = hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            # Для JPEG декодер сразу уменьшает изображение кратно 1/2..1/8
+            source.draft('RGB', (SIZES[-1] * 2, SIZES[-1] * 2))
+            image = ImageOps.exif_transpose(source)
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise InvalidImage('Не удалось прочитать изображение')
+
+    variants = {}
+    # От большего к меньшему: каждый размер уменьшается из предыдущего, а не из оригинала
+    for size in sorted(SIZES, reverse=True):
+        image = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        # EXIF и прочие метаданные не передаются в save(), поэтому не сохраняются
+        image.save(buffer, 'WEBP', quality=QUALITY, method=4)
+        variants[size] = buffer.getvalue()
+    return digest, variants
+
+
+def store(folder, digest, variants):
+    """Записывает миниатюры в каталог; уже существующие файлы не перезаписываются."""
+    os.makedirs(folder, exist_ok=True)
+    for size, content in variants.items():
+        path = os.path.join(folder, variant_name(digest, size))
+        if os.path.exists(path):
+            continue
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as target:
+            target.write(content)
+        os.replace(tmp_path, path)
@@ -0,0 +1,73 @@
+"""
+Полнотекстовый индекс сотрудников на SQLite FTS5.
+
+Индекс хранится в отдельной виртуальной таблице и поддерживается триггерами
+на таблице employee, поэтому любые пути записи (CRUD, импорт, ручные правки
+через SQL) сразу отражаются в поиске.
+"""
+
+import re
+
+from sqlalchemy import Float, Integer, text
+
+FTS_TABLE = 'employee_fts'
+
+# Колонки, участвующие в поиске, и их веса для ранжирования bm25
+FTS_COLUMNS = (
+    ('full_name', 10.0),
+    ('department', 3.0),
+    ('position', 4.0),
+    ('internal_phone', 2.0),
+    ('common_phone', 1.0),
+    ('city_phone', 1.0),
+    ('email', 2.0),
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _normalized(prefix, column):
+    # unicode61 приводит кириллицу к нижнему регистру, но не сворачивает ё -> е
+    return f"replace(replace(coalesce({prefix}.{column}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _values(prefix):
+    return ', '.join(_normalized(prefix, name) for name, _ in FTS_COLUMNS)
+
+
+def is_supported(engine):
+    """Проверяет, что база - SQLite с модулем FTS5."""
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.connect() as conn:
+        options = conn.execute(text('PRAGMA compile_options')).scalars().all()
+    return 'ENABLE_FTS5' in options
+
+
+def rebuild(connection):
+    """Полностью перестраивает индекс по таблице employee."""
+    columns = ', '.join(name for name, _ in FTS_COLUMNS)
+    connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('delete-all')"))
+    connection.execute(text(
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) SELECT e.id, {_values('e')} FROM employee e"
+    ))
+
+
+def build_match_query(term):
+    """
+    Превращает пользовательский ввод в безопасный запрос FTS5:
+    каждое слово ищется как префикс, все слова должны присутствовать.
+    Возвращает None, если в строке нет ни одного слова.
+    """
+    term = term.lower().replace('ё', 'е')
+    tokens = _TOKEN_RE.findall(term)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def match_subquery(term):
+    """Подзапрос (rowid, rank) совпадений для соединения с employee."""
+    return text(
+        f'SELECT rowid AS id, rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match'
+    ).bindparams(match=build_match_query(term)).columns(id=Integer, rank=Float).subquery()
@@ -0,0 +1,230 @@
+"""
+Статические снимки справочника для анонимного просмотра.
+
+Публикатор следит за версией справочника (directory_state) и после каждого
+изменения пишет каталог v<версия> со страницами по PAGE_SIZE сотрудников,
+уже отсортированными так же, как их отдает API: весь справочник по ФИО и по
+отделу и каждый отдел по ФИО. Рядом со страницей - сжатая .gz. nginx отдает
+их сам (gzip_static), так что просмотр справочника без входа не доходит до
+Flask и SQLite, а браузер загружает только показываемую страницу. Обратный
+порядок - те же страницы с конца. Всплеск
+изменений (импорт) дает один снимок: публикация ждет QUIET_PERIOD секунд
+без новых изменений, но не дольше MAX_DELAY.
+
+Каталог версии пишется под временным именем и переименовывается (os.replace),
+последним - manifest.json с версией и путями к страницам. Читатель всегда видит либо
+старый, либо новый снимок целиком. Публикатор должен быть один на каталог:
+в Docker это отдельный сервис (flask publish-snapshots --watch).
+"""
+
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import text
+
+import cache
+import change_log
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+FIELDS = ('id', 'department', 'full_name', 'position', 'internal_phone', 'common_phone',
+          'city_phone', 'email', 'photo')
+# Сколько последних версий хранится: клиент мог прочитать манифест перед публикацией
+KEEP_VERSIONS = 3
+# Сотрудников на странице снимка; клиент собирает свою страницу из одной-двух таких
+PAGE_SIZE = 100
+# Сортировки всего справочника, для которых пишутся страницы; остальные идут через API
+SORTS = ('full_name', 'department')
+GZIP_LEVEL = 9
+# Опрос версии и склейка всплесков изменений
+POLL_INTERVAL = 1.0
+QUIET_PERIOD = 2.0
+MAX_DELAY = 30.0
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def _write_atomic(directory, name, write):
+    """Пишет файл через временный и переименование; write(f) получает бинарный файл."""
+    path = os.path.join(directory, name)
+    tmp = os.path.join(directory, f'.{name}.tmp')
+    with open(tmp, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(folder, name, value):
+    """JSON и его .gz для gzip_static; сжатие - один раз при публикации, поэтому максимальное."""
+    data = _dumps(value).encode('utf-8')
+    with open(os.path.join(folder, name), 'wb') as f:
+        f.write(data)
+    with open(os.path.join(folder, f'{name}.gz'), 'wb') as f:
+        f.write(gzip.compress(data, GZIP_LEVEL, mtime=0))
+
+
+def _write_pages(folder, rows):
+    """
+    Делит строки на страницы по PAGE_SIZE: 0.json, 1.json, ... Строки читаются
+    из курсора по мере записи, список целиком в памяти не собирается. У пустого
+    списка одна пустая страница. Возвращает число строк.
+    """
+    os.makedirs(folder)
+    count, page = 0, []
+    for row in rows:
+        page.append(list(row))
+        count += 1
+        if len(page) == PAGE_SIZE:
+            _write_json(folder, f'{count // PAGE_SIZE - 1}.json', page)
+            page = []
+    if page or not count:
+        _write_json(folder, f'{count // PAGE_SIZE}.json', page)
+    return count
+
+
+def _view(path, count):
+    return {'path': path, 'employee_count': count, 'pages': max(1, -(-count // PAGE_SIZE))}
+
+
+def publish(engine, directory, use_change_log=True):
+    """
+    Пишет снимок текущей версии справочника и переключает на него манифест.
+    Все читается в одной транзакции, поэтому снимок согласован с версией.
+    В манифесте и номер журнала изменений: клиент по событию с большим номером
+    понимает, что снимок еще не обновлен. Возвращает манифест.
+    """
+    os.makedirs(directory, exist_ok=True)
+    started = time.perf_counter()
+    with engine.connect() as connection, connection.begin():
+        version = cache.current_version(connection)
+        change_seq = change_log.current_seq(connection) if use_change_log else None
+        name = f'v{version}'
+        tmp = os.path.join(directory, f'.{name}.tmp')
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        columns = ', '.join(FIELDS)
+
+        # Порядок тот же, что у API: значение сортировки, затем id (двоичное сравнение SQLite)
+        views = {}
+        for sort in SORTS:
+            rows = connection.execute(text(f'SELECT {columns} FROM employee ORDER BY {sort}, id'))
+            views[sort] = _view(f'{name}/{sort}', _write_pages(os.path.join(tmp, sort), rows))
+
+        # Отделы: один проход по индексу (department, full_name), страницы по ФИО
+        department_list = []
+        rows = connection.execute(text(
+            f'SELECT {columns} FROM employee WHERE department != \'\' '
+            'ORDER BY department, full_name, id'
+        ))
+        for department, group in groupby(rows, key=lambda row: row.department):
+            path = f'departments/{len(department_list)}'
+            count = _write_pages(os.path.join(tmp, path), group)
+            department_list.append({'name': department, **_view(f'{name}/{path}', count)})
+        _write_json(tmp, 'departments.json', {'version': version, 'departments': department_list})
+
+    # Каталог версии появляется целиком, затем на него переключается манифест
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        os.replace(path, f'{tmp}.old')
+    os.replace(tmp, path)
+    shutil.rmtree(f'{tmp}.old', ignore_errors=True)
+
+    manifest = {
+        'version': version,
+        'change_seq': change_seq,
+        'generated_at': datetime.utcnow().isoformat(),
+        'employee_count': views['full_name']['employee_count'],
+        'page_size': PAGE_SIZE,
+        'columns': FIELDS,
+        'views': views,
+        'departments': f'{name}/departments.json',
+    }
+    _write_atomic(directory, MANIFEST, lambda f: f.write(_dumps(manifest).encode('utf-8')))
+    _remove_old_versions(directory, version)
+    logger.info('Снимок справочника v%s: %d сотрудников за %.0f мс', version,
+                manifest['employee_count'], (time.perf_counter() - started) * 1000)
+    return manifest
+
+
+def _entry_version(name):
+    """
+    Версия из имени каталога снимка (v12 -> 12) или файла прежнего формата
+    (employees-v12.json.gz -> 12); None для остального.
+    """
+    if name.startswith('v') and name[1:].isdigit():
+        return int(name[1:])
+    prefix, _, rest = name.partition('-v')
+    number = rest.split('.')[0]
+    if prefix in ('employees', 'departments') and number.isdigit():
+        return int(number)
+    return None
+
+
+def _remove_old_versions(directory, current):
+    names = {name: _entry_version(name) for name in os.listdir(directory)}
+    versions = {version for version in names.values() if version is not None}
+    keep = set(sorted(versions | {current}, reverse=True)[:KEEP_VERSIONS])
+    for name, version in names.items():
+        if version is not None and version not in keep:
+            path = os.path.join(directory, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+
+class SnapshotPublisher:
+    """Следит за версией справочника и публикует снимки после затишья в изменениях."""
+
+    def __init__(self, engine, directory, use_change_log=True,
+                 poll_interval=POLL_INTERVAL, quiet_period=QUIET_PERIOD, max_delay=MAX_DELAY):
+        self.engine = engine
+        self.directory = directory
+        self.use_change_log = use_change_log
+        self.poll_interval = poll_interval
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        manifest = read_manifest(self.directory)
+        published = manifest['version'] if manifest else None
+        seen, changed_at, pending_since = published, None, None
+        while not self.stopped.is_set():
+            try:
+                with self.engine.connect() as connection:
+                    version = cache.current_version(connection)
+                now = time.monotonic()
+                if version != published:
+                    if version != seen:
+                        seen, changed_at = version, now
+                        pending_since = pending_since or now
+                    if now - changed_at >= self.quiet_period or now - pending_since >= self.max_delay:
+                        published = publish(self.engine, self.directory,
+                                            self.use_change_log)['version']
+                        seen, pending_since = published, None
+            except Exception:
+                logger.exception('Ошибка публикации снимка справочника')
+            self.stopped.wait(self.poll_interval)
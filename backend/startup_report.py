@@ -0,0 +1,109 @@
+"""
+Отчет о времени холодного старта backend.
+
+Каждый замер выполняется в отдельном чистом интерпретаторе: импорт app,
+создание приложения (то, что делает воркер gunicorn при запуске) и самые
+дорогие модули по данным python -X importtime. Тяжелые библиотеки (pandas,
+reportlab, Pillow) при старте загружаться не должны - только на тех запросах,
+которые их используют.
+
+    python startup_report.py [--budget-ms 1000] [--runs 3]
+
+Код возврата 1, если бюджет превышен или при старте загрузилась тяжелая библиотека.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ('pandas', 'numpy', 'reportlab', 'PIL', 'openpyxl')
+DEFAULT_BUDGET_MS = int(os.getenv('STARTUP_BUDGET_MS', 1000))
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'heavy': [name for name in %r if name in sys.modules],
+}))
+''' % (HEAVY_MODULES,)
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(args, env=None):
+    return subprocess.run([sys.executable] + args, cwd=HERE, env=env, check=True,
+                          capture_output=True, text=True)
+
+
+def _probe_env(directory):
+    # create_app() настраивает базу (режим WAL), поэтому замер идет на временной,
+    # а не на рабочей базе из DATABASE_URL или instance/handbook.db
+    return dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(directory, "startup.db")}')
+
+
+def measure(runs):
+    """Лучшее из runs замеров (первый прогон прогревает кэш байткода и ОС)."""
+    with tempfile.TemporaryDirectory(prefix='startup-') as directory:
+        env = _probe_env(directory)
+        results = [json.loads(_run(['-c', _PROBE], env).stdout) for _ in range(runs)]
+    best = min(results, key=lambda r: r['import_ms'] + r['create_app_ms'])
+    best['total_ms'] = best['import_ms'] + best['create_app_ms']
+    return best
+
+
+def slowest_imports(limit):
+    """Прямые импорты модуля app с наибольшим накопленным временем."""
+    with tempfile.TemporaryDirectory(prefix='startup-') as directory:
+        stderr = _run(['-X', 'importtime', '-c', 'import app'], _probe_env(directory)).stderr
+    children, modules = [], []
+    # Вложенные модули печатаются перед родителем, глубина - по отступу в имени
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append((int(cumulative) / 1000, name.strip()))
+        elif depth == 0:
+            if name.strip() == 'app':
+                modules = children
+            children = []
+    return sorted(modules, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время холодного старта backend')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    result = measure(args.runs)
+    print(f'import app:    {result["import_ms"]:7.1f} мс')
+    print(f'create_app():  {result["create_app_ms"]:7.1f} мс')
+    print(f'итого:         {result["total_ms"]:7.1f} мс (бюджет {args.budget_ms:.0f} мс)')
+    print('\nСамые дорогие импорты:')
+    for cumulative_ms, name in slowest_imports(args.top):
+        print(f'  {cumulative_ms:7.1f} мс  {name}')
+
+    failed = False
+    if result['heavy']:
+        print(f'\nОШИБКА: при старте загружены тяжелые модули: {", ".join(result["heavy"])}')
+        failed = True
+    if result['total_ms'] > args.budget_ms:
+        print(f'\nОШИБКА: старт дольше бюджета на {result["total_ms"] - args.budget_ms:.0f} мс')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,393 @@
+"""
+Подсказки для строки поиска: индекс в памяти по ФИО, должностям и отделам.
+
+Каждое слово приводится к "скелету" латиницей: кириллица транслитерируется,
+неоднозначные сочетания сводятся к одному написанию (kh -> h, y -> i, x -> ks),
+поэтому "ivanov", "Иванов" и "иванов" дают одно и то же слово. Слова хранятся
+в отсортированном словаре (поиск по префиксу - bisect) и в индексе
+триграмм (поиск с опечатками). Индекс строится один раз на процесс, затем
+догоняет базу по журналу изменений: перед запросом читаются только новые
+записи журнала, поэтому правки из других воркеров тоже видны.
+"""
+
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+from functools import lru_cache
+
+from sqlalchemy import bindparam, text
+
+import cache
+import change_log
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+MAX_QUERY_TOKENS = 5
+# Сколько документов-кандидатов оценивается на запрос (короткий префикс совпадает с тысячами)
+MAX_CANDIDATES = 2000
+# Слова короче не ищутся с опечатками, ниже этой похожести (Жаккар по триграммам) - не совпадение
+FUZZY_MIN_LENGTH = 4
+FUZZY_MIN_SIMILARITY = 0.3
+# Если с прошлого запроса изменений больше, индекс перестраивается целиком
+MAX_INCREMENTAL_CHANGES = 5000
+# Изменения этих полей затрагивают индекс
+INDEXED_FIELDS = {'full_name', 'position', 'department'}
+
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh',
+    'з': 'z', 'и': 'i', 'й': 'i', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o',
+    'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts',
+    'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'i', 'ь': '', 'э': 'e', 'ю': 'iu',
+    'я': 'ia',
+    # Казахский алфавит
+    'ә': 'a', 'ғ': 'g', 'қ': 'k', 'ң': 'n', 'ө': 'o', 'ұ': 'u', 'ү': 'u', 'һ': 'h', 'і': 'i',
+}
+_TRANSLIT_TABLE = str.maketrans(TRANSLIT)
+# Латинские написания, которые сводятся к одному: Mikhail/Mihail, Sergey/Sergei, Alexandr/Aleksandr
+_LATIN_VARIANTS = (('kh', 'h'), ('x', 'ks'), ('q', 'k'), ('w', 'v'), ('y', 'i'))
+_WORD_RE = re.compile(r'\w+')
+
+KIND_EMPLOYEE = 'employee'
+KIND_DEPARTMENT = 'department'
+KIND_POSITION = 'position'
+# При равной похожести сотрудники выше отделов и должностей
+KIND_BONUS = {KIND_EMPLOYEE: 0.2, KIND_DEPARTMENT: 0.1, KIND_POSITION: 0.0}
+
+Document = namedtuple('Document', 'kind key title tokens')
+
+
+# Имена повторяются: скелет каждого слова считается один раз
+@lru_cache(maxsize=65536)
+def skeleton(word):
+    """Латинский скелет слова: одинаковый для кириллицы, транслита и его вариантов."""
+    word = word.lower().translate(_TRANSLIT_TABLE)
+    for source, target in _LATIN_VARIANTS:
+        word = word.replace(source, target)
+    return word
+
+
+def tokenize(value):
+    return tuple(dict.fromkeys(skeleton(word) for word in _WORD_RE.findall(value or '')))
+
+
+def trigrams(token):
+    padded = f'^{token}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def sort_key(title):
+    # Порядок сотрудников с одинаковой оценкой - по алфавиту, "ё" рядом с "е"
+    return title.lower().replace('ё', 'е')
+
+
+class SuggestIndex:
+    """
+    Индекс подсказок процесса; потокобезопасный.
+
+    Сотрудников десятки тысяч, поэтому их списки по словам хранятся
+    отсортированными по ФИО: лучшие limit находятся без перебора всех
+    совпадений. Отделов и должностей сотни - они оцениваются целиком.
+    """
+
+    def __init__(self, use_change_log=True):
+        # Без журнала изменений (не SQLite) индекс перестраивается при смене версии справочника
+        self.use_change_log = use_change_log
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.ready = False
+        self.last_seq = None
+        self.version = None
+        self._bulk = False
+        self.documents = {}      # (kind, key) -> Document
+        self.employees = {}      # id сотрудника -> (full_name, position, department)
+        self.usage = {}          # (kind, название) -> число сотрудников (для отделов и должностей)
+        self.ranked = {}         # слово -> отсортированный список (sort_key(ФИО), id) сотрудников
+        self.groups = {}         # слово -> множество отделов и должностей
+        self.vocabulary = []     # отсортированные слова
+        self.grams = {}          # триграмма -> множество слов
+
+    # --- построение и обновление ---
+
+    def _add_word(self, token):
+        if self._bulk:
+            self.vocabulary.append(token)
+        else:
+            insort(self.vocabulary, token)
+        for gram in trigrams(token):
+            self.grams.setdefault(gram, set()).add(token)
+
+    def _drop_word_if_unused(self, token):
+        if token in self.ranked or token in self.groups:
+            return
+        del self.vocabulary[bisect_left(self.vocabulary, token)]
+        for gram in trigrams(token):
+            tokens = self.grams[gram]
+            tokens.discard(token)
+            if not tokens:
+                del self.grams[gram]
+
+    def _add_document(self, kind, key, title):
+        doc_id = (kind, key)
+        document = Document(kind, key, title, tokenize(title))
+        self.documents[doc_id] = document
+        entry = (sort_key(title), key)
+        for token in document.tokens:
+            if token not in self.ranked and token not in self.groups:
+                self._add_word(token)
+            if kind == KIND_EMPLOYEE:
+                entries = self.ranked.setdefault(token, [])
+                if self._bulk:
+                    entries.append(entry)
+                else:
+                    insort(entries, entry)
+            else:
+                self.groups.setdefault(token, set()).add(doc_id)
+
+    def _remove_document(self, doc_id):
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        entry = (sort_key(document.title), document.key)
+        for token in document.tokens:
+            if document.kind == KIND_EMPLOYEE:
+                entries = self.ranked[token]
+                del entries[bisect_left(entries, entry)]
+                if not entries:
+                    del self.ranked[token]
+            else:
+                docs = self.groups[token]
+                docs.discard(doc_id)
+                if not docs:
+                    del self.groups[token]
+            self._drop_word_if_unused(token)
+
+    def _use(self, kind, name, delta):
+        # Отделы и должности - отдельные документы, пока есть хоть один сотрудник с ними
+        if not name:
+            return
+        doc_id = (kind, name)
+        count = self.usage.get(doc_id, 0) + delta
+        if count > 0:
+            self.usage[doc_id] = count
+            if doc_id not in self.documents:
+                self._add_document(kind, name, name)
+        else:
+            self.usage.pop(doc_id, None)
+            self._remove_document(doc_id)
+
+    def _put_employee(self, employee_id, full_name, position, department):
+        self._drop_employee(employee_id)
+        self.employees[employee_id] = (full_name, position, department)
+        self._add_document(KIND_EMPLOYEE, employee_id, full_name)
+        self._use(KIND_POSITION, position, 1)
+        self._use(KIND_DEPARTMENT, department, 1)
+
+    def _drop_employee(self, employee_id):
+        previous = self.employees.pop(employee_id, None)
+        if previous is None:
+            return
+        _, position, department = previous
+        self._remove_document((KIND_EMPLOYEE, employee_id))
+        self._use(KIND_POSITION, position, -1)
+        self._use(KIND_DEPARTMENT, department, -1)
+
+    def rebuild(self, connection):
+        """Строит индекс по всей таблице employee."""
+        started = time.perf_counter()
+        with self._lock:
+            self._reset()
+            # Номер журнала читается до сотрудников: изменения между чтениями догонит refresh
+            if self.use_change_log:
+                self.last_seq = change_log.current_seq(connection)
+            else:
+                self.version = cache.current_version(connection)
+            # Списки дописываются в конец и сортируются один раз в конце
+            self._bulk = True
+            for row in connection.execute(text(
+                'SELECT id, full_name, position, department FROM employee'
+            )):
+                self._put_employee(*row)
+            self.vocabulary.sort()
+            for entries in self.ranked.values():
+                entries.sort()
+            self._bulk = False
+            self.ready = True
+        logger.info('Индекс подсказок: %d сотрудников, %d слов за %.0f мс', len(self.employees),
+                    len(self.vocabulary), (time.perf_counter() - started) * 1000)
+
+    def refresh(self, connection):
+        """
+        Приводит индекс к состоянию базы: при первом вызове строит его, затем
+        применяет новые записи журнала изменений (или перестраивает, если
+        журнала нет, а версия справочника изменилась).
+        """
+        with self._lock:
+            if not self.ready:
+                self.rebuild(connection)
+                return
+            if not self.use_change_log:
+                if cache.current_version(connection) != self.version:
+                    self.rebuild(connection)
+                return
+            events = change_log.events_since(connection, self.last_seq, MAX_INCREMENTAL_CHANGES + 1)
+            if not events:
+                return
+            if len(events) > MAX_INCREMENTAL_CHANGES:
+                self.rebuild(connection)
+                return
+            ids = {event.employee_id for event in events
+                   if event.op != 'update' or not event.fields
+                   or INDEXED_FIELDS.intersection(event.fields.split(','))}
+            if ids:
+                rows = {row.id: row for row in connection.execute(
+                    text('SELECT id, full_name, position, department FROM employee WHERE id IN :ids')
+                    .bindparams(bindparam('ids', expanding=True)), {'ids': list(ids)}
+                )}
+                for employee_id in ids:
+                    row = rows.get(employee_id)
+                    if row is None:
+                        self._drop_employee(employee_id)
+                    else:
+                        self._put_employee(*row)
+            self.last_seq = events[-1].seq
+
+    # --- поиск ---
+
+    def _matches(self, token, limit):
+        """Слова словаря, подходящие к слову запроса: {слово: оценка от 0 до 1}."""
+        matches = {}
+        vocabulary = self.vocabulary
+        # По индексу от позиции bisect: срез скопировал бы весь хвост словаря
+        for index in range(bisect_left(vocabulary, token), len(vocabulary)):
+            word = vocabulary[index]
+            if not word.startswith(token):
+                break
+            # Точное совпадение - 1, продолжение слова - тем выше, чем меньше дописано
+            matches[word] = 1.0 if word == token else 0.5 + 0.4 * len(token) / len(word)
+        if len(matches) < limit and len(token) >= FUZZY_MIN_LENGTH:
+            query_grams = trigrams(token)
+            shared = {}
+            for gram in query_grams:
+                for word in self.grams.get(gram, ()):
+                    shared[word] = shared.get(word, 0) + 1
+            for word, count in shared.items():
+                # Жаккар: у слова длины n ровно n триграмм с учетом границ
+                similarity = count / (len(query_grams) + len(word) - count)
+                if similarity >= FUZZY_MIN_SIMILARITY and word not in matches:
+                    matches[word] = 0.5 * similarity
+        return matches
+
+    @staticmethod
+    def _rest_score(tokens, matched, driver):
+        """Сумма оценок остальных слов запроса по словам документа; 0 - какое-то слово не совпало."""
+        total = 0.0
+        for position, words in enumerate(matched):
+            if position == driver:
+                continue
+            best = max((words.get(token, 0.0) for token in tokens), default=0.0)
+            if not best:
+                return 0.0
+            total += best
+        return total
+
+    def _top_employees(self, matched, driver, limit):
+        """
+        Лучшие сотрудники: слова ведущего слова запроса перебираются по убыванию
+        оценки, внутри оценки - слиянием списков по алфавиту. Перебор
+        останавливается, когда оставшиеся сотрудники не могут обойти набранных.
+        """
+        count = len(matched)
+        by_score = {}
+        for word, score in matched[driver].items():
+            if word in self.ranked:
+                by_score.setdefault(score, []).append(self.ranked[word])
+        top, seen, order, scanned = [], set(), 0, 0
+        for score in sorted(by_score, reverse=True):
+            # Больше этой итоговой оценки у оставшихся сотрудников быть не может
+            bound = (score + count - 1) / count
+            if len(top) >= limit and top[0][0] >= bound:
+                break
+            for _, employee_id in heapq.merge(*by_score[score]):
+                if employee_id in seen:
+                    continue
+                seen.add(employee_id)
+                total = score
+                if count > 1:
+                    scanned += 1
+                    rest = self._rest_score(self.documents[(KIND_EMPLOYEE, employee_id)].tokens,
+                                            matched, driver)
+                    if not rest:
+                        if scanned >= MAX_CANDIDATES:
+                            break
+                        continue
+                    total += rest
+                total /= count
+                # Куча из limit лучших; при равной оценке вытесняется позже найденный (дальше по алфавиту)
+                order += 1
+                item = (total, -order, employee_id)
+                if len(top) < limit:
+                    heapq.heappush(top, item)
+                elif item > top[0]:
+                    heapq.heapreplace(top, item)
+                if (len(top) >= limit and top[0][0] >= bound) or scanned >= MAX_CANDIDATES:
+                    break
+            if scanned >= MAX_CANDIDATES:
+                break
+        return [(total + KIND_BONUS[KIND_EMPLOYEE], 0, -order, (KIND_EMPLOYEE, employee_id))
+                for total, order, employee_id in top]
+
+    def _top_groups(self, matched, driver):
+        """Все подходящие отделы и должности с оценками."""
+        count = len(matched)
+        scores = {}
+        for word, score in matched[driver].items():
+            for doc_id in self.groups.get(word, ()):
+                if scores.get(doc_id, -1) < score:
+                    scores[doc_id] = score
+        found = []
+        for doc_id, score in scores.items():
+            total = score
+            if count > 1:
+                rest = self._rest_score(self.documents[doc_id].tokens, matched, driver)
+                if not rest:
+                    continue
+                total += rest
+            total = total / count + KIND_BONUS[doc_id[0]]
+            found.append((total, self.usage.get(doc_id, 0), sort_key(doc_id[1]), doc_id))
+        return found
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """Лучшие limit документов: все слова запроса должны совпасть (префиксом или с опечаткой)."""
+        tokens = tokenize(query)[:MAX_QUERY_TOKENS]
+        if not tokens:
+            return []
+        with self._lock:
+            matched = [self._matches(token, limit) for token in tokens]
+            if not all(matched):
+                return []
+            # Перебор идет по самому редкому слову запроса, остальные проверяются по документу
+            sizes = [sum(len(self.ranked.get(word, ())) + len(self.groups.get(word, ()))
+                         for word in words) for words in matched]
+            driver = min(range(len(tokens)), key=sizes.__getitem__)
+            found = self._top_employees(matched, driver, limit) + self._top_groups(matched, driver)
+            # Выше оценка, затем численность (для отделов и должностей), затем алфавит
+            found.sort(key=lambda item: (-item[0], -item[1], item[2]))
+            return [self._item(doc_id, score) for score, _, _, doc_id in found[:limit]]
+
+    def _item(self, doc_id, score):
+        kind, key = doc_id
+        item = {'type': kind, 'score': round(score, 3)}
+        if kind == KIND_EMPLOYEE:
+            full_name, position, department = self.employees[key]
+            item.update(id=key, full_name=full_name, position=position, department=department)
+        else:
+            item.update(value=key, employee_count=self.usage.get(doc_id, 0))
+        return item
@@ -0,0 +1,85 @@
+"""Проверки API справочника на временной базе."""
+
+from datetime import datetime
+
+import pytest
+
+from app import create_app, init_db
+from models import Employee, db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'UPLOADED_PHOTOS_DEST': str(tmp_path / 'photos'),
+    })
+    init_db(app)
+    with app.app_context():
+        db.session.add_all([
+            Employee(department='Бухгалтерия', full_name=f'Сотрудник {i}', position='Бухгалтер',
+                     city_phone=f'8 (727) 276-89-{i:02d}')
+            for i in range(30)
+        ])
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def test_employees_order(client):
+    ids = [row['id'] for row in client.get('/api/employees?order=desc').get_json()]
+    assert ids == sorted(ids, reverse=True)
+    response = client.get('/api/employees?order=down')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_large_pdf_served_from_cache(client, monkeypatch, tmp_path):
+    import app as app_module
+    import pdf_export
+    monkeypatch.setattr(app_module.pdf_cache, 'directory', str(tmp_path / 'pdf'))
+    calls = []
+
+    def render_pdf(rows):
+        calls.append(len(list(rows)))
+        # Больше прежнего предела записи в памяти (4 МБ), как PDF полного справочника
+        return b'%PDF-1.4\n' + b'0' * (6 * 1024 * 1024)
+
+    monkeypatch.setattr(pdf_export, 'render_pdf', render_pdf)
+    first = client.get('/api/export/pdf', headers={'Accept-Encoding': 'gzip'})
+    second = client.get('/api/export/pdf', headers={'Accept-Encoding': 'gzip'})
+    assert first.status_code == second.status_code == 200
+    assert calls == [30]
+    assert second.data == first.data
+    assert second.headers['Content-Disposition'] == first.headers['Content-Disposition']
+
+
+def test_token_revoked_by_another_worker(app, client):
+    import auth
+    from app import auth_cache
+    from models import ApiToken, User
+
+    with app.app_context():
+        user = User(username='sync', password_hash='-')
+        db.session.add(user)
+        db.session.commit()
+        record, token = auth.issue_token(db.session, ApiToken, user.id, 'sync')
+        token_id = record.id
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/tokens', headers=headers).status_code == 200
+
+    # Неизвестный токен не занимает место в кэше
+    size = len(auth_cache)
+    assert client.get('/api/tokens', headers={'Authorization': 'Bearer hb_unknown'}).status_code == 401
+    assert len(auth_cache) == size
+
+    # Отзыв в другом процессе: кэш этого процесса не сбрасывается
+    with app.app_context():
+        db.session.get(ApiToken, token_id).revoked_at = datetime.utcnow()
+        auth.bump_revocations(db.session)
+        db.session.commit()
+    assert client.get('/api/tokens', headers=headers).status_code == 401
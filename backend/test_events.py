@@ -0,0 +1,49 @@
+"""Доставка уведомлений из журнала изменений подписчикам."""
+
+import queue
+
+import pytest
+
+import change_log
+import events
+from app import create_app, init_db
+from models import Employee, db
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'UPLOADED_PHOTOS_DEST': str(tmp_path / 'photos'),
+    })
+    init_db(app)
+    return app
+
+
+def test_subscriber_added_during_poll_gets_rows(app, monkeypatch):
+    with app.app_context():
+        broker = events.EventBroker(db.engine, poll_interval=0.05)
+        events_since = change_log.events_since
+        late = []
+
+        def read_and_subscribe(connection, since, limit):
+            rows = events_since(connection, since, limit)
+            if rows and not late:
+                # Клиент подписался, пока опросчик читал журнал
+                late.append(broker.subscribe())
+            return rows
+
+        monkeypatch.setattr(change_log, 'events_since', read_and_subscribe)
+        first = broker.subscribe()
+        broker.start(first, change_log.current_seq(db.session))
+        try:
+            db.session.add(Employee(department='Бухгалтерия', full_name='Сотрудник', position='Бухгалтер'))
+            db.session.commit()
+            broker.wake()
+            row = first.queue.get(timeout=5)
+            assert late[0].queue.get(timeout=5).seq == row.seq
+        except queue.Empty:
+            pytest.fail('Событие не доставлено')
+        finally:
+            for subscriber in [first] + late:
+                broker.unsubscribe(subscriber)
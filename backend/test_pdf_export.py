@@ -1,8 +1,11 @@
 import sys
 sys.path.append('.')
-from app import app, Employee
+from app import create_app
+from models import Employee
 import io
 
+app = create_app()
+
 with app.app_context():
     try:
         print('Проверка экспорта PDF...')
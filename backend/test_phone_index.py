@@ -0,0 +1,60 @@
+"""Нормализация номеров в триггерах employee_phone совпадает с phone_index.digits()."""
+
+import sqlite3
+
+import pytest
+
+import phone_index
+from app import create_app, init_db
+
+PHONES = [
+    '+7 (727) 276-89-91',
+    '8 727 276 89 91',
+    '8(727)2768991',
+    '+7 ٣٤٥ 12-34',
+    '276-89-91 доб. 123',
+    'вн. 100',
+    '100.0',
+    '2768991.0',
+    ' \t903321\n',
+    '+',
+    '',
+    'нет',
+]
+
+
+@pytest.fixture
+def connection(tmp_path):
+    path = tmp_path / 'test.db'
+    init_db(create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'UPLOADED_PHOTOS_DEST': str(tmp_path / 'photos'),
+    }))
+    # Без приложения, как из консоли sqlite3
+    connection = sqlite3.connect(path)
+    yield connection
+    connection.close()
+
+
+def _indexed(connection, employee_id):
+    return connection.execute(
+        'SELECT digits, reversed_digits FROM employee_phone WHERE employee_id = ?', (employee_id,)
+    ).fetchall()
+
+
+def _expected(phone):
+    number = phone_index.digits(phone)
+    return [(number, number[::-1])] if number else []
+
+
+@pytest.mark.parametrize('phone', PHONES)
+def test_trigger_matches_digits(connection, phone):
+    employee_id = connection.execute(
+        "INSERT INTO employee (department, full_name, position, city_phone) "
+        "VALUES ('Бухгалтерия', 'Сотрудник', 'Бухгалтер', ?)", (phone,)
+    ).lastrowid
+    assert _indexed(connection, employee_id) == _expected(phone)
+
+    connection.execute('UPDATE employee SET city_phone = NULL, internal_phone = ? WHERE id = ?',
+                       (phone, employee_id))
+    assert _indexed(connection, employee_id) == _expected(phone)
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import {
   Paper,
   Box,
@@ -15,7 +15,10 @@ import {
   Grid,
   Card,
   CardContent,
-  CardActions
+  CardActions,
+  FormControlLabel,
+  Checkbox,
+  LinearProgress
 } from '@mui/material'
 import { Add, Edit, Delete, Upload, CloudUpload } from '@mui/icons-material'
 import EmployeeTable from './EmployeeTable'
@@ -24,9 +27,17 @@ import {
   updateEmployee, 
   deleteEmployee, 
   importData,
+  importPhotos,
+  getImportJob,
+  cancelImportJob,
   uploadPhoto 
 } from '../services/api'
 
+// Интервал опроса статуса фонового импорта, мс
+const IMPORT_POLL_INTERVAL = 1000
+
+const isPhotoArchive = (file) => !!file && file.name.toLowerCase().endsWith('.zip')
+
 const AdminPanel = () => {
   const [employees, setEmployees] = useState([])
   const [dialogOpen, setDialogOpen] = useState(false)
@@ -42,6 +53,11 @@ const AdminPanel = () => {
     email: ''
   })
   const [importFile, setImportFile] = useState(null)
+  const [importUpsert, setImportUpsert] = useState(true)
+  const [importJob, setImportJob] = useState(null)
+  const pollTimer = useRef(null)
+
+  useEffect(() => () => clearTimeout(pollTimer.current), [])
   const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' })
 
   const showSnackbar = (message, severity = 'success') => {
@@ -112,13 +128,41 @@ const AdminPanel = () => {
     }
 
     try {
-      const response = await importData(importFile)
-      showSnackbar(response.data.message)
+      const response = isPhotoArchive(importFile)
+        ? await importPhotos(importFile)
+        : await importData(importFile, { mode: importUpsert ? 'upsert' : 'append' })
+      // Сервер сразу возвращает id задачи, дальше опрашиваем ее статус
+      pollImportJob(response.data.job_id)
+    } catch (error) {
+      showSnackbar(error.response?.data?.error || 'Ошибка импорта', 'error')
+    }
+  }
+
+  const pollImportJob = async (jobId) => {
+    try {
+      const response = await getImportJob(jobId)
+      const job = response.data
+      setImportJob(job)
+      
+      if (job.status === 'queued' || job.status === 'running') {
+        pollTimer.current = setTimeout(() => pollImportJob(jobId), IMPORT_POLL_INTERVAL)
+        return
+      }
+      
+      setImportJob(null)
       setImportOpen(false)
       setImportFile(null)
+      showSnackbar(job.message, job.status === 'done' ? 'success' : 'error')
       window.dispatchEvent(new Event('employeesUpdated'))
     } catch (error) {
-      showSnackbar(error.response?.data?.error || 'Ошибка импорта', 'error')
+      setImportJob(null)
+      showSnackbar('Ошибка получения статуса импорта', 'error')
+    }
+  }
+
+  const handleCancelImport = async () => {
+    if (importJob) {
+      await cancelImportJob(importJob.id)
     }
   }
 
@@ -253,21 +297,53 @@ const AdminPanel = () => {
       </Dialog>
 
       {/* Диалог импорта */}
-      <Dialog open={importOpen} onClose={() => setImportOpen(false)}>
+      <Dialog open={importOpen} onClose={() => !importJob && setImportOpen(false)}>
         <DialogTitle>Импорт данных</DialogTitle>
         <DialogContent>
+          {importJob && (
+            <Box sx={{ mb: 2 }}>
+              <Typography variant="body2" sx={{ mb: 1 }}>
+                {importJob.status === 'queued'
+                  ? 'Импорт ожидает в очереди...'
+                  : `Обработано ${importJob.processed_rows} из ${importJob.total_rows ?? '?'} ${importJob.mode === 'photos' ? 'файлов' : 'строк'}`}
+              </Typography>
+              <LinearProgress
+                variant={importJob.total_rows ? 'determinate' : 'indeterminate'}
+                value={importJob.total_rows ? (100 * importJob.processed_rows) / importJob.total_rows : 0}
+              />
+            </Box>
+          )}
           <Typography variant="body2" sx={{ mb: 2 }}>
-            Поддерживаемые форматы: Excel (.xlsx) и CSV
+            Поддерживаемые форматы: Excel (.xlsx) и CSV, а также ZIP-архив фото
+            с именами файлов по id, email или ФИО сотрудника
           </Typography>
           <input
             type="file"
-            accept=".xlsx,.csv"
+            accept=".xlsx,.csv,.zip"
             onChange={(e) => setImportFile(e.target.files[0])}
           />
+          {!isPhotoArchive(importFile) && (
+            <FormControlLabel
+              sx={{ display: 'block', mt: 2 }}
+              control={
+                <Checkbox
+                  checked={importUpsert}
+                  onChange={(e) => setImportUpsert(e.target.checked)}
+                />
+              }
+              label="Обновлять существующих сотрудников (по ФИО и отделу)"
+            />
+          )}
         </DialogContent>
         <DialogActions>
-          <Button onClick={() => setImportOpen(false)}>Отмена</Button>
-          <Button onClick={handleImport} variant="contained">
+          {importJob ? (
+            <Button onClick={handleCancelImport} disabled={importJob.cancel_requested}>
+              Остановить импорт
+            </Button>
+          ) : (
+            <Button onClick={() => setImportOpen(false)}>Отмена</Button>
+          )}
+          <Button onClick={handleImport} variant="contained" disabled={!!importJob}>
             Импортировать
           </Button>
         </DialogActions>
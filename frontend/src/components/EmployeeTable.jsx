@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react'
+import React, { useState, useEffect, useRef } from 'react'
 import {
   Paper,
   Table,
@@ -8,6 +8,7 @@ import {
   TableHead,
   TableRow,
   TableSortLabel,
+  TablePagination,
   TextField,
   FormControl,
   InputLabel,
@@ -19,45 +20,267 @@ import {
   Chip,
   Avatar,
   IconButton,
-  Tooltip
+  Tooltip,
+  Autocomplete
 } from '@mui/material'
 import { Search, Download, Edit, Delete } from '@mui/icons-material'
-import { getEmployees, getDepartments, exportPDF } from '../services/api'
+import {
+  getEmployees, getEmployeeChanges, getDepartments, getSuggestions, exportPDF, exportUrl,
+  subscribeEvents, getSnapshotManifest, getSnapshotFile,
+} from '../services/api'
+
+// Поля, которые запрашиваются у сервера для таблицы
+const TABLE_FIELDS = 'department,full_name,position,internal_phone,common_phone,city_phone,email,photo'
+// Пауза перед применением изменений с сервера, чтобы собрать их в одну пачку
+const EVENTS_DEBOUNCE_MS = 300
+// Пауза между нажатиями клавиш перед запросом подсказок
+const SUGGEST_DEBOUNCE_MS = 150
+const SUGGESTION_LABELS = { employee: 'Сотрудник', department: 'Отдел', position: 'Должность' }
+// Снимок публикуется через несколько секунд после изменения: как часто и сколько раз
+// проверять манифест, пока в снимок не попадут изменения из событий
+const SNAPSHOT_RETRY_MS = 2000
+const SNAPSHOT_MAX_RETRIES = 30
 
 const EmployeeTable = ({ onEdit, onDelete, onPhotoUpload }) => {
   const [employees, setEmployees] = useState([])
+  const [total, setTotal] = useState(0)
   const [departments, setDepartments] = useState([])
   const [searchTerm, setSearchTerm] = useState('')
   const [selectedDepartment, setSelectedDepartment] = useState('')
+  const [suggestions, setSuggestions] = useState([])
   const [orderBy, setOrderBy] = useState('full_name')
   const [order, setOrder] = useState('asc')
   const [loading, setLoading] = useState(false)
+  // Страница и курсоры keyset-пагинации: cursors[n] - курсор начала страницы n
+  const [page, setPage] = useState(0)
+  const [rowsPerPage, setRowsPerPage] = useState(50)
+  const [cursors, setCursors] = useState([null])
+  const [reloadKey, setReloadKey] = useState(0)
+  // Номер последнего учтенного изменения и текущие фильтры - для обработчика событий
+  const changeSeqRef = useRef(null)
+  const filtersRef = useRef({})
+  const departmentsRef = useRef([])
+  const employeesRef = useRef([])
+  employeesRef.current = employees
+  // Публичный просмотр без поиска читает статический снимок: страницы в нем уже
+  // отсортированы сервером, браузер загружает только показываемую
+  const usesSnapshot = !onEdit && !onDelete
+  const snapshotRef = useRef(null)
+  const snapshotActiveRef = useRef(false)
+  const snapshotFailedRef = useRef(!usesSnapshot)
+  const snapshotTimerRef = useRef(null)
+  // Наибольший номер изменения из событий: снимок с меньшим change_seq устарел
+  const pendingSeqRef = useRef(0)
+
+  // Загружает манифест и, если версия сменилась, список отделов снимка
+  const loadSnapshot = async () => {
+    const { data: manifest } = await getSnapshotManifest()
+    if (!manifest || !manifest.views) throw new Error('Снимок справочника не опубликован')
+    if (!snapshotRef.current || snapshotRef.current.manifest.version !== manifest.version) {
+      const { data } = await getSnapshotFile(manifest.departments)
+      snapshotRef.current = {
+        manifest,
+        departments: new Map(data.departments.map((department) => [department.name, department])),
+      }
+    }
+    const names = [...snapshotRef.current.departments.keys()]
+    setDepartments(names)
+    departmentsRef.current = names
+    return snapshotRef.current
+  }
+
+  // Страницы снимка для текущих фильтров или null, если такой сортировки в снимке нет
+  const snapshotView = (snapshot) => {
+    if (selectedDepartment) {
+      if (orderBy !== 'full_name') return null
+      return snapshot.departments.get(selectedDepartment) || { path: null, employee_count: 0 }
+    }
+    return snapshot.manifest.views[orderBy] || null
+  }
+
+  const showSnapshotPage = async (snapshot, view) => {
+    // Обратный порядок у API - точное обращение прямого (значение, id), поэтому
+    // страница по убыванию собирается из тех же файлов с конца
+    const { page_size: pageSize, columns } = snapshot.manifest
+    const count = view.employee_count
+    const offset = page * rowsPerPage
+    const end = Math.min(offset + rowsPerPage, count)
+    const [from, to] = order === 'asc' ? [offset, end] : [count - end, count - offset]
+    const numbers = []
+    for (let number = Math.floor(from / pageSize); number * pageSize < to; number += 1) {
+      numbers.push(number)
+    }
+    const pages = await Promise.all(numbers.map((number) => getSnapshotFile(`${view.path}/${number}.json`)))
+    const rows = pages.flatMap((response) => response.data)
+      .slice(from - numbers[0] * pageSize, to - numbers[0] * pageSize)
+    if (order !== 'asc') rows.reverse()
+    setEmployees(rows.map((row) => Object.fromEntries(columns.map((column, i) => [column, row[i]]))))
+    setTotal(count)
+  }
+
+  // Проверяет манифест после событий; пока снимок не догнал события - повторяет позже
+  const refreshSnapshot = async (attempt = 0) => {
+    clearTimeout(snapshotTimerRef.current)
+    try {
+      const { data: manifest } = await getSnapshotManifest()
+      if (manifest.change_seq !== null && manifest.change_seq < pendingSeqRef.current &&
+          attempt < SNAPSHOT_MAX_RETRIES) {
+        snapshotTimerRef.current = setTimeout(() => refreshSnapshot(attempt + 1), SNAPSHOT_RETRY_MS)
+      }
+      if (!snapshotRef.current || manifest.version !== snapshotRef.current.manifest.version) {
+        setReloadKey((key) => key + 1)
+      }
+    } catch (error) {
+      console.error('Ошибка загрузки снимка справочника:', error)
+    }
+  }
+
+  // Применяет к открытой странице только изменения с прошлой загрузки
+  const applyChanges = async () => {
+    if (snapshotActiveRef.current) {
+      refreshSnapshot()
+      return
+    }
+    if (changeSeqRef.current === null) {
+      setReloadKey((key) => key + 1)
+      return
+    }
+    try {
+      const response = await getEmployeeChanges(changeSeqRef.current, { fields: TABLE_FIELDS })
+      const { changes, last_seq: lastSeq, has_more: hasMore } = response.data
+      // Новые сотрудники могут попасть на любую страницу, а изменений слишком много -
+      // в этих случаях перезагружается только текущая страница
+      if (hasMore || changes.some((change) => change.op === 'insert')) {
+        setReloadKey((key) => key + 1)
+        return
+      }
+      changeSeqRef.current = lastSeq
+      if (changes.length === 0) return
+
+      const { department, unfiltered } = filtersRef.current
+      const byId = new Map(changes.map((change) => [change.id, change]))
+      let removed = 0
+      const updated = employeesRef.current.flatMap((employee) => {
+        const change = byId.get(employee.id)
+        if (!change) return [employee]
+        // Удален или переведен из отдела, выбранного в фильтре
+        if (change.op === 'delete' || (department && change.employee.department !== department)) {
+          removed += 1
+          return []
+        }
+        return [{ ...employee, ...change.employee }]
+      })
+      setEmployees(updated)
+      // Без фильтров любое удаление уменьшает общее число, с фильтрами - только видимые
+      const deleted = changes.filter((change) => change.op === 'delete').length
+      setTotal((value) => Math.max(0, value - (unfiltered ? deleted : removed)))
+
+      const known = new Set(departmentsRef.current)
+      if (changes.some((change) => change.employee && change.employee.department &&
+                                   !known.has(change.employee.department))) {
+        loadDepartments()
+      }
+    } catch (error) {
+      console.error('Ошибка загрузки изменений:', error)
+      setReloadKey((key) => key + 1)
+    }
+  }
 
   useEffect(() => {
-    loadEmployees()
-    loadDepartments()
+    // В публичном просмотре отделы приходят вместе со снимком
+    if (!usesSnapshot) loadDepartments()
     
     // Слушаем события обновления
     const handleEmployeesUpdated = () => {
-      loadEmployees()
-      loadDepartments()
+      applyChanges()
     }
     
     window.addEventListener('employeesUpdated', handleEmployeesUpdated)
+
+    // Изменения от других пользователей и импорта приходят с сервера; пачка
+    // событий (например, при импорте) применяется одним запросом
+    let source = null
+    let timer = null
+    const handleChange = (event) => {
+      const { seq } = JSON.parse(event.data)
+      pendingSeqRef.current = Math.max(pendingSeqRef.current, seq)
+      clearTimeout(timer)
+      timer = setTimeout(applyChanges, EVENTS_DEBOUNCE_MS)
+    }
+    const handleReset = () => {
+      // Сервер не может догнать клиента: перечитываем страницу и подписываемся заново,
+      // без Last-Event-ID
+      source.close()
+      setReloadKey((key) => key + 1)
+      connect()
+    }
+    const connect = () => {
+      if (typeof EventSource === 'undefined') return
+      source = subscribeEvents()
+      source.addEventListener('change', handleChange)
+      source.addEventListener('reset', handleReset)
+    }
+    connect()
+
     return () => {
       window.removeEventListener('employeesUpdated', handleEmployeesUpdated)
+      clearTimeout(timer)
+      clearTimeout(snapshotTimerRef.current)
+      if (source) source.close()
     }
   }, [])
 
+  useEffect(() => {
+    loadEmployees()
+  }, [page, rowsPerPage, orderBy, order, reloadKey])
+
   const loadEmployees = async () => {
     setLoading(true)
     try {
-      const params = {}
+      // Поиск и сортировки, которых нет в снимке, идут через API, просмотр - по снимку
+      snapshotActiveRef.current = false
+      if (!searchTerm && !snapshotFailedRef.current) {
+        try {
+          const snapshot = await loadSnapshot()
+          const view = snapshotView(snapshot)
+          if (view) {
+            await showSnapshotPage(snapshot, view)
+            snapshotActiveRef.current = true
+            return
+          }
+        } catch (error) {
+          // Снимки не публикуются (например, сервер разработки) - дальше только через API
+          console.warn('Снимок справочника недоступен, данные загружаются через API:', error)
+          snapshotFailedRef.current = true
+          loadDepartments()
+        }
+      }
+      const params = {
+        sort: orderBy,
+        order,
+        limit: rowsPerPage,
+        fields: TABLE_FIELDS,
+      }
       if (searchTerm) params.search = searchTerm
       if (selectedDepartment) params.department = selectedDepartment
+      if (cursors[page]) params.cursor = cursors[page]
       
       const response = await getEmployees(params)
       setEmployees(response.data)
+      setTotal(Number(response.headers['x-total-count'] || response.data.length))
+      const changeSeq = response.headers['x-change-seq']
+      changeSeqRef.current = changeSeq === undefined ? null : Number(changeSeq)
+      filtersRef.current = {
+        department: selectedDepartment,
+        unfiltered: !searchTerm && !selectedDepartment,
+      }
+      
+      const nextCursor = response.headers['x-next-cursor']
+      setCursors((prev) => {
+        const updated = prev.slice(0, page + 1)
+        if (nextCursor) updated.push(nextCursor)
+        return updated
+      })
     } catch (error) {
       console.error('Ошибка загрузки сотрудников:', error)
     } finally {
@@ -69,19 +292,85 @@ const EmployeeTable = ({ onEdit, onDelete, onPhotoUpload }) => {
     try {
       const response = await getDepartments()
       setDepartments(response.data)
+      departmentsRef.current = response.data
     } catch (error) {
       console.error('Ошибка загрузки отделов:', error)
     }
   }
 
+  // Смена фильтров или сортировки начинает просмотр с первой страницы
+  const resetPaging = () => {
+    setCursors([null])
+    setPage(0)
+    setReloadKey((key) => key + 1)
+  }
+
   const handleSearch = () => {
-    loadEmployees()
+    resetPaging()
+  }
+
+  // Подсказки запрашиваются на каждое изменение строки, после короткой паузы;
+  // ответ на устаревший запрос не показывается
+  useEffect(() => {
+    const query = searchTerm.trim()
+    if (!query) {
+      setSuggestions([])
+      return
+    }
+    let cancelled = false
+    const timer = setTimeout(async () => {
+      try {
+        const response = await getSuggestions(query)
+        if (!cancelled) setSuggestions(response.data.suggestions)
+      } catch (error) {
+        console.error('Ошибка загрузки подсказок:', error)
+      }
+    }, SUGGEST_DEBOUNCE_MS)
+    return () => {
+      cancelled = true
+      clearTimeout(timer)
+    }
+  }, [searchTerm])
+
+  const suggestionLabel = (option) =>
+    typeof option === 'string' ? option : option.full_name || option.value
+
+  // Выбор подсказки сразу применяет фильтр: отдел - в список отделов, остальное - в поиск
+  const handleSuggestionSelect = (event, option) => {
+    if (!option) return
+    if (typeof option === 'string') {
+      handleSearch()
+      return
+    }
+    if (option.type === 'department') {
+      setSelectedDepartment(option.value)
+      setSearchTerm('')
+    } else {
+      setSearchTerm(suggestionLabel(option))
+    }
+    resetPaging()
+  }
+
+  const handlePageChange = (event, newPage) => {
+    // Страницы снимка доступны все, страницы API - только по полученным курсорам
+    if (newPage > page && !cursors[newPage] && !snapshotActiveRef.current) return
+    setPage(newPage)
+  }
+
+  const handleRowsPerPageChange = (event) => {
+    setRowsPerPage(parseInt(event.target.value, 10))
+    setCursors([null])
+    setPage(0)
   }
 
   const handleExportPDF = async () => {
     try {
       console.log('Начало экспорта PDF...')
-      const response = await exportPDF()
+      // Экспортируем с теми же фильтрами, что и в таблице
+      const params = {}
+      if (searchTerm) params.search = searchTerm
+      if (selectedDepartment) params.department = selectedDepartment
+      const response = await exportPDF(params)
       console.log('PDF получен, размер:', response.data.size)
       
       // Создаем blob из данных
@@ -108,20 +397,22 @@ const EmployeeTable = ({ onEdit, onDelete, onPhotoUpload }) => {
     }
   }
 
+  // Ссылка на потоковую выгрузку с теми же фильтрами, что и в таблице
+  const exportHref = (format) => {
+    const params = {}
+    if (searchTerm) params.search = searchTerm
+    if (selectedDepartment) params.department = selectedDepartment
+    return exportUrl(format, params)
+  }
+
   const handleSort = (property) => {
     const isAsc = orderBy === property && order === 'asc'
     setOrder(isAsc ? 'desc' : 'asc')
     setOrderBy(property)
+    setCursors([null])
+    setPage(0)
   }
 
-  const sortedEmployees = [...employees].sort((a, b) => {
-    if (order === 'asc') {
-      return a[orderBy]?.localeCompare(b[orderBy]) || 0
-    } else {
-      return b[orderBy]?.localeCompare(a[orderBy]) || 0
-    }
-  })
-
   const columns = [
     { id: 'department', label: 'Отдел' },
     { id: 'full_name', label: 'ФИО' },
@@ -140,17 +431,40 @@ const EmployeeTable = ({ onEdit, onDelete, onPhotoUpload }) => {
   return (
     <Box>
       <Box sx={{ mb: 3, display: 'flex', gap: 2, alignItems: 'center', flexWrap: 'wrap' }}>
-        <TextField
-          label="Поиск..."
-          variant="outlined"
-          size="small"
-          value={searchTerm}
-          onChange={(e) => setSearchTerm(e.target.value)}
-          onKeyPress={(e) => e.key === 'Enter' && handleSearch()}
-          sx={{ minWidth: 200 }}
-          InputProps={{
-            endAdornment: <Search />
-          }}
+        <Autocomplete
+          freeSolo
+          options={suggestions}
+          filterOptions={(options) => options}
+          getOptionLabel={suggestionLabel}
+          inputValue={searchTerm}
+          onInputChange={(event, value, reason) => reason !== 'reset' && setSearchTerm(value)}
+          onChange={handleSuggestionSelect}
+          isOptionEqualToValue={(option, value) => suggestionLabel(option) === suggestionLabel(value)}
+          renderOption={(props, option) => (
+            <li {...props} key={`${option.type}-${option.id || option.value}`}>
+              <Box>
+                <Typography variant="body2">{suggestionLabel(option)}</Typography>
+                <Typography variant="caption" color="text.secondary">
+                  {option.type === 'employee'
+                    ? [option.position, option.department].filter(Boolean).join(', ')
+                    : `${SUGGESTION_LABELS[option.type]}, сотрудников: ${option.employee_count}`}
+                </Typography>
+              </Box>
+            </li>
+          )}
+          sx={{ minWidth: 300 }}
+          renderInput={(params) => (
+            <TextField
+              {...params}
+              label="Поиск..."
+              variant="outlined"
+              size="small"
+              InputProps={{
+                ...params.InputProps,
+                endAdornment: <Search />
+              }}
+            />
+          )}
         />
         
         <FormControl size="small" sx={{ minWidth: 200 }}>
@@ -183,8 +497,14 @@ const EmployeeTable = ({ onEdit, onDelete, onPhotoUpload }) => {
           Экспорт PDF
         </Button>
 
+        {[['csv', 'CSV'], ['xlsx', 'Excel'], ['vcard', 'vCard']].map(([format, label]) => (
+          <Button key={format} variant="outlined" startIcon={<Download />} href={exportHref(format)}>
+            {label}
+          </Button>
+        ))}
+
         <Typography variant="body2" color="text.secondary">
-          Найдено: {employees.length} сотрудников
+          Найдено: {total} сотрудников
         </Typography>
       </Box>
 
@@ -194,19 +514,21 @@ const EmployeeTable = ({ onEdit, onDelete, onPhotoUpload }) => {
             <TableRow>
               {columns.map((column) => (
                 <TableCell key={column.id}>
-                  <TableSortLabel
-                    active={orderBy === column.id}
-                    direction={orderBy === column.id ? order : 'asc'}
-                    onClick={() => handleSort(column.id)}
-                  >
-                    {column.label}
-                  </TableSortLabel>
+                  {column.id === 'actions' ? column.label : (
+                    <TableSortLabel
+                      active={orderBy === column.id}
+                      direction={orderBy === column.id ? order : 'asc'}
+                      onClick={() => handleSort(column.id)}
+                    >
+                      {column.label}
+                    </TableSortLabel>
+                  )}
                 </TableCell>
               ))}
             </TableRow>
           </TableHead>
           <TableBody>
-            {sortedEmployees.map((employee) => (
+            {employees.map((employee) => (
               <TableRow key={employee.id} hover>
                 <TableCell>
                   <Chip 
@@ -220,7 +542,8 @@ const EmployeeTable = ({ onEdit, onDelete, onPhotoUpload }) => {
                   <Box sx={{ display: 'flex', alignItems: 'center', gap: 1 }}>
                     {employee.photo && (
                       <Avatar 
-                        src={`/api/uploads/photos/${employee.photo}`} 
+                        src={`/api/uploads/photos/${employee.photo}?size=64`} 
+                        imgProps={{ loading: 'lazy' }}
                         sx={{ width: 32, height: 32 }}
                       />
                     )}
@@ -271,6 +594,17 @@ const EmployeeTable = ({ onEdit, onDelete, onPhotoUpload }) => {
             ))}
           </TableBody>
         </Table>
+        <TablePagination
+          component="div"
+          count={total}
+          page={page}
+          onPageChange={handlePageChange}
+          rowsPerPage={rowsPerPage}
+          onRowsPerPageChange={handleRowsPerPageChange}
+          rowsPerPageOptions={[25, 50, 100, 200]}
+          labelRowsPerPage="Строк на странице:"
+          labelDisplayedRows={({ from, to, count }) => `${from}–${to} из ${count}`}
+        />
       </TableContainer>
 
       {employees.length === 0 && !loading && (
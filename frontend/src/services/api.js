@@ -12,14 +12,32 @@ export const login = (credentials) => api.post('/login', credentials)
 export const logout = () => api.post('/logout')
 export const checkAuth = () => api.get('/check_auth')
 
+// Токены API для скриптов и сервисов: токен есть только в ответе createToken
+export const getTokens = () => api.get('/tokens')
+export const createToken = (name, expiresInDays) =>
+  api.post('/tokens', { name, expires_in_days: expiresInDays })
+export const revokeToken = (id) => api.delete(`/tokens/${id}`)
+
 // Сотрудники
 export const getEmployees = (params = {}) => api.get('/employees', { params })
 export const createEmployee = (data) => api.post('/employees', data)
 export const updateEmployee = (id, data) => api.put(`/employees/${id}`, data)
 export const deleteEmployee = (id) => api.delete(`/employees/${id}`)
+// Пакет операций: [{ op: 'create' | 'update' | 'delete', id, data }]
+export const batchEmployees = (operations) => api.post('/employees/batch', { operations })
+export const getEmployeeChanges = (since, params = {}) =>
+  api.get('/employees/changes', { params: { since, ...params } })
 
 // Отделы
-export const getDepartments = () => api.get('/departments')
+// { with_counts: 1 } - отделы с численностью: [{ id, name, employee_count }]
+export const getDepartments = (params = {}) => api.get('/departments', { params })
+
+// Подсказки для строки поиска: сотрудники, отделы и должности
+export const getSuggestions = (q, limit = 10) => api.get('/suggest', { params: { q, limit } })
+
+// Статический снимок справочника: файлы раздает nginx, без обращения к backend
+export const getSnapshotManifest = () => axios.get('/snapshots/manifest.json')
+export const getSnapshotFile = (name) => axios.get(`/snapshots/${name}`)
 
 // Загрузка фото
 export const uploadPhoto = (employeeId, file) => {
@@ -33,9 +51,11 @@ export const uploadPhoto = (employeeId, file) => {
 }
 
 // Импорт
-export const importData = (file) => {
+export const importData = (file, options = {}) => {
   const formData = new FormData()
   formData.append('file', file)
+  if (options.mode) formData.append('mode', options.mode)
+  if (options.key) formData.append('key', options.key)
   return api.post('/import', formData, {
     headers: {
       'Content-Type': 'multipart/form-data',
@@ -43,7 +63,31 @@ export const importData = (file) => {
   })
 }
 
+// Архив фото: файлы с именами по id, email или ФИО сотрудника; ход - через getImportJob
+export const importPhotos = (file) => {
+  const formData = new FormData()
+  formData.append('file', file)
+  return api.post('/import/photos', formData, {
+    headers: {
+      'Content-Type': 'multipart/form-data',
+    },
+  })
+}
+
+export const getImportJob = (jobId) => api.get(`/import/${jobId}`)
+export const cancelImportJob = (jobId) => api.delete(`/import/${jobId}`)
+
+// Уведомления об изменениях (Server-Sent Events)
+export const subscribeEvents = () =>
+  new EventSource(`${API_BASE_URL}/events`, { withCredentials: true })
+
 // Экспорт
-export const exportPDF = () => api.get('/export/pdf', { responseType: 'blob' })
+export const exportPDF = (params = {}) => api.get('/export/pdf', { params, responseType: 'blob' })
+// CSV, XLSX и vCard отдаются потоком: скачивание идет по ссылке, браузер пишет файл на диск
+// по мере получения, а не собирает его в памяти
+export const exportUrl = (format, params = {}) => {
+  const query = new URLSearchParams(params).toString()
+  return `${API_BASE_URL}/export/${format}${query ? `?${query}` : ''}`
+}
 
 export default api